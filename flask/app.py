@@ -1,123 +1,340 @@
 import base64
+import json
+import logging
 import os
-import cv2
-import re
+import sys
+import threading
 import numpy as np
-import requests
 import time
-from flask import Flask, request, jsonify, render_template
+from collections import OrderedDict
+from flask import Flask, Response, request, jsonify, render_template
+from flask_sock import Sock
+from requests.exceptions import RequestException
+
+# Shared pipeline modules live in src/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from frame_encoder import decode_jpeg, decode_preview, encode_frame, encode_image_bytes, jpeg_dimensions
+from frame_governor import FRAME_GOVERNOR, FrameRateGovernor
+from metrics import CONTENT_TYPE, observe_stage, render, timed, trace
+from motion_roi import MOTION_ROI, MOTION_THUMBNAIL_WIDTH, MotionROI, crop_motion
+from rate_limiter import RATE_LIMIT_DEADLINE, RateLimitTimeout
+from request_body import RequestBody, build_body
+from response_cache import ResponseCache, cache_key
+from single_flight import SingleFlight
+from upstream_pool import UpstreamUnavailable, get_pool
 
 app = Flask(__name__)
+sock = Sock(app)
 
-API_URL = "https://api.openai.com/v1/chat/completions"
 API_KEY = os.getenv("OPENAI_API_KEY")
+MODEL = "gpt-4-vision-preview"
+MAX_TOKENS = 2300
+MAX_MOTION_STREAMS = 64
+MAX_GOVERNED_STREAMS = 64
+# Bounds of the capture interval the frame-rate governor suggests to the browser
+REFRESH_MIN_SECONDS = float(os.getenv("REFRESH_MIN_SECONDS", 2))
+REFRESH_MAX_SECONDS = float(os.getenv("REFRESH_MAX_SECONDS", 60))
+REFRESH_DEFAULT_SECONDS = 15
+
+response_cache = ResponseCache()
+in_flight = SingleFlight("flask")
+motion_models = OrderedDict()
+stream_models_lock = threading.Lock()
+governors = OrderedDict()
+
+# Function to get a per-stream model from a bounded LRU dict, creating it on first
+# use. Request handlers run on threads, so lookup, eviction and insert share a lock
+def stream_model(models: OrderedDict, stream: str, create, limit: int):
+    with stream_models_lock:
+        model = models.get(stream)
+        if model is None:
+            if len(models) >= limit:
+                models.popitem(last=False)
+            model = models[stream] = create()
+        else:
+            models.move_to_end(stream)
+        return model
+
+# Function to find the moving region of a browser frame from its 1/8-scale preview.
+# Each client (its "stream_id" field, or its address) keeps its own background model.
+def motion_region(stream: str, preview: np.ndarray, image_bytes: bytes):
+    if not MOTION_ROI:
+        return None
+    dimensions = jpeg_dimensions(image_bytes)
+    if dimensions is None:
+        return None
+    model = stream_model(motion_models, stream, MotionROI, MAX_MOTION_STREAMS)
+    return model.update_preview(preview, *dimensions)
+
+# Function to create a frame-rate governor for a browser stream. All browser
+# streams share one metrics label so departed clients do not pile up as series
+def create_governor():
+    if not FRAME_GOVERNOR:
+        return None
+    return FrameRateGovernor(1 / REFRESH_DEFAULT_SECONDS, "browser", min_fps=1 / REFRESH_MAX_SECONDS,
+                             max_fps=1 / REFRESH_MIN_SECONDS, headroom=get_pool().headroom)
 
-def preprocess_image(image: np.ndarray) -> np.ndarray:
-    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-
-def encode_image_to_base64(image: np.ndarray) -> str:
-    success, buffer = cv2.imencode('.jpg', image)
-    if not success:
-        raise ValueError("Could not encode image to JPEG format.")
-    encoded_image = base64.b64encode(buffer).decode('utf-8')
-    return encoded_image
-
-def compose_payload(image_base64: str, prompt: str) -> dict:
-    return {
-        "model": "gpt-4-vision-preview",
-        "messages": [
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": (
-                            f"You are an expert in analyzing visual content. Please analyze the provided image for the following details:\n"
-                            f"1. Identify any text present in the image and provide a summary.\n"
-                            f"2. Describe the main objects and their arrangement.\n"
-                            f"3. Identify the context of the video frame (e.g., work environment, outdoor scene).\n"
-                            f"4. Provide any notable observations about lighting, colors, and overall composition.\n"
-                            f"4. Format using markdown.\n"
-                            f"Here is the Video Frame still:\n{prompt}"
-                        )
-                    },
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/jpeg;base64,{image_base64}"
-                        }
-                    }
-                ]
-            }
-        ],
-        "max_tokens": 2300
-    }
-
-def compose_headers(api_key: str) -> dict:
-    return {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {api_key}"
-    }
-
-def prompt_image(image_base64: str, prompt: str, api_key: str) -> str:
-    headers = compose_headers(api_key=api_key)
-    payload = compose_payload(image_base64=image_base64, prompt=prompt)
+# Function to get the governor of an HTTP client, which has no connection to hang it on
+def refresh_governor(stream: str):
+    if not FRAME_GOVERNOR:
+        return None
+    return stream_model(governors, stream, create_governor, MAX_GOVERNED_STREAMS)
+
+# Function to add the suggested capture interval to a JSON result
+def with_refresh_hint(result: dict, governor) -> dict:
+    if governor is not None:
+        result['refresh_interval'] = round(1 / governor.fps, 1)
+    return result
+
+# Function to encode the frame for upload, cropped to the motion region if there is one
+def encode_upload(image_data: str, image_bytes: bytes, roi=None):
+    if roi is not None and MOTION_THUMBNAIL_WIDTH:
+        return encode_frame(crop_motion(decode_jpeg(image_bytes), roi))
+    # Browser JPEGs within budget are forwarded as-is; others are decoded and re-encoded
+    return encode_image_bytes(image_bytes, base64_data=image_data, roi=roi)
+
+def compose_payload(image_base64, prompt: str, stream: bool = False) -> RequestBody:
+    text = (
+        f"You are an expert in analyzing visual content. Please analyze the provided image for the following details:\n"
+        f"1. Identify any text present in the image and provide a summary.\n"
+        f"2. Describe the main objects and their arrangement.\n"
+        f"3. Identify the context of the video frame (e.g., work environment, outdoor scene).\n"
+        f"4. Provide any notable observations about lighting, colors, and overall composition.\n"
+        f"4. Format using markdown.\n"
+        f"Here is the Video Frame still:\n{prompt}"
+    )
+    return build_body(MODEL, text, [image_base64], MAX_TOKENS, stream=stream)
+
+def prompt_image(image_base64, prompt: str, api_key: str, image_tokens: int = 0) -> str:
+    with timed('serialize'):
+        body = compose_payload(image_base64=image_base64, prompt=prompt)
+    pool = get_pool()
+    deadline = time.time() + RATE_LIMIT_DEADLINE
 
     while True:
-        response = requests.post(url=API_URL, headers=headers, json=payload)
+        # The pool queues on each upstream's budget until the deadline and fails over on errors
+        started = time.perf_counter()
+        response = pool.post(body, api_key, tokens=image_tokens, deadline=deadline)
+        observe_stage('api', time.perf_counter() - started)
         if response.status_code == 200:
             response_json = response.json()
             if 'error' in response_json:
                 raise ValueError(response_json['error']['message'])
             return response_json['choices'][0]['message']['content']
         elif response.status_code == 429:
-            response_json = response.json()
-            error_message = response_json.get('error', {}).get('message', '')
-            wait_time = parse_wait_time(error_message)
-            if wait_time:
-                print(f"Rate limit exceeded. Waiting for {wait_time} seconds.")
-                time.sleep(wait_time)
-            else:
-                raise ValueError(f"Rate limit exceeded but could not parse wait time from message: {error_message}")
+            # Every upstream is throttled and has been backed off; retry once one has budget again
+            logging.warning("Rate limit exceeded on every upstream. Waiting for budget.")
         else:
             raise ValueError(f"API request failed with status code {response.status_code}: {response.text}")
 
-def parse_wait_time(error_message: str) -> int:
-    match = re.search(r"try again in (\d+m)?(\d+\.\ds)?", error_message)
-    if match:
-        minutes = match.group(1)
-        seconds = match.group(2)
+# Generator yielding response text deltas as the API streams them back
+def stream_prompt_image(image_base64, prompt: str, api_key: str, image_tokens: int = 0):
+    with timed('serialize'):
+        body = compose_payload(image_base64=image_base64, prompt=prompt, stream=True)
+    pool = get_pool()
+    deadline = time.time() + RATE_LIMIT_DEADLINE
 
-        total_wait_time = 0
-        if minutes:
-            total_wait_time += int(minutes[:-1]) * 60  # Convert minutes to seconds
-        if seconds:
-            total_wait_time += float(seconds[:-1])  # Add seconds
+    while True:
+        started = time.perf_counter()
+        response = pool.post(body, api_key, tokens=image_tokens, stream=True, deadline=deadline)
+        observe_stage('api', time.perf_counter() - started)
+        if response.status_code == 429:
+            response.close()
+            continue
+        if response.status_code != 200:
+            raise ValueError(f"API request failed with status code {response.status_code}: {response.text}")
+        break
 
-        return int(total_wait_time)
-    return None
+    # SSE is UTF-8 by definition; without a charset requests would assume ISO-8859-1
+    response.encoding = 'utf-8'
+    with response:
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith('data: '):
+                continue
+            data = line[len('data: '):]
+            if data == '[DONE]':
+                break
+            choices = json.loads(data).get('choices') or [{}]
+            delta = choices[0].get('delta', {}).get('content')
+            if delta:
+                yield delta
+
+def sse_event(data: dict, event: str = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/process_frame', methods=['POST'])
-def process_frame():
-    data = request.json
+# Function to decode a /process_frame request body into image bytes, prompt and key.
+# The base64 text is later spliced into the API request body unescaped, so
+# anything outside the base64 alphabet is rejected rather than silently skipped
+def read_frame_request(data: dict):
     image_data = data['image'].split(',')[1]
-    image = np.frombuffer(base64.b64decode(image_data), dtype=np.uint8)
-    image = cv2.imdecode(image, cv2.IMREAD_COLOR)
-    processed_image = preprocess_image(image)
-    image_base64 = encode_image_to_base64(processed_image)
+    try:
+        image_bytes = base64.b64decode(image_data, validate=True)
+    except ValueError:
+        raise ValueError('Image is not valid base64.')
     prompt = data.get('prompt', "Analyze this frame")
     api_key = data.get('api_key') or API_KEY
+    return image_data, image_bytes, prompt, api_key
+
+@app.route('/process_frame', methods=['POST'])
+def process_frame():
+    with trace(request.headers.get('X-Trace-Id')) as current_trace:
+        result = analyze_frame(request.json)
+    if current_trace is not None:
+        result[0].headers['X-Trace-Id'] = current_trace.trace_id
+    return result
+
+def analyze_frame(data: dict):
+    try:
+        image_data, image_bytes, prompt, api_key = read_frame_request(data)
+    except ValueError as e:
+        return jsonify({'response': str(e)}), 400
     if not api_key:
         return jsonify({'response': 'API key is required.'}), 400
     try:
-        response = prompt_image(image_base64, prompt, api_key)
+        preview = decode_preview(image_bytes)
+    except ValueError as e:
+        return jsonify({'response': str(e)}), 400
+    stream = data.get('stream_id') or request.remote_addr
+    roi = motion_region(stream, preview, image_bytes)
+    governor = refresh_governor(stream)
+    key = cache_key(preview, prompt, MODEL, MAX_TOKENS)
+    cached_response = response_cache.get(key)
+    if governor:
+        # A cache hit means the scene has not changed since an earlier frame
+        governor.observe(cached_response is None)
+    if cached_response is not None:
+        return jsonify(with_refresh_hint({'response': cached_response, 'cached': True}, governor)), 200
+    try:
+        # Concurrent requests for the same scene and prompt share one upstream call
+        response = in_flight.do(key, analyze_uncached, key, image_data, image_bytes, prompt, api_key, roi, governor)
+    except RateLimitTimeout as e:
+        return jsonify(with_refresh_hint({'response': str(e)}, governor)), 429
+    except UpstreamUnavailable as e:
+        return jsonify(with_refresh_hint({'response': str(e)}, governor)), 503
+    except RequestException as e:
+        # Every upstream failed at the network level; the last error comes back
+        return jsonify(with_refresh_hint({'response': f"Vision API unreachable: {e}"}, governor)), 502
     except ValueError as e:
         response = str(e)
-    return jsonify({'response': response})
+    return jsonify(with_refresh_hint({'response': response}, governor)), 200
+
+def analyze_uncached(key: str, image_data: str, image_bytes: bytes, prompt: str, api_key: str, roi=None,
+                     governor=None) -> str:
+    encoded = encode_upload(image_data, image_bytes, roi)
+    started = time.perf_counter()
+    response = prompt_image(encoded.base64_bytes, prompt, api_key, image_tokens=encoded.estimated_tokens)
+    if governor:
+        # The completion's usage is not returned here, so count about 4 characters per token
+        governor.record(time.perf_counter() - started, encoded.estimated_tokens + len(response) // 4)
+    response_cache.set(key, response)
+    return response
+
+# Same as /process_frame, but relays tokens as Server-Sent Events while they arrive
+@app.route('/process_frame_stream', methods=['POST'])
+def process_frame_stream():
+    try:
+        image_data, image_bytes, prompt, api_key = read_frame_request(request.json)
+    except ValueError as e:
+        return jsonify({'response': str(e)}), 400
+    if not api_key:
+        return jsonify({'response': 'API key is required.'}), 400
+    try:
+        key = cache_key(decode_preview(image_bytes), prompt, MODEL, MAX_TOKENS)
+    except ValueError as e:
+        return jsonify({'response': str(e)}), 400
+    governor = refresh_governor(request.json.get('stream_id') or request.remote_addr)
+
+    def generate():
+        cached_response = response_cache.get(key)
+        if governor:
+            governor.observe(cached_response is None)
+        if cached_response is not None:
+            yield sse_event({'delta': cached_response, 'cached': True})
+            yield sse_event(with_refresh_hint({}, governor), event='done')
+            return
+        parts = []
+        started = time.perf_counter()
+        try:
+            # Inside the try: headers are already sent, so a bad upload must end as an error event
+            encoded = encode_image_bytes(image_bytes, base64_data=image_data)
+            for delta in stream_prompt_image(encoded.base64_bytes, prompt, api_key, image_tokens=encoded.estimated_tokens):
+                parts.append(delta)
+                yield sse_event({'delta': delta})
+        except (RateLimitTimeout, UpstreamUnavailable, RequestException, ValueError) as e:
+            yield sse_event({'error': str(e)}, event='error')
+            return
+        response = ''.join(parts)
+        if governor:
+            governor.record(time.perf_counter() - started, encoded.estimated_tokens + len(response) // 4)
+        response_cache.set(key, response)
+        yield sse_event(with_refresh_hint({}, governor), event='done')
+
+    return Response(generate(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# Function to split a binary socket message: 4-byte big-endian header length,
+# UTF-8 JSON header ({"seq", "prompt", "api_key", "stream"}), then the raw JPEG
+def parse_socket_message(message: bytes):
+    if len(message) < 4:
+        raise ValueError("Message too short.")
+    header_length = int.from_bytes(message[:4], 'big')
+    header = json.loads(message[4:4 + header_length].decode('utf-8'))
+    return header, message[4 + header_length:]
+
+# Persistent alternative to /process_frame: the browser sends raw JPEG frames
+# and results (or streamed deltas) come back as JSON text on the same socket
+@sock.route('/ws/process_frame')
+def process_frame_socket(ws):
+    governor = create_governor()
+    while True:
+        message = ws.receive()
+        if not isinstance(message, bytes):
+            continue
+        seq = None
+        try:
+            header, image_bytes = parse_socket_message(message)
+            seq = header.get('seq')
+            prompt = header.get('prompt') or "Analyze this frame"
+            api_key = header.get('api_key') or API_KEY
+            if not api_key:
+                raise ValueError('API key is required.')
+            key = cache_key(decode_preview(image_bytes), prompt, MODEL, MAX_TOKENS)
+            cached_response = response_cache.get(key)
+            if governor:
+                governor.observe(cached_response is None)
+            if cached_response is not None:
+                ws.send(json.dumps(with_refresh_hint({'seq': seq, 'response': cached_response, 'cached': True},
+                                                     governor)))
+                continue
+            if header.get('stream'):
+                encoded = encode_image_bytes(image_bytes)
+                parts = []
+                started = time.perf_counter()
+                for delta in stream_prompt_image(encoded.base64_bytes, prompt, api_key, image_tokens=encoded.estimated_tokens):
+                    parts.append(delta)
+                    ws.send(json.dumps({'seq': seq, 'delta': delta}))
+                response = ''.join(parts)
+                if governor:
+                    governor.record(time.perf_counter() - started, encoded.estimated_tokens + len(response) // 4)
+                response_cache.set(key, response)
+            else:
+                response = in_flight.do(key, analyze_uncached, key, None, image_bytes, prompt, api_key, None, governor)
+            ws.send(json.dumps(with_refresh_hint({'seq': seq, 'response': response}, governor)))
+        except (RateLimitTimeout, UpstreamUnavailable, RequestException, ValueError) as e:
+            ws.send(json.dumps({'seq': seq, 'error': str(e)}))
+
+@app.route('/cache_stats')
+def cache_stats():
+    return jsonify({**response_cache.stats(), 'in_flight': in_flight.stats(), 'upstreams': get_pool().stats()})
+
+# Per-stage latency histograms in the Prometheus text format
+@app.route('/metrics')
+def metrics():
+    return Response(render(), content_type=CONTENT_TYPE)
 
 if __name__ == '__main__':
     if API_KEY is None:
@@ -9,6 +9,10 @@ let captureInterval;
 let refreshRate = 15;
 let customPrompt = "Analyze this frame";
 let apiKey = "";
+let streamResponses = true;
+let frameSocket = null;
+let frameSeq = 0;
+let socketText = "";
 let activeStream = null;
 let isProcessing = false; // Flag to track if processing is in progress
 
@@ -99,6 +103,7 @@ saveSettingsButton.addEventListener('click', () => {
     customPrompt = document.getElementById('customPrompt').value || "Analyze this frame";
     refreshRate = document.getElementById('refreshRate').value || 15;
     apiKey = document.getElementById('apiKey').value || "";
+    streamResponses = document.getElementById('streamResponses').checked;
     settingsPanel.style.display = 'none';
     logMessage("Settings saved.");
 });
@@ -110,6 +115,7 @@ startCaptureButton.addEventListener('click', () => {
     }
     isProcessing = true; // Set the flag to indicate processing is in progress
 
+    openFrameSocket();
     captureFrame(); // Capture the first frame immediately
     captureInterval = setInterval(captureFrame, refreshRate * 1000); // Capture every `refreshRate` seconds
     logMessage("Capture started.");
@@ -126,35 +132,163 @@ stopCaptureButton.addEventListener('click', () => {
 
     clearInterval(captureInterval);
     captureInterval = null;
+    if (frameSocket) {
+        frameSocket.close();
+        frameSocket = null;
+    }
     logMessage("Capture stopped.");
 
     isProcessing = false; // Reset the flag after processing is complete
 });
 
+// Follow the capture interval the server's frame-rate governor suggests
+function applyRefreshHint(seconds) {
+    if (!seconds || !captureInterval || seconds == refreshRate) return;
+    refreshRate = seconds;
+    clearInterval(captureInterval);
+    captureInterval = setInterval(captureFrame, refreshRate * 1000);
+    logMessage(`Refresh rate adjusted to ${refreshRate}s.`);
+}
+
+// Persistent socket for binary frame upload; captureFrame falls back to HTTP while it is not open
+function openFrameSocket() {
+    const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+    frameSocket = new WebSocket(`${protocol}//${window.location.host}/ws/process_frame`);
+    frameSocket.binaryType = 'arraybuffer';
+    frameSocket.onmessage = (event) => {
+        const data = JSON.parse(event.data);
+        applyRefreshHint(data.refresh_interval);
+        if (data.seq !== frameSeq) return; // Ignore results for superseded frames
+        if (data.error) {
+            logMessage(`Error: ${data.error}`);
+        } else if (data.delta) {
+            socketText += data.delta;
+            renderMarkdown(socketText);
+        } else if (data.response !== undefined) {
+            renderMarkdown(data.response);
+        }
+    };
+    frameSocket.onclose = () => {
+        if (captureInterval && frameSocket) {
+            logMessage("Frame socket closed, falling back to HTTP.");
+        }
+        frameSocket = null;
+    };
+}
+
+// Message layout: 4-byte big-endian header length, JSON header, raw JPEG bytes
+async function sendFrameOverSocket(canvas) {
+    const blob = await new Promise(resolve => canvas.toBlob(resolve, 'image/jpeg'));
+    frameSeq += 1;
+    socketText = "";
+    const header = new TextEncoder().encode(JSON.stringify({
+        seq: frameSeq, prompt: customPrompt, api_key: apiKey, stream: streamResponses
+    }));
+    const image = new Uint8Array(await blob.arrayBuffer());
+    const message = new Uint8Array(4 + header.length + image.length);
+    new DataView(message.buffer).setUint32(0, header.length);
+    message.set(header, 4);
+    message.set(image, 4 + header.length);
+    frameSocket.send(message);
+}
+
 function captureFrame() {
     const canvas = document.createElement('canvas');
     canvas.width = video.videoWidth;
     canvas.height = video.videoHeight;
     const context = canvas.getContext('2d');
     context.drawImage(video, 0, 0, canvas.width, canvas.height);
+    if (frameSocket && frameSocket.readyState === WebSocket.OPEN) {
+        logMessage("Frame captured and sent to API.");
+        sendFrameOverSocket(canvas);
+        return;
+    }
     const dataUrl = canvas.toDataURL('image/jpeg');
 
     logMessage("Frame captured and sent to API.");
+    const body = JSON.stringify({ image: dataUrl, prompt: customPrompt, api_key: apiKey });
+    if (streamResponses) {
+        streamFrame(body);
+        return;
+    }
     fetch('/process_frame', {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json'
         },
-        body: JSON.stringify({ image: dataUrl, prompt: customPrompt, api_key: apiKey })
+        body: body
     })
     .then(response => response.json())
     .then(data => {
-        const formattedMarkdown = marked.parse(data.response); // Fixed function call
-        formattedMarkdownDiv.innerHTML = formattedMarkdown;
-        formattedMarkdownDiv.scrollTop = formattedMarkdownDiv.scrollHeight; // Scroll to bottom
+        renderMarkdown(data.response);
+        applyRefreshHint(data.refresh_interval);
     })
     .catch(error => {
         console.error('Error:', error);
         logMessage(`Error: ${error.message}`);
     });
 }
+
+function renderMarkdown(text) {
+    formattedMarkdownDiv.innerHTML = marked.parse(text);
+    formattedMarkdownDiv.scrollTop = formattedMarkdownDiv.scrollHeight; // Scroll to bottom
+}
+
+// Read Server-Sent Events from a POST response and re-render the markdown as tokens arrive
+async function streamFrame(body) {
+    let text = "";
+    let renderPending = false;
+    const scheduleRender = () => {
+        if (renderPending) return;
+        renderPending = true;
+        requestAnimationFrame(() => {
+            renderPending = false;
+            renderMarkdown(text);
+        });
+    };
+
+    try {
+        const response = await fetch('/process_frame_stream', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: body
+        });
+        if (!response.ok) {
+            const data = await response.json();
+            throw new Error(data.response || response.statusText);
+        }
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = "";
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            const events = buffer.split('\n\n');
+            buffer = events.pop(); // Keep any partial event for the next chunk
+            for (const rawEvent of events) {
+                let eventName = 'message';
+                let data = '';
+                for (const line of rawEvent.split('\n')) {
+                    if (line.startsWith('event: ')) eventName = line.slice(7);
+                    else if (line.startsWith('data: ')) data += line.slice(6);
+                }
+                const payload = data ? JSON.parse(data) : {};
+                if (eventName === 'error') {
+                    throw new Error(payload.error);
+                } else if (eventName === 'done') {
+                    applyRefreshHint(payload.refresh_interval);
+                } else if (payload.delta) {
+                    text += payload.delta;
+                    scheduleRender();
+                }
+            }
+        }
+        renderMarkdown(text);
+    } catch (error) {
+        console.error('Error:', error);
+        logMessage(`Error: ${error.message}`);
+    }
+}
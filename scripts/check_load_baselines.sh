@@ -0,0 +1,87 @@
+#!/bin/bash
+
+# Runs scripts/load_test.py against the mock vision API for the pipeline, the
+# FastAPI app and the Flask app, and compares each run with its baseline in
+# scripts/baselines/. Exits 1 if any target regressed.
+#
+#   scripts/check_load_baselines.sh           # check against the baselines
+#   scripts/check_load_baselines.sh record    # re-record the baselines on this machine
+#
+# Baselines are machine-specific: record them on the machine (or CI runner class)
+# that runs the check. LOAD_TEST_TOLERANCE sets the allowed regression fraction.
+
+set -e
+
+MODE=${1:-check}
+if [ "$MODE" != "check" ] && [ "$MODE" != "record" ]; then
+    echo "Usage: $0 [check|record]"
+    exit 2
+fi
+
+ROOT=$(cd "$(dirname "$0")/.." && pwd)
+BASELINES="$ROOT/scripts/baselines"
+MOCK_PORT=${MOCK_PORT:-8181}
+FASTAPI_PORT=${FASTAPI_PORT:-8182}
+FLASK_PORT=${FLASK_PORT:-8183}
+DURATION=${LOAD_TEST_DURATION:-20}
+TOLERANCE=${LOAD_TEST_TOLERANCE:-0.2}
+
+# Measure the pipeline, not the rate limiter or the response cache
+export OPENAI_API_URL="http://127.0.0.1:$MOCK_PORT/v1/chat/completions"
+export OPENAI_API_KEY=mock-key
+export RATE_LIMIT_STATE_PATH=
+export RATE_LIMIT_RPM=1000000
+export RATE_LIMIT_TPM=1000000000
+export RESPONSE_CACHE_TTL=0
+
+PIDS=()
+cleanup() {
+    for pid in "${PIDS[@]}"; do
+        kill "$pid" 2>/dev/null || true
+    done
+}
+trap cleanup EXIT
+
+wait_for_port() {
+    python - "$1" <<'EOF'
+import socket, sys, time
+deadline = time.time() + 30
+while time.time() < deadline:
+    try:
+        socket.create_connection(("127.0.0.1", int(sys.argv[1])), timeout=1).close()
+        sys.exit(0)
+    except OSError:
+        time.sleep(0.2)
+sys.exit("Timed out waiting for port " + sys.argv[1])
+EOF
+}
+
+python "$ROOT/scripts/mock_vision_api.py" --port "$MOCK_PORT" --latency fixed:0.2 \
+    --rpm 1000000 --tpm 1000000000 > /dev/null 2>&1 &
+PIDS+=($!)
+(cd "$ROOT/src" && exec python -m uvicorn app:app --port "$FASTAPI_PORT" --log-level warning) &
+PIDS+=($!)
+(cd "$ROOT/flask" && FLASK_APP=app exec python -m flask run --port "$FLASK_PORT" > /dev/null 2>&1) &
+PIDS+=($!)
+wait_for_port "$MOCK_PORT"
+wait_for_port "$FASTAPI_PORT"
+wait_for_port "$FLASK_PORT"
+
+FAILED=0
+for TARGET in pipeline fastapi flask; do
+    case $TARGET in
+        fastapi) URL="http://127.0.0.1:$FASTAPI_PORT" ;;
+        flask) URL="http://127.0.0.1:$FLASK_PORT" ;;
+        *) URL="" ;;
+    esac
+    if [ "$MODE" = "record" ]; then
+        COMPARE=(--save-baseline "$BASELINES/$TARGET.json")
+    else
+        COMPARE=(--baseline "$BASELINES/$TARGET.json" --tolerance "$TOLERANCE")
+    fi
+    echo "== $TARGET"
+    python "$ROOT/scripts/load_test.py" "$TARGET" ${URL:+--url "$URL"} --concurrency 8 --duration "$DURATION" \
+        "${COMPARE[@]}" || FAILED=1
+done
+
+exit $FAILED
@@ -0,0 +1,312 @@
+# load_test.py replays synthetic or recorded frames against the Flask app, the
+# FastAPI app or the in-process RTSP pipeline stages at a fixed concurrency and
+# reports latency percentiles, throughput and CPU/memory. Run it against
+# scripts/mock_vision_api.py to measure the pipeline without the real API.
+#
+#   python scripts/load_test.py flask --url http://127.0.0.1:5000 --concurrency 16 --duration 60
+#   python scripts/load_test.py pipeline --concurrency 8 --baseline scripts/baselines/pipeline.json
+#
+# scripts/check_load_baselines.sh runs every target against the mock API and
+# compares each with its baseline in scripts/baselines/ (or re-records them).
+# Per-stage CPU is measured for the stages this process runs; the servers under
+# test are only sampled as a whole (--target-pid).
+
+import argparse
+import base64
+import glob
+import json
+import os
+import resource
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+import requests
+
+# Shared pipeline modules live in src/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+NOISE_FLOOR = 0.005  # seconds; smaller per-stage changes are scheduling noise, not regressions
+
+
+# Function to load frames as JPEG bytes from a video, a directory of images or a synthetic generator
+def load_frames(source: str, count: int, size: tuple) -> list:
+    if source and os.path.isdir(source):
+        paths = sorted(glob.glob(os.path.join(source, '*.jp*g')))[:count]
+        return [open(path, 'rb').read() for path in paths]
+    if source:
+        cap = cv2.VideoCapture(source)
+        frames = []
+        while len(frames) < count:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append(cv2.imencode('.jpg', frame)[1].tobytes())
+        cap.release()
+        return frames
+    rng = np.random.default_rng(0)
+    frames = []
+    for i in range(count):
+        frame = cv2.GaussianBlur(rng.integers(0, 255, (size[1], size[0], 3), dtype=np.uint8), (15, 15), 0)
+        cv2.putText(frame, str(i), (40, 120), cv2.FONT_HERSHEY_SIMPLEX, 4, (255, 255, 255), 8)
+        frames.append(cv2.imencode('.jpg', frame)[1].tobytes())
+    return frames
+
+
+def percentile(values: list, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summarize(values: list, cpu: list = None) -> dict:
+    summary = {
+        'count': len(values),
+        'mean': statistics.mean(values) if values else 0.0,
+        'p50': percentile(values, 0.50),
+        'p95': percentile(values, 0.95),
+        'p99': percentile(values, 0.99),
+    }
+    if cpu:
+        # CPU seconds the stage's own thread spent per call; the rest of its wall time is waiting
+        summary['cpu_mean'] = statistics.mean(cpu)
+    return summary
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {}
+        self.cpu = {}
+        self.errors = 0
+
+    def record(self, stage: str, seconds: float, cpu: float = None):
+        with self._lock:
+            self.stages.setdefault(stage, []).append(seconds)
+            if cpu is not None:
+                self.cpu.setdefault(stage, []).append(cpu)
+
+    def error(self):
+        with self._lock:
+            self.errors += 1
+
+
+# Each target sends one frame and records per-stage timings. Stages that run in
+# the calling thread also record their CPU time (time.thread_time), so CPU cost
+# is reported per stage, not only for the whole process
+def flask_target(url: str, prompt: str, api_key: str, stream: bool):
+    session = requests.Session()
+    endpoint = f"{url}/process_frame_stream" if stream else f"{url}/process_frame"
+
+    def send(frame: bytes, recorder: Recorder):
+        started, cpu_started = time.perf_counter(), time.thread_time()
+        body = {'image': 'data:image/jpeg;base64,' + base64.b64encode(frame).decode('utf-8'),
+                'prompt': prompt, 'api_key': api_key}
+        recorder.record('serialize', time.perf_counter() - started, time.thread_time() - cpu_started)
+        response = session.post(endpoint, json=body, stream=stream)
+        response.raise_for_status()
+        if stream:
+            first_token = None
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith('event: error'):
+                    raise ValueError("Stream ended with an error event")
+                if first_token is None and line.startswith('data: '):
+                    first_token = time.perf_counter() - started
+                    recorder.record('first_token', first_token)
+        elif 'error' in response.json():
+            raise ValueError(response.json()['error'])
+        return started
+    return send
+
+
+def fastapi_target(url: str):
+    session = requests.Session()
+
+    def send(frame: bytes, recorder: Recorder):
+        started = time.perf_counter()
+        response = session.post(f"{url}/process_frame", files={'file': ('frame.jpg', frame, 'image/jpeg')})
+        response.raise_for_status()
+        result = response.json()
+        if 'error' in result:
+            raise ValueError(result['error'])
+        # process_frame reports API and encoding failures as "Error..." text with a 200
+        if result.get('response', '').startswith('Error'):
+            raise ValueError(result['response'])
+        return started
+    return send
+
+
+def pipeline_target(api_key: str):
+    from batch_packer import pack_chunk, send_batch
+
+    def send(frame: bytes, recorder: Recorder):
+        started, cpu_started = time.perf_counter(), time.thread_time()
+        image = cv2.imdecode(np.frombuffer(frame, np.uint8), cv2.IMREAD_COLOR)
+        decoded, cpu_decoded = time.perf_counter(), time.thread_time()
+        recorder.record('decode', decoded - started, cpu_decoded - cpu_started)
+        batch = pack_chunk([image])
+        packed, cpu_packed = time.perf_counter(), time.thread_time()
+        recorder.record('encode', packed - decoded, cpu_packed - cpu_decoded)
+        result = send_batch(batch, api_key)
+        recorder.record('api', time.perf_counter() - packed, time.thread_time() - cpu_packed)
+        if result.error:
+            raise ValueError(result.error)
+        return started
+    return send
+
+
+def run(send, frames: list, concurrency: int, duration: float, requests_total: int) -> dict:
+    recorder = Recorder()
+    deadline = time.time() + duration
+    counter = iter(range(requests_total or sys.maxsize))
+    counter_lock = threading.Lock()
+
+    def worker():
+        while time.time() < deadline:
+            with counter_lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            try:
+                started = send(frames[i % len(frames)], recorder)
+                recorder.record('total', time.perf_counter() - started)
+            except Exception as e:
+                recorder.error()
+                print(f"Request failed: {e}", file=sys.stderr)
+
+    process = psutil.Process() if psutil else None
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    wall_started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(concurrency):
+            executor.submit(worker)
+    elapsed = time.perf_counter() - wall_started
+    usage_after = resource.getrusage(resource.RUSAGE_SELF)
+
+    completed = len(recorder.stages.get('total', []))
+    cpu = (usage_after.ru_utime - usage_before.ru_utime) + (usage_after.ru_stime - usage_before.ru_stime)
+    return {
+        'concurrency': concurrency,
+        'elapsed': elapsed,
+        'completed': completed,
+        'errors': recorder.errors,
+        'frames_per_sec': completed / elapsed if elapsed else 0.0,
+        'client_cpu_percent': 100 * cpu / elapsed if elapsed else 0.0,
+        'client_rss_mb': (process.memory_info().rss if process else usage_after.ru_maxrss * 1024) / 2**20,
+        'stages': {stage: summarize(values, recorder.cpu.get(stage)) for stage, values in recorder.stages.items()},
+    }
+
+
+# Function to sample CPU and memory of the server process under test (needs psutil)
+def sample_target(pid: int, stop: threading.Event, samples: list):
+    target = psutil.Process(pid)
+    target.cpu_percent()
+    while not stop.wait(1):
+        samples.append((target.cpu_percent(), target.memory_info().rss / 2**20))
+
+
+# Function to compare a run against a stored baseline; returns a list of regressions
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    error_rate = report['errors'] / max(1, report['completed'] + report['errors'])
+    baseline_error_rate = baseline.get('errors', 0) / max(1, baseline['completed'] + baseline.get('errors', 0))
+    if error_rate > baseline_error_rate + 0.01:
+        regressions.append(f"error rate {error_rate:.1%} > baseline {baseline_error_rate:.1%}")
+    if report['frames_per_sec'] < baseline['frames_per_sec'] * (1 - tolerance):
+        regressions.append(f"frames/sec {report['frames_per_sec']:.2f} < baseline {baseline['frames_per_sec']:.2f}")
+    for stage, summary in baseline.get('stages', {}).items():
+        current = report['stages'].get(stage)
+        if current and current['p95'] > summary['p95'] * (1 + tolerance) + NOISE_FLOOR:
+            regressions.append(f"{stage} p95 {current['p95'] * 1000:.1f}ms > baseline {summary['p95'] * 1000:.1f}ms")
+        if (current and 'cpu_mean' in summary
+                and current.get('cpu_mean', 0) > summary['cpu_mean'] * (1 + tolerance) + NOISE_FLOOR):
+            regressions.append(f"{stage} CPU {current['cpu_mean'] * 1000:.1f}ms/call > "
+                               f"baseline {summary['cpu_mean'] * 1000:.1f}ms/call")
+    return regressions
+
+
+def print_report(report: dict):
+    print(f"{report['completed']} frames in {report['elapsed']:.1f}s at concurrency {report['concurrency']}: "
+          f"{report['frames_per_sec']:.2f} frames/sec, {report['errors']} errors")
+    print(f"client: {report['client_cpu_percent']:.0f}% CPU, {report['client_rss_mb']:.0f} MB RSS")
+    if 'target' in report:
+        print(f"target: {report['target']['cpu_percent_avg']:.0f}% CPU avg, "
+              f"{report['target']['rss_mb_max']:.0f} MB RSS max")
+    print(f"{'stage':<12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'CPU ms':>10}")
+    for stage, summary in report['stages'].items():
+        cpu = f"{summary['cpu_mean'] * 1000:.1f}" if 'cpu_mean' in summary else "-"
+        print(f"{stage:<12}{summary['p50'] * 1000:>10.1f}{summary['p95'] * 1000:>10.1f}{summary['p99'] * 1000:>10.1f}"
+              f"{cpu:>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the frame analysis endpoints")
+    parser.add_argument('target', choices=['flask', 'fastapi', 'pipeline'])
+    parser.add_argument('--url', help="Base URL of the app under test")
+    parser.add_argument('--frames', help="Video file or directory of JPEGs to replay (default: synthetic)")
+    parser.add_argument('--frame-count', type=int, default=50)
+    parser.add_argument('--size', default='1280x720', help="Synthetic frame size")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30, help="Seconds to run")
+    parser.add_argument('--requests', type=int, default=0, help="Stop after this many requests")
+    parser.add_argument('--prompt', default="Analyze this frame")
+    parser.add_argument('--stream', action='store_true', help="Use the SSE endpoint (flask)")
+    parser.add_argument('--target-pid', type=int, help="PID of the server to sample CPU/memory (needs psutil)")
+    parser.add_argument('--baseline', help="Baseline JSON to compare against; exits 1 on regression")
+    parser.add_argument('--save-baseline', help="Write this run's report as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed regression fraction")
+    args = parser.parse_args()
+
+    api_key = os.getenv("OPENAI_API_KEY", "mock-key")
+    if args.target == 'flask':
+        send = flask_target(args.url or "http://127.0.0.1:5000", args.prompt, api_key, args.stream)
+    elif args.target == 'fastapi':
+        send = fastapi_target(args.url or "http://127.0.0.1:8000")
+    else:
+        send = pipeline_target(api_key)
+
+    width, height = (int(v) for v in args.size.split('x'))
+    frames = load_frames(args.frames, args.frame_count, (width, height))
+    if not frames:
+        raise ValueError(f"No frames loaded from {args.frames}")
+
+    samples, stop = [], threading.Event()
+    if args.target_pid:
+        if not psutil:
+            raise ValueError("--target-pid needs psutil installed")
+        threading.Thread(target=sample_target, args=(args.target_pid, stop, samples), daemon=True).start()
+    report = run(send, frames, args.concurrency, args.duration, args.requests)
+    stop.set()
+    if samples:
+        report['target'] = {
+            'cpu_percent_avg': statistics.mean(cpu for cpu, _ in samples),
+            'rss_mb_max': max(rss for _, rss in samples),
+        }
+    print_report(report)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save_baseline)), exist_ok=True)
+        with open(args.save_baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved baseline to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+# mock_vision_api.py is a local stand-in for the chat completions endpoint, for
+# measuring throughput and latency without calling (or paying for) the real API.
+#
+#   python scripts/mock_vision_api.py --latency lognormal:1.5:0.4 --rpm 120 --error-rate 0.05
+#   OPENAI_API_URL=http://127.0.0.1:8080/v1/chat/completions python flask/app.py
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RESPONSE_TEXT = (
+    "## Frame analysis\n\n"
+    "1. **Text**: none visible.\n"
+    "2. **Objects**: a desk, a monitor and a chair arranged in an office.\n"
+    "3. **Context**: indoor work environment.\n"
+    "4. **Lighting**: even, cool artificial light.\n"
+)
+
+
+# Function to parse a latency spec: "fixed:SECONDS", "normal:MEAN:STDDEV",
+# "lognormal:MEDIAN:SIGMA" or "uniform:LOW:HIGH"
+def parse_latency(spec: str):
+    kind, *params = spec.split(':')
+    params = [float(p) for p in params]
+    if kind == 'fixed':
+        return lambda: params[0]
+    if kind == 'normal':
+        return lambda: max(0.0, random.gauss(params[0], params[1]))
+    if kind == 'lognormal':
+        return lambda: params[0] * random.lognormvariate(0, params[1])
+    if kind == 'uniform':
+        return lambda: random.uniform(params[0], params[1])
+    raise argparse.ArgumentTypeError(f"Unknown latency distribution: {spec}")
+
+
+# Requests-per-minute and tokens-per-minute windows that produce realistic 429s and headers
+class RateWindow:
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._lock = threading.Lock()
+        self._window_start = time.time()
+        self._requests = 0
+        self._tokens = 0
+
+    def admit(self, tokens: int):
+        with self._lock:
+            now = time.time()
+            if now - self._window_start >= 60:
+                self._window_start, self._requests, self._tokens = now, 0, 0
+            reset = 60 - (now - self._window_start)
+            allowed = self._requests < self.rpm and self._tokens + tokens <= self.tpm
+            if allowed:
+                self._requests += 1
+                self._tokens += tokens
+            headers = {
+                'x-ratelimit-limit-requests': str(self.rpm),
+                'x-ratelimit-limit-tokens': str(self.tpm),
+                'x-ratelimit-remaining-requests': str(max(0, self.rpm - self._requests)),
+                'x-ratelimit-remaining-tokens': str(max(0, self.tpm - self._tokens)),
+                'x-ratelimit-reset-requests': f"{reset:.3f}s",
+                'x-ratelimit-reset-tokens': f"{reset:.3f}s",
+            }
+            return allowed, reset, headers
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = staticmethod(lambda: 1.0)
+    window = None
+    error_rate = 0.0
+    token_delay = 0.02
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict, headers: dict):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        tokens = payload.get('max_tokens', 300) + 765 * sum(
+            1 for message in payload.get('messages', []) for part in message.get('content', [])
+            if isinstance(part, dict) and part.get('type') == 'image_url')
+        allowed, reset, headers = self.window.admit(tokens)
+        if not allowed or random.random() < self.error_rate:
+            headers['retry-after'] = f"{reset if not allowed else 1:.0f}"
+            message = f"Rate limit reached. Please try again in {reset if not allowed else 1:.1f}s."
+            self._send_json(429, {'error': {'message': message, 'type': 'rate_limit_exceeded'}}, headers)
+            return
+
+        time.sleep(self.latency())
+        if payload.get('stream'):
+            self._stream(headers)
+            return
+        self._send_json(200, {
+            'choices': [{'message': {'role': 'assistant', 'content': RESPONSE_TEXT}, 'finish_reason': 'stop'}],
+            'usage': {'prompt_tokens': tokens - payload.get('max_tokens', 300),
+                      'completion_tokens': len(RESPONSE_TEXT.split()),
+                      'total_tokens': tokens - payload.get('max_tokens', 300) + len(RESPONSE_TEXT.split())},
+        }, headers)
+
+    def _stream(self, headers: dict):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        for word in RESPONSE_TEXT.split(' '):
+            chunk = {'choices': [{'delta': {'content': word + ' '}}]}
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+            time.sleep(self.token_delay)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local mock of the vision chat completions API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=parse_latency, default='lognormal:1.5:0.4',
+                        help="fixed:S, normal:MEAN:STD, lognormal:MEDIAN:SIGMA or uniform:LOW:HIGH (seconds)")
+    parser.add_argument('--rpm', type=int, default=500, help="Requests per minute before 429s")
+    parser.add_argument('--tpm', type=int, default=300000, help="Tokens per minute before 429s")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of requests answered with a random 429")
+    parser.add_argument('--token-delay', type=float, default=0.02, help="Seconds between streamed tokens")
+    args = parser.parse_args()
+
+    MockHandler.latency = staticmethod(args.latency)
+    MockHandler.window = RateWindow(args.rpm, args.tpm)
+    MockHandler.error_rate = args.error_rate
+    MockHandler.token_delay = args.token_delay
+    server = ThreadingHTTPServer((args.host, args.port), MockHandler)
+    print(f"Mock vision API listening on http://{args.host}:{args.port}/v1/chat/completions")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
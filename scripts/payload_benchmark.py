@@ -0,0 +1,75 @@
+# payload_benchmark.py compares building a request body the old way (a dict
+# holding the data URL, then json.dumps and encode) with the pre-serialized
+# RequestBody, joined or sent piece by piece. It reports time and peak extra
+# memory per request for a range of image sizes.
+#
+#   python scripts/payload_benchmark.py --sizes 100000,1000000,4000000 --iterations 50
+
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+# Shared pipeline modules live in src/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from request_body import build_body
+
+MODEL = "gpt-4-vision-preview"
+PROMPT = "Describe this frame."
+
+
+def dict_body(image_base64: str) -> bytes:
+    payload = {
+        "model": MODEL,
+        "messages": [{"role": "user", "content": [
+            {"type": "text", "text": PROMPT},
+            {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}},
+        ]}],
+        "max_tokens": 300,
+    }
+    return json.dumps(payload).encode('utf-8')
+
+
+def joined_body(image_base64: bytes) -> bytes:
+    return build_body(MODEL, PROMPT, [image_base64], 300).join()
+
+
+# What requests sees with data=body: the pieces are written one after another
+def streamed_body(image_base64: bytes) -> int:
+    return sum(len(part) for part in build_body(MODEL, PROMPT, [image_base64], 300))
+
+
+def measure(build, image, iterations: int) -> dict:
+    build(image)
+    started = time.perf_counter()
+    for _ in range(iterations):
+        build(image)
+    elapsed = (time.perf_counter() - started) / iterations
+    tracemalloc.start()
+    build(image)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'ms': elapsed * 1000, 'peak_kb': peak / 1024}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark request body construction")
+    parser.add_argument('--sizes', default="100000,1000000,4000000", help="Comma-separated JPEG sizes in bytes")
+    parser.add_argument('--iterations', type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{'jpeg bytes':>12}{'method':>10}{'ms/request':>14}{'peak extra KB':>16}")
+    for size in (int(s) for s in args.sizes.split(',')):
+        encoded = base64.b64encode(os.urandom(size))
+        for name, build, image in (('dict', dict_body, encoded.decode('ascii')),
+                                   ('joined', joined_body, encoded),
+                                   ('streamed', streamed_body, encoded)):
+            result = measure(build, image, args.iterations)
+            print(f"{size:>12}{name:>10}{result['ms']:>14.3f}{result['peak_kb']:>16.0f}")
+
+
+if __name__ == "__main__":
+    main()
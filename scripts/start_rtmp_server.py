@@ -1,12 +1,18 @@
 import os
+import sys
 import subprocess
 import time
 import requests
-import cv2
-import base64
-import numpy as np
 from dotenv import load_dotenv
 
+# Shared pipeline modules live in src/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+from capture import CaptureEngine
+from change_detector import ChangeDetector
+from frame_encoder import encode_frame
+from frame_governor import FRAME_GOVERNOR, FrameRateGovernor
+from rate_limiter import RateLimitTimeout, get_limiter
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -78,11 +84,14 @@ print("Stream key: any value (e.g., test)")
 
 # Function to process frames and send to OpenAI Vision API
 def process_frame(frame):
-    ret, buffer = cv2.imencode('.jpg', frame)
-    if not ret:
+    try:
+        encoded = encode_frame(frame)
+    except ValueError:
         return "Error encoding frame."
 
-    base64_image = base64.b64encode(buffer).decode('utf-8')
+    base64_image = encoded.base64
+    print(f"Encoded {encoded.width}x{encoded.height} q{encoded.quality}: "
+          f"{encoded.nbytes} bytes, ~{encoded.estimated_tokens} tokens")
 
     headers = {
         'Authorization': f'Bearer {OPENAI_API_KEY}',
@@ -94,7 +103,15 @@ def process_frame(frame):
         'detail': 'high'
     }
 
+    limiter = get_limiter()
+    try:
+        limiter.acquire(tokens=encoded.estimated_tokens)
+    except RateLimitTimeout as e:
+        return f"Skipped: {e}"
     response = requests.post('https://api.openai.com/v1/images', headers=headers, json=data)
+    limiter.update_from_headers(response.headers)
+    if response.status_code == 429:
+        limiter.penalize(limiter.retry_after(response.headers) or 1)
     
     if response.status_code == 200:
         return response.json().get('choices', [{}])[0].get('text', 'No response')
@@ -106,9 +123,9 @@ RTSP_STREAM_URL = os.getenv('RTSP_STREAM_URL')
 FRAME_RATE = int(os.getenv('FRAME_RATE', 1))
 
 print("Waiting for the RTMP stream to be available...")
+engine = CaptureEngine(RTSP_STREAM_URL, FRAME_RATE)
 while True:
-    cap = cv2.VideoCapture(RTSP_STREAM_URL)
-    if cap.isOpened():
+    if engine.open():
         print("RTMP stream is now available.")
         break
     print("RTMP stream not available yet. Retrying in 5 seconds...")
@@ -116,15 +133,20 @@ while True:
 
 print("Starting to capture frames from the RTSP stream...")
 
-while True:
-    ret, frame = cap.read()
-    if not ret:
-        print("Error: Failed to read frame from stream")
-        break
-
-    result = process_frame(frame)
-    print(f"Processed frame result: {result}")
-
-    time.sleep(1 / FRAME_RATE)
-
-cap.release()
\ No newline at end of file
+detector = ChangeDetector()
+# Starts at FRAME_RATE and adapts it to scene activity, API latency and rate-limit headroom
+governor = FrameRateGovernor(FRAME_RATE, "rtmp", engine, headroom=get_limiter().headroom) if FRAME_GOVERNOR else None
+for frame, timestamp in engine.frames():
+    changed = detector.should_send(frame)
+    if governor:
+        governor.observe(changed)
+    if changed:
+        started = time.time()
+        result = process_frame(frame)
+        if governor:
+            governor.record(time.time() - started)
+        detector.remember(result)
+    else:
+        # Scene unchanged, reuse the previous description
+        result = detector.last_response
+    print(f"Processed frame result: {result} ({detector.stats()}, {engine.stats()})")
\ No newline at end of file
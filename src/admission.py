@@ -0,0 +1,144 @@
+import asyncio
+import collections
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+
+from metrics import REGISTRY
+
+# Configuration
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", 16))  # Requests processed at once
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", 64))  # Requests waiting for a slot
+ADMISSION_PER_CLIENT = int(os.getenv("ADMISSION_PER_CLIENT", 8))  # Active + waiting requests per client
+ADMISSION_DEADLINE = float(os.getenv("ADMISSION_DEADLINE", 10))  # seconds a request may wait for a slot
+SERVICE_TIME_ALPHA = 0.2  # Weight of the newest request in the service-time average
+
+IN_FLIGHT = REGISTRY.gauge("admission_in_flight", "Requests currently being processed")
+QUEUE_DEPTH = REGISTRY.gauge("admission_queue_depth", "Requests waiting for a processing slot")
+SHED = REGISTRY.counter("admission_shed_total", "Requests rejected by admission control", labelnames=("reason",))
+WAIT_SECONDS = REGISTRY.histogram("admission_wait_seconds", "Time admitted requests waited for a slot")
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, status_code: int, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+# Admission control for the asyncio servers: at most max_concurrent requests run,
+# at most max_queue wait, and one client may hold at most per_client of those.
+# A request is rejected up front (429 for a client over its share, 503 when the
+# queue is full or the estimated wait, from the running average service time,
+# would exceed the deadline) instead of queueing and timing out later. Slots are
+# claimed before the first await, so a burst arriving in one tick is counted as
+# it arrives, and a finished request hands its slot straight to the oldest
+# waiter.
+class AdmissionController:
+    def __init__(self, max_concurrent: int = ADMISSION_MAX_CONCURRENT, max_queue: int = ADMISSION_MAX_QUEUE,
+                 per_client: int = ADMISSION_PER_CLIENT, deadline: float = ADMISSION_DEADLINE):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.per_client = per_client
+        self.deadline = deadline
+        self.active = 0  # Slots claimed, including ones handed to a waiter that has not resumed yet
+        self.waiting = 0
+        self.admitted = 0
+        self.shed = 0
+        self.service_time = 1.0
+        self._clients = {}
+        self._waiters = collections.deque()
+
+    def estimated_wait(self) -> float:
+        if self.active < self.max_concurrent:
+            return 0.0
+        return (self.waiting + 1) * self.service_time / self.max_concurrent
+
+    def _reject(self, status_code: int, reason: str, retry_after: float):
+        self.shed += 1
+        SHED.inc(reason)
+        raise AdmissionRejected(status_code, reason, retry_after)
+
+    def _publish(self):
+        IN_FLIGHT.set(value=self.active)
+        QUEUE_DEPTH.set(value=self.waiting)
+
+    # Function to give up a slot: the oldest waiter takes it over, else it is freed
+    def _release(self):
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    # Function to wait up to the deadline for a slot to be handed over; returns
+    # whether one was. A slot handed over while the caller was being cancelled is
+    # passed on to the next waiter
+    async def _wait_for_slot(self) -> bool:
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait({waiter}, timeout=self.deadline)
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                self._release()
+            else:
+                waiter.cancel()
+                self._waiters.remove(waiter)
+            raise
+        if waiter.done():
+            return True
+        waiter.cancel()
+        self._waiters.remove(waiter)
+        return False
+
+    @asynccontextmanager
+    async def admit(self, client: str):
+        estimated = self.estimated_wait()
+        if self._clients.get(client, 0) >= self.per_client:
+            self._reject(429, "client_limit", self.service_time)
+        if self.waiting >= self.max_queue:
+            self._reject(503, "queue_full", estimated)
+        if estimated > self.deadline:
+            self._reject(503, "deadline", estimated)
+
+        self._clients[client] = self._clients.get(client, 0) + 1
+        queued = time.monotonic()
+        try:
+            if self.active < self.max_concurrent:
+                self.active += 1
+            else:
+                self.waiting += 1
+                self._publish()
+                try:
+                    if not await self._wait_for_slot():
+                        self._reject(503, "deadline", self.estimated_wait())
+                finally:
+                    self.waiting -= 1
+            started = time.monotonic()
+            WAIT_SECONDS.observe(started - queued)
+            self.admitted += 1
+            self._publish()
+            try:
+                yield
+            finally:
+                self._release()
+                self.service_time += SERVICE_TIME_ALPHA * (time.monotonic() - started - self.service_time)
+        finally:
+            self._clients[client] -= 1
+            if not self._clients[client]:
+                del self._clients[client]
+            self._publish()
+
+    def stats(self) -> dict:
+        return {
+            'active': self.active,
+            'waiting': self.waiting,
+            'admitted': self.admitted,
+            'shed': self.shed,
+            'service_time': self.service_time,
+            'estimated_wait': self.estimated_wait(),
+        }
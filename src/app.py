@@ -1,18 +1,52 @@
-from fastapi import FastAPI, File, UploadFile
-from fastapi.responses import JSONResponse, StreamingResponse
-from video_processor import process_frame
+import asyncio
+
+from fastapi import FastAPI, File, Request, UploadFile
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from admission import AdmissionController, AdmissionRejected
+from metrics import CONTENT_TYPE, render
+from video_processor import create_client, in_flight, process_frame
 import uvicorn
 
 app = FastAPI()
 
+
+@app.on_event("startup")
+async def startup():
+    # One pooled client per worker, shared by every request
+    app.state.vision_client = create_client()
+    # One admission controller per worker, like the client
+    app.state.admission = AdmissionController()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await app.state.vision_client.aclose()
+
+
 @app.post("/process_frame")
-async def process_frame_endpoint(file: UploadFile = File(...)):
+async def process_frame_endpoint(request: Request, file: UploadFile = File(...)):
+    client = request.headers.get('X-Client-Id') or request.client.host
     try:
-        frame = await file.read()
-        response = await process_frame(frame)
+        async with app.state.admission.admit(client):
+            frame = await file.read()
+            response = await process_frame(frame, app.state.vision_client)
         return JSONResponse(content={'response': response})
+    except AdmissionRejected as e:
+        return JSONResponse(content={'error': f"Server busy ({e.reason})"}, status_code=e.status_code,
+                            headers={'Retry-After': str(e.retry_after)})
+    except asyncio.TimeoutError:
+        return JSONResponse(content={'error': 'Vision API request timed out'}, status_code=504)
     except Exception as e:
         return JSONResponse(content={'error': str(e)}, status_code=500)
 
+
+@app.get("/stats")
+async def stats_endpoint():
+    return {'in_flight': in_flight.stats(), 'admission': app.state.admission.stats()}
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return PlainTextResponse(render(), headers={'Content-Type': CONTENT_TYPE})
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
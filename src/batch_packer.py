@@ -0,0 +1,114 @@
+import os
+import time
+from dataclasses import dataclass, field
+
+import requests
+
+from change_detector import hamming_distance, perceptual_hash
+from frame_encoder import as_preview, encode_any
+from metrics import observe_stage, timed
+from rate_limiter import RATE_LIMIT_DEADLINE, RateLimitTimeout
+from request_body import RequestBody, build_body
+from upstream_pool import UpstreamPool, UpstreamUnavailable, get_pool
+
+# Configuration
+VISION_MODEL = os.getenv("VISION_MODEL", "gpt-4-vision-preview")
+BATCH_MAX_IMAGES = int(os.getenv("BATCH_MAX_IMAGES", 5))
+BATCH_MAX_BYTES = int(os.getenv("BATCH_MAX_BYTES", 2_000_000))
+BATCH_MAX_TOKENS = int(os.getenv("BATCH_MAX_TOKENS", 6000))  # Image tokens per request
+BATCH_RESPONSE_TOKENS = 300  # Completion max_tokens per request
+BATCH_INSTRUCTION = os.getenv(
+    "BATCH_INSTRUCTION",
+    "These images are frames from one video stream, in chronological order. Describe what happens across them.")
+
+
+@dataclass
+class Batch:
+    payload: RequestBody
+    indices: list  # Positions of the selected frames within the chunk
+    nbytes: int
+    estimated_tokens: int
+
+
+@dataclass
+class ChunkResult:
+    indices: list
+    latency: float
+    response: str = None
+    error: str = None
+    usage: dict = field(default_factory=dict)
+
+
+# Order frame indices by diversity: start from the first frame, then repeatedly
+# take the frame whose hash is farthest from everything already chosen. Frames
+# identical to one already chosen are left out.
+def rank_by_diversity(hashes: list) -> list:
+    if not hashes:
+        return []
+    order = [0]
+    distances = [hamming_distance(h, hashes[0]) for h in hashes]
+    while len(order) < len(hashes):
+        candidate = max((i for i in range(len(hashes)) if i not in order), key=lambda i: distances[i])
+        if distances[candidate] == 0:
+            break
+        order.append(candidate)
+        distances = [min(d, hamming_distance(h, hashes[candidate])) for d, h in zip(distances, hashes)]
+    return order
+
+
+def build_batch_payload(images_base64: list, instruction: str = BATCH_INSTRUCTION,
+                        max_tokens: int = BATCH_RESPONSE_TOKENS) -> RequestBody:
+    return build_body(VISION_MODEL, instruction, images_base64, max_tokens)
+
+
+# Pick the most diverse frames of a chunk that fit the per-request budget and
+# pack them, in chronological order, into a single multi-image request. When
+# encode_many is given, the top-ranked candidates are encoded in parallel.
+def pack_chunk(frames: list, instruction: str = BATCH_INSTRUCTION, max_images: int = BATCH_MAX_IMAGES,
+               max_bytes: int = BATCH_MAX_BYTES, max_tokens: int = BATCH_MAX_TOKENS,
+               encoder=encode_any, encode_many=None, response_tokens: int = BATCH_RESPONSE_TOKENS) -> Batch:
+    hashes = [perceptual_hash(as_preview(frame)) for frame in frames]
+    ranked = rank_by_diversity(hashes)
+    prefetched = {}
+    if encode_many:
+        candidates = ranked[:max_images]
+        prefetched = dict(zip(candidates, encode_many([frames[i] for i in candidates])))
+    selected = {}
+    nbytes = tokens = 0
+    for index in ranked:
+        if len(selected) >= max_images:
+            break
+        encoded = prefetched.get(index) or encoder(frames[index])
+        if selected and (nbytes + encoded.nbytes > max_bytes or tokens + encoded.estimated_tokens > max_tokens):
+            continue
+        selected[index] = encoded
+        nbytes += encoded.nbytes
+        tokens += encoded.estimated_tokens
+    indices = sorted(selected)
+    with timed('serialize'):
+        payload = build_batch_payload([selected[i].base64_bytes for i in indices], instruction, response_tokens)
+    return Batch(payload=payload, indices=indices, nbytes=nbytes, estimated_tokens=tokens)
+
+
+def send_batch(batch: Batch, api_key: str, pool: UpstreamPool = None,
+               timeout: float = RATE_LIMIT_DEADLINE) -> ChunkResult:
+    pool = pool or get_pool()
+    start_time = time.time()
+    try:
+        response = pool.post(batch.payload, api_key, tokens=batch.estimated_tokens, timeout=timeout)
+    except (RateLimitTimeout, UpstreamUnavailable) as e:
+        return ChunkResult(indices=batch.indices, latency=0.0, error=str(e))
+    except requests.exceptions.RequestException as e:
+        return ChunkResult(indices=batch.indices, latency=time.time() - start_time, error=str(e))
+    latency = response.elapsed.total_seconds()
+    observe_stage('api', latency)
+    if response.status_code != 200:
+        return ChunkResult(indices=batch.indices, latency=latency,
+                           error=f"API request failed with status code {response.status_code}: {response.text}")
+    response_json = response.json()
+    return ChunkResult(
+        indices=batch.indices,
+        latency=latency,
+        response=response_json['choices'][0]['message']['content'],
+        usage=response_json.get('usage', {}),
+    )
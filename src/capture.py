@@ -0,0 +1,141 @@
+import logging
+import os
+import threading
+import time
+
+import cv2
+
+from metrics import observe_stage
+
+# Configuration
+# "stream" timestamps or "monotonic" wall clock. monotonic is for live sources only:
+# a file reads faster than real time, so a wall-clock schedule would skip nearly every frame
+CAPTURE_CLOCK = os.getenv("CAPTURE_CLOCK", "stream")
+CAPTURE_MAX_LAG = float(os.getenv("CAPTURE_MAX_LAG", 1.0))  # seconds behind live before decoding pauses
+CAPTURE_BACKEND = os.getenv("CAPTURE_BACKEND", "opencv")  # "opencv" (BGR frames) or "gstreamer" (JPEG bytes)
+LIVE_GRAB_SECONDS = 0.01  # A grab() that blocks this long means the decoder buffer is empty
+
+
+# Capture loop that keeps draining the stream with grab() so the decoder buffer
+# never backs up, and only decodes (retrieve()) the frames the sampling schedule
+# selects. The schedule follows the stream's own timestamps when available and
+# falls back to the monotonic clock, so there are no sleeps to drift. When a
+# slow consumer lets the buffer back up, buffered frames are grabbed without
+# decoding until the stream has caught up with live again.
+class CaptureEngine:
+    def __init__(self, source, fps: float, clock: str = CAPTURE_CLOCK, max_lag: float = CAPTURE_MAX_LAG):
+        if clock not in ("stream", "monotonic"):
+            raise ValueError(f"Unknown capture clock: {clock}")
+        # Anything that is not a local file (URL, device index) is treated as live
+        self.live = not (isinstance(source, str) and os.path.isfile(source))
+        if clock == "monotonic" and not self.live:
+            raise ValueError(f"The monotonic capture clock needs a live source, not the file {source}")
+        self.source = source
+        self.clock = clock
+        self.interval = 1 / fps
+        self.max_lag = max_lag
+        self.grabbed = 0
+        self.decoded = 0
+        self.skipped = 0
+        self.lag = 0.0
+        self.cap = None
+        self._stopped = threading.Event()
+
+    @property
+    def fps(self) -> float:
+        return 1 / self.interval
+
+    @fps.setter
+    def fps(self, value: float):
+        self.interval = 1 / value
+
+    def open(self) -> bool:
+        # Callers retry open() until the stream is up; release the failed handle each time
+        if self.cap is not None:
+            self.cap.release()
+        self.cap = cv2.VideoCapture(self.source)
+        return self.cap.isOpened()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _timestamp(self, started: float):
+        if self.clock == "stream":
+            position = self.cap.get(cv2.CAP_PROP_POS_MSEC)
+            if position > 0:
+                return position / 1000
+        return time.monotonic() - started
+
+    # Generator yielding (frame, timestamp) for every frame the schedule selects
+    def frames(self):
+        if self.cap is None and not self.open():
+            logging.error(f"Error: Could not open video stream from {self.source}")
+            return
+        started = time.monotonic()
+        first_timestamp = None
+        next_due = None
+        offset = 0.0
+        try:
+            while not self._stopped.is_set():
+                grab_started = time.monotonic()
+                if not self.cap.grab():
+                    if self.live:
+                        logging.error("Error: Failed to grab frame from stream")
+                    else:
+                        logging.info(f"Reached the end of {self.source}")
+                    break
+                now = time.monotonic()
+                observe_stage('capture', now - grab_started)
+                self.grabbed += 1
+                timestamp = self._timestamp(started)
+                if first_timestamp is None:
+                    first_timestamp = next_due = timestamp
+                # How far the stream position trails the wall clock since capture started
+                behind = (now - started) - (timestamp - first_timestamp)
+                if now - grab_started >= LIVE_GRAB_SECONDS:
+                    # grab() waited on the network, so this frame is live
+                    offset = behind
+                self.lag = max(0.0, behind - offset)
+                if timestamp < next_due or self.lag > self.max_lag:
+                    self.skipped += 1
+                    continue
+                decode_started = time.monotonic()
+                ret, frame = self.cap.retrieve()
+                observe_stage('decode', time.monotonic() - decode_started)
+                if not ret:
+                    self.skipped += 1
+                    continue
+                self.decoded += 1
+                # Step the schedule from its previous slot so it does not drift, but
+                # never try to catch up on slots that were missed while stalled
+                next_due += self.interval
+                if next_due <= timestamp:
+                    next_due = timestamp + self.interval
+                yield frame, timestamp
+        finally:
+            self.cap.release()
+            self.cap = None
+
+    def run(self, sink):
+        for frame, timestamp in self.frames():
+            sink(frame)
+
+    def stats(self) -> dict:
+        return {
+            'grabbed': self.grabbed,
+            'decoded': self.decoded,
+            'skipped': self.skipped,
+            'lag': self.lag,
+        }
+
+
+# Function to create the configured ingest backend. The GStreamer backend
+# yields JPEG bytes instead of BGR arrays; frame_encoder.encode_any and
+# frame_encoder.as_preview accept either.
+def create_engine(source, fps: float, backend: str = CAPTURE_BACKEND):
+    if backend == "gstreamer":
+        from gst_capture import GstCaptureEngine
+        return GstCaptureEngine(source, fps)
+    if backend != "opencv":
+        raise ValueError(f"Unknown capture backend: {backend}")
+    return CaptureEngine(source, fps)
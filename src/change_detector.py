@@ -0,0 +1,88 @@
+import os
+import threading
+
+import cv2
+import numpy as np
+
+# Configuration
+CHANGE_METHOD = os.getenv("CHANGE_METHOD", "phash")  # "phash" or "diff"
+CHANGE_THRESHOLD = float(os.getenv("CHANGE_THRESHOLD", 6))
+DIFF_SIZE = 32  # Side of the downsampled frame used for differencing
+
+
+# Function to compute a 64-bit difference hash (dHash) of a frame
+def perceptual_hash(frame: np.ndarray) -> int:
+    if frame.ndim == 3:
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(frame, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int(np.packbits(bits).view('>u8')[0])
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+def downsample(frame: np.ndarray) -> np.ndarray:
+    if frame.ndim == 3:
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(frame, (DIFF_SIZE, DIFF_SIZE), interpolation=cv2.INTER_AREA).astype(np.int16)
+
+
+# Gate that lets a frame through only when the scene changed since the last sent frame.
+# With method "phash" the threshold is a Hamming distance in bits (0-64); with
+# "diff" it is the mean absolute pixel difference (0-255) of downsampled frames.
+class ChangeDetector:
+    def __init__(self, method: str = CHANGE_METHOD, threshold: float = CHANGE_THRESHOLD):
+        if method not in ("phash", "diff"):
+            raise ValueError(f"Unknown change detection method: {method}")
+        self.method = method
+        self.threshold = threshold
+        self.frames_seen = 0
+        self.frames_sent = 0
+        self.last_response = None
+        self._reference = None
+        self._lock = threading.Lock()
+
+    def _signature(self, frame: np.ndarray):
+        if self.method == "phash":
+            return perceptual_hash(frame)
+        return downsample(frame)
+
+    def _distance(self, a, b) -> float:
+        if self.method == "phash":
+            return hamming_distance(a, b)
+        return float(np.abs(a - b).mean())
+
+    def score(self, frame: np.ndarray) -> float:
+        with self._lock:
+            reference = self._reference
+        if reference is None:
+            return float('inf')
+        return self._distance(self._signature(frame), reference)
+
+    def should_send(self, frame: np.ndarray) -> bool:
+        signature = self._signature(frame)
+        with self._lock:
+            self.frames_seen += 1
+            if self._reference is not None and self._distance(signature, self._reference) < self.threshold:
+                return False
+            self._reference = signature
+            self.frames_sent += 1
+            return True
+
+    def remember(self, response):
+        self.last_response = response
+
+    def reset(self):
+        with self._lock:
+            self._reference = None
+            self.last_response = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'frames_seen': self.frames_seen,
+                'frames_sent': self.frames_sent,
+                'frames_skipped': self.frames_seen - self.frames_sent,
+            }
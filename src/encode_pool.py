@@ -0,0 +1,139 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from frame_encoder import encode_frame
+from metrics import observe_stage
+
+# Configuration
+ENCODE_POOL_WORKERS = int(os.getenv("ENCODE_POOL_WORKERS", 0))  # 0 keeps encoding in-process
+ENCODE_POOL_SLOTS = int(os.getenv("ENCODE_POOL_SLOTS", 0))  # Defaults to two slots per worker
+# Bytes per slot; 0 sizes the slots from the first frame submitted. The ring lives
+# in /dev/shm, which Docker limits to 64 MB unless the container is run with
+# --shm-size (e.g. 8 slots of 1080p BGR need about 50 MB, of 4K about 200 MB)
+ENCODE_POOL_SLOT_BYTES = int(os.getenv("ENCODE_POOL_SLOT_BYTES", 0))
+SLOT_TIMEOUT = 10  # seconds to wait for a free slot before giving up
+
+# Set in each worker process by _attach()
+_worker_memory = None
+
+
+# Function to map the pool's shared memory in a worker process, once
+def _attach(name: str):
+    global _worker_memory
+    if _worker_memory is None or _worker_memory.name != name:
+        _worker_memory = shared_memory.SharedMemory(name=name)
+    return _worker_memory
+
+
+# Runs in a worker process: view the frame in its shared-memory slot and encode it
+def _encode_slot(name: str, offset: int, shape: tuple, dtype: str, submitted: float, budget: dict):
+    started = time.time()
+    frame = np.ndarray(shape, dtype=dtype, buffer=_attach(name).buf, offset=offset)
+    encoded = encode_frame(frame, **budget)
+    return encoded, started - submitted, time.time() - started
+
+
+# Process pool for JPEG encoding. Frames reach the workers through a ring of
+# preallocated shared-memory slots, so only the slot number and shape are
+# pickled; the workers return the (small) encoded JPEG. Encode throughput
+# scales with cores instead of contending for the GIL. The ring is allocated on
+# the first frame unless slot_bytes is given; a frame larger than a slot (the
+# source changed resolution) is encoded in-process instead.
+class EncodePool:
+    def __init__(self, workers: int = ENCODE_POOL_WORKERS or os.cpu_count(), slots: int = ENCODE_POOL_SLOTS,
+                 slot_bytes: int = ENCODE_POOL_SLOT_BYTES):
+        self.workers = workers
+        self.slots = slots or 2 * workers
+        self.slot_bytes = slot_bytes
+        self._memory = None
+        self._free = list(range(self.slots))
+        self._slot_available = threading.Condition()
+        self._timings = {'copy': 0.0, 'queue_wait': 0.0, 'encode': 0.0, 'total': 0.0}
+        self._count = 0
+        # Workers attach to the ring after the fork; a shared resource tracker lets
+        # the parent's unlink clean up for all of them
+        resource_tracker.ensure_running()
+        # Fork starts every worker up front, before the caller spawns capture threads
+        self._executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("fork"))
+        self._executor.submit(time.time).result()
+        if slot_bytes:
+            self._allocate(slot_bytes)
+
+    def _allocate(self, slot_bytes: int):
+        with self._slot_available:
+            if self._memory is None:
+                self.slot_bytes = slot_bytes
+                self._memory = shared_memory.SharedMemory(create=True, size=self.slots * slot_bytes)
+
+    def _acquire_slot(self) -> int:
+        with self._slot_available:
+            if not self._slot_available.wait_for(lambda: self._free, SLOT_TIMEOUT):
+                raise TimeoutError("No free encode slot")
+            return self._free.pop()
+
+    def _release_slot(self, slot: int):
+        with self._slot_available:
+            self._free.append(slot)
+            self._slot_available.notify()
+
+    def submit(self, frame: np.ndarray, **budget):
+        if self._memory is None:
+            self._allocate(frame.nbytes)
+        if frame.nbytes > self.slot_bytes:
+            future = Future()
+            started = time.time()
+            future.set_result((encode_frame(frame, **budget), 0.0, time.time() - started))
+            return future
+        started = time.time()
+        slot = self._acquire_slot()
+        offset = slot * self.slot_bytes
+        view = np.ndarray(frame.shape, dtype=frame.dtype, buffer=self._memory.buf, offset=offset)
+        view[...] = frame
+        submitted = time.time()
+        future = self._executor.submit(_encode_slot, self._memory.name, offset, frame.shape, frame.dtype.str,
+                                       submitted, budget)
+
+        def done(future):
+            self._release_slot(slot)
+            if future.exception() is None:
+                _, queue_wait, encode = future.result()
+                # Worker processes keep their own registry, so report their stages here
+                observe_stage('jpeg_encode', encode)
+                self._record(submitted - started, queue_wait, encode, time.time() - started)
+
+        future.add_done_callback(done)
+        return future
+
+    def encode(self, frame: np.ndarray, **budget):
+        return self.submit(frame, **budget).result()[0]
+
+    def encode_many(self, frames: list, **budget) -> list:
+        futures = [self.submit(frame, **budget) for frame in frames]
+        return [future.result()[0] for future in futures]
+
+    def _record(self, copy: float, queue_wait: float, encode: float, total: float):
+        with self._slot_available:
+            self._count += 1
+            for stage, value in (('copy', copy), ('queue_wait', queue_wait), ('encode', encode), ('total', total)):
+                self._timings[stage] += value
+
+    def stats(self) -> dict:
+        with self._slot_available:
+            count = self._count
+            return {
+                'frames': count,
+                'free_slots': len(self._free),
+                **{f'{stage}_avg': value / count if count else 0.0 for stage, value in self._timings.items()},
+            }
+
+    def close(self):
+        self._executor.shutdown()
+        if self._memory is not None:
+            self._memory.close()
+            self._memory.unlink()
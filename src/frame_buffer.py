@@ -0,0 +1,79 @@
+import os
+import threading
+import time
+from collections import deque
+from queue import Empty
+
+from metrics import observe_stage
+
+# Configuration
+FRAME_BUFFER_SIZE = int(os.getenv("FRAME_BUFFER_SIZE", 30))
+FRAME_BUFFER_POLICY = os.getenv("FRAME_BUFFER_POLICY", "drop_oldest")  # drop_oldest, latest_only, every_nth
+FRAME_BUFFER_NTH = int(os.getenv("FRAME_BUFFER_NTH", 5))
+
+POLICIES = ("drop_oldest", "latest_only", "every_nth")
+
+
+# Bounded ring buffer between capture and processing. put() never blocks: once
+# the buffer is full the overflow policy decides which frames are dropped, so
+# memory and end-to-end latency stay bounded when the consumer falls behind.
+#   drop_oldest  - evict the oldest buffered frame to make room
+#   latest_only  - keep only the most recent frame
+#   every_nth    - while full, admit only every Nth incoming frame (evicting the oldest)
+# get() returns (frame, age_in_seconds) and raises queue.Empty on timeout, like Queue.get.
+class FrameBuffer:
+    def __init__(self, maxsize: int = FRAME_BUFFER_SIZE, policy: str = FRAME_BUFFER_POLICY,
+                 nth: int = FRAME_BUFFER_NTH):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown overflow policy: {policy}")
+        self.maxsize = 1 if policy == "latest_only" else maxsize
+        self.policy = policy
+        self.nth = max(1, nth)
+        self.frames_put = 0
+        self.frames_dropped = 0
+        self.last_age = 0.0
+        self.max_age = 0.0
+        self._frames = deque()
+        self._overflow_count = 0
+        self._not_empty = threading.Condition()
+
+    def put(self, frame, timestamp: float = None):
+        timestamp = time.monotonic() if timestamp is None else timestamp
+        with self._not_empty:
+            self.frames_put += 1
+            if len(self._frames) >= self.maxsize:
+                self._overflow_count += 1
+                if self.policy == "every_nth" and self._overflow_count % self.nth:
+                    self.frames_dropped += 1
+                    return
+                self._frames.popleft()
+                self.frames_dropped += 1
+            else:
+                self._overflow_count = 0
+            self._frames.append((frame, timestamp))
+            self._not_empty.notify()
+
+    def get(self, timeout: float = None):
+        with self._not_empty:
+            if not self._not_empty.wait_for(lambda: self._frames, timeout):
+                raise Empty
+            frame, timestamp = self._frames.popleft()
+        age = time.monotonic() - timestamp
+        observe_stage('queue_wait', age)
+        self.last_age = age
+        self.max_age = max(self.max_age, age)
+        return frame, age
+
+    def qsize(self) -> int:
+        with self._not_empty:
+            return len(self._frames)
+
+    def stats(self) -> dict:
+        with self._not_empty:
+            return {
+                'depth': len(self._frames),
+                'frames_put': self.frames_put,
+                'frames_dropped': self.frames_dropped,
+                'last_age': self.last_age,
+                'max_age': self.max_age,
+            }
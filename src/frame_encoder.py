@@ -0,0 +1,213 @@
+import base64
+import math
+import os
+import time
+from dataclasses import dataclass
+
+import cv2
+import numpy as np
+
+from metrics import observe_stage, timed
+
+# Configuration
+ENCODER_MAX_BYTES = int(os.getenv("ENCODER_MAX_BYTES", 400_000))
+ENCODER_MAX_TOKENS = int(os.getenv("ENCODER_MAX_TOKENS", 1105))  # 3x2 tiles, a 16:9 frame at 768p
+ENCODER_GRAYSCALE = os.getenv("ENCODER_GRAYSCALE", "false").lower() == "true"
+JPEG_QUALITIES = (90, 80, 70, 60, 50, 40)
+MIN_SHORT_SIDE = 128
+
+# The vision API fits high-detail images into 2048x2048, then scales the short
+# side down to 768 and bills 170 tokens per 512px tile plus a fixed 85.
+API_MAX_LONG_SIDE = 2048
+API_MAX_SHORT_SIDE = 768
+TILE_SIZE = 512
+TOKENS_PER_TILE = 170
+BASE_TOKENS = 85
+
+
+# Start-of-frame markers that carry the image dimensions (baseline, progressive, etc.)
+SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+@dataclass
+class EncodedFrame:
+    jpeg: bytes
+    base64_bytes: bytes  # Kept as bytes so request bodies can splice it in without a copy
+    width: int
+    height: int
+    quality: int  # None when the original JPEG was forwarded unchanged
+    scale: float
+    estimated_tokens: int
+
+    @property
+    def nbytes(self) -> int:
+        return len(self.jpeg)
+
+    @property
+    def base64(self) -> str:
+        return self.base64_bytes.decode('ascii')
+
+
+# Function to estimate the vision tokens billed for an image of the given size
+def estimate_tokens(width: int, height: int, detail: str = "high") -> int:
+    if detail == "low":
+        return BASE_TOKENS
+    scale = min(1.0, API_MAX_LONG_SIDE / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, API_MAX_SHORT_SIDE / min(width, height))
+    width, height = width * scale, height * scale
+    tiles = math.ceil(width / TILE_SIZE) * math.ceil(height / TILE_SIZE)
+    return BASE_TOKENS + TOKENS_PER_TILE * tiles
+
+
+# Function to pick the largest scale that fits the API resolution limits and the token budget
+def fit_scale(width: int, height: int, max_tokens: int = None) -> float:
+    scale = min(1.0, API_MAX_LONG_SIDE / max(width, height), API_MAX_SHORT_SIDE / min(width, height))
+    if max_tokens:
+        while (estimate_tokens(int(width * scale), int(height * scale)) > max_tokens
+               and min(width, height) * scale > MIN_SHORT_SIDE):
+            scale *= 0.9
+    return scale
+
+
+def crop(frame: np.ndarray, roi) -> np.ndarray:
+    x, y, w, h = roi
+    return frame[max(y, 0):y + h, max(x, 0):x + w]
+
+
+# Encode a BGR frame to JPEG within a byte and token budget. Resolution is chosen
+# first from the token budget, then JPEG quality is lowered (and the frame
+# downscaled further if needed) until the encoded size fits max_bytes.
+def encode_frame(frame: np.ndarray, max_bytes: int = ENCODER_MAX_BYTES, max_tokens: int = ENCODER_MAX_TOKENS,
+                 grayscale: bool = ENCODER_GRAYSCALE, roi=None) -> EncodedFrame:
+    if frame is None or frame.ndim < 2 or frame.size == 0:
+        raise ValueError("Input image must be a non-empty >= 2-d array.")
+    started = time.perf_counter()
+    if roi is not None:
+        frame = crop(frame, roi)
+    if grayscale and frame.ndim == 3:
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+    height, width = frame.shape[:2]
+    scale = fit_scale(width, height, max_tokens)
+    preprocess = encode = 0.0
+    while True:
+        size = (max(1, int(width * scale)), max(1, int(height * scale)))
+        resized = frame if scale == 1.0 else cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        resized_at = time.perf_counter()
+        preprocess += resized_at - started
+        for quality in JPEG_QUALITIES:
+            success, buffer = cv2.imencode('.jpg', resized, [cv2.IMWRITE_JPEG_QUALITY, quality])
+            if not success:
+                raise ValueError("Could not encode image to JPEG format.")
+            if not max_bytes or buffer.nbytes <= max_bytes:
+                break
+        started = time.perf_counter()
+        encode += started - resized_at
+        if not max_bytes or buffer.nbytes <= max_bytes or min(size) <= MIN_SHORT_SIDE:
+            break
+        scale *= 0.75
+    observe_stage('preprocess', preprocess)
+    observe_stage('jpeg_encode', encode)
+
+    jpeg = buffer.tobytes()
+    with timed('base64'):
+        encoded_base64 = base64.b64encode(jpeg)
+    return EncodedFrame(
+        jpeg=jpeg,
+        base64_bytes=encoded_base64,
+        width=size[0],
+        height=size[1],
+        quality=quality,
+        scale=scale,
+        estimated_tokens=estimate_tokens(size[0], size[1]),
+    )
+
+
+# Function to read (width, height) from a JPEG's SOF segment without decoding it
+def jpeg_dimensions(data: bytes):
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+    offset = 2
+    while offset + 9 <= len(data):
+        if data[offset] != 0xFF:
+            return None
+        marker = data[offset + 1]
+        if marker == 0xFF:  # Fill byte
+            offset += 1
+            continue
+        if marker == 0xD8 or 0xD0 <= marker <= 0xD7:  # Standalone markers
+            offset += 2
+            continue
+        length = int.from_bytes(data[offset + 2:offset + 4], 'big')
+        if marker in SOF_MARKERS:
+            height = int.from_bytes(data[offset + 5:offset + 7], 'big')
+            width = int.from_bytes(data[offset + 7:offset + 9], 'big')
+            return (width, height) if width and height else None
+        if marker == 0xDA or length < 2:  # Reached scan data without a frame header
+            return None
+        offset += 2 + length
+    return None
+
+
+# Forward an already-encoded JPEG unchanged when it is within the byte and token
+# budget. Returns None when the frame must be decoded and re-encoded instead.
+def passthrough_jpeg(data: bytes, base64_data: str = None, max_bytes: int = ENCODER_MAX_BYTES,
+                     max_tokens: int = ENCODER_MAX_TOKENS):
+    dimensions = jpeg_dimensions(data)
+    if dimensions is None or (max_bytes and len(data) > max_bytes):
+        return None
+    width, height = dimensions
+    if fit_scale(width, height, max_tokens) < 1.0:
+        return None
+    return EncodedFrame(
+        jpeg=data,
+        base64_bytes=base64_data.encode('ascii') if base64_data else base64.b64encode(data),
+        width=width,
+        height=height,
+        quality=None,
+        scale=1.0,
+        estimated_tokens=estimate_tokens(width, height),
+    )
+
+
+# Encode uploaded image bytes, decoding only when resizing or cropping is required
+def encode_image_bytes(data: bytes, base64_data: str = None, roi=None, grayscale: bool = ENCODER_GRAYSCALE,
+                       **budget) -> EncodedFrame:
+    if roi is None and not grayscale:
+        encoded = passthrough_jpeg(data, base64_data, **budget)
+        if encoded is not None:
+            return encoded
+    return encode_frame(decode_jpeg(data), roi=roi, grayscale=grayscale, **budget)
+
+
+def decode_jpeg(data: bytes) -> np.ndarray:
+    with timed('decode'):
+        frame = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if frame is None:
+        raise ValueError("Could not decode image.")
+    return frame
+
+
+# Function to decode a cheap 1/8-scale grayscale preview, enough for perceptual hashing
+def decode_preview(data: bytes) -> np.ndarray:
+    with timed('decode'):
+        preview = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if preview is None:
+        raise ValueError("Could not decode image.")
+    return preview
+
+
+# Function to encode either a BGR frame or JPEG bytes (e.g. from the GStreamer
+# capture backend, which are forwarded as-is when they fit the budget)
+def encode_any(frame, **budget) -> EncodedFrame:
+    if isinstance(frame, (bytes, bytearray)):
+        return encode_image_bytes(bytes(frame), **budget)
+    return encode_frame(frame, **budget)
+
+
+# Function to get an array to hash or diff: JPEG bytes get a reduced decode, arrays pass through
+def as_preview(frame) -> np.ndarray:
+    if isinstance(frame, (bytes, bytearray)):
+        return decode_preview(bytes(frame))
+    return frame
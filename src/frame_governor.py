@@ -0,0 +1,136 @@
+import os
+import threading
+import time
+
+from metrics import REGISTRY
+
+# Configuration
+FRAME_GOVERNOR = os.getenv("FRAME_GOVERNOR", "false").lower() == "true"  # Adapt each stream's sampling rate
+GOVERNOR_MIN_FPS = float(os.getenv("GOVERNOR_MIN_FPS", 0.1))
+GOVERNOR_MAX_FPS = float(os.getenv("GOVERNOR_MAX_FPS", 2))
+GOVERNOR_TOKENS_PER_HOUR = float(os.getenv("GOVERNOR_TOKENS_PER_HOUR", 0))  # Per-stream token budget, 0 for none
+GOVERNOR_TARGET_LATENCY = float(os.getenv("GOVERNOR_TARGET_LATENCY", 5))  # seconds per API request
+GOVERNOR_MIN_HEADROOM = float(os.getenv("GOVERNOR_MIN_HEADROOM", 0.2))  # Rate-limit headroom below which we back off
+GOVERNOR_INTERVAL = float(os.getenv("GOVERNOR_INTERVAL", 5))  # seconds between adjustments
+MAX_STEP_UP = 1.5  # Largest increase per adjustment; decreases apply at once
+ACTIVITY_ALPHA = 0.5  # Weight of the newest interval in the activity average
+SPEND_DECAY = 0.8  # Per-interval decay of the token spend totals
+
+FPS = REGISTRY.gauge("governor_fps", "Sampling rate chosen by the frame-rate governor", labelnames=("stream",))
+ACTIVITY = REGISTRY.gauge("governor_activity", "Fraction of recent frames that changed the scene",
+                          labelnames=("stream",))
+DECISIONS = REGISTRY.counter("governor_decisions_total", "Governor adjustments by the constraint that set the rate",
+                             labelnames=("stream", "reason"))
+
+
+# Feedback controller for one stream's sampling rate. Scene activity (the share
+# of sampled frames the change detector lets through) sets the rate it would
+# like, between min_fps and max_fps. The token budget, API latency above target
+# and low rate-limit headroom each cap it. Every GOVERNOR_INTERVAL seconds the
+# tightest of these wins; the rate drops at once but rises at most MAX_STEP_UP
+# per interval, so one quiet spell or fast response does not cause a burst.
+# The new rate is applied to the capture engine when one is given, otherwise
+# callers read fps (the browser gets it as a refresh hint).
+class FrameRateGovernor:
+    def __init__(self, fps: float, name: str = "default", engine=None, min_fps: float = GOVERNOR_MIN_FPS,
+                 max_fps: float = GOVERNOR_MAX_FPS, tokens_per_hour: float = GOVERNOR_TOKENS_PER_HOUR,
+                 target_latency: float = GOVERNOR_TARGET_LATENCY, min_headroom: float = GOVERNOR_MIN_HEADROOM,
+                 headroom=None, interval: float = GOVERNOR_INTERVAL, clock=time.monotonic):
+        if min_fps <= 0 or max_fps < min_fps:
+            raise ValueError(f"Invalid frame rate bounds: {min_fps}-{max_fps}")
+        self.name = name
+        self.engine = engine
+        self.min_fps = min_fps
+        self.max_fps = max_fps
+        self.tokens_per_hour = tokens_per_hour
+        self.target_latency = target_latency
+        self.min_headroom = min_headroom
+        self.interval = interval
+        self.fps = min(max_fps, max(min_fps, fps))
+        self.activity = 1.0
+        self.reason = "initial"
+        self._headroom = headroom
+        self._frames = 0
+        self._changed = 0
+        self._latencies = []
+        self._spent_tokens = 0.0
+        self._spent_frames = 0.0
+        self._clock = clock
+        self._last_update = clock()
+        self._lock = threading.Lock()
+        self._apply()
+
+    # Function to count a sampled frame and whether the change detector passed it
+    def observe(self, changed: bool) -> float:
+        with self._lock:
+            self._frames += 1
+            self._changed += int(changed)
+        return self.update()
+
+    # Function to record a finished API request; tokens are the request's total usage
+    def record(self, latency: float, tokens: int = 0):
+        with self._lock:
+            self._latencies.append(latency)
+            self._spent_tokens += tokens
+
+    def update(self, now: float = None) -> float:
+        now = self._clock() if now is None else now
+        with self._lock:
+            if now - self._last_update < self.interval:
+                return self.fps
+            self._last_update = now
+            frames, changed, latencies = self._frames, self._changed, self._latencies
+            self._frames = self._changed = 0
+            self._latencies = []
+            self._spent_frames += frames
+            if frames:
+                self.activity += ACTIVITY_ALPHA * (changed / frames - self.activity)
+
+            # Activity picks the rate we would like; each constraint can only lower it
+            limits = [(self.min_fps + (self.max_fps - self.min_fps) * self.activity, "activity")]
+            if self.tokens_per_hour and self._spent_tokens and self._spent_frames:
+                tokens_per_frame = self._spent_tokens / self._spent_frames
+                limits.append((self.tokens_per_hour / 3600 / tokens_per_frame, "budget"))
+            if latencies:
+                latency = sum(latencies) / len(latencies)
+                if latency > self.target_latency:
+                    limits.append((self.fps * self.target_latency / latency, "latency"))
+            headroom = self._headroom() if self._headroom else 1.0
+            if headroom < self.min_headroom:
+                limits.append((self.fps * max(0.5, headroom / self.min_headroom), "headroom"))
+            target, reason = min(limits, key=lambda limit: limit[0])
+
+            if target > self.fps * MAX_STEP_UP:
+                target = self.fps * MAX_STEP_UP
+            fps = min(self.max_fps, max(self.min_fps, target))
+            if fps != target:
+                reason = "bounds"
+            self._spent_tokens *= SPEND_DECAY
+            self._spent_frames *= SPEND_DECAY
+            changed_rate = abs(fps - self.fps) > 1e-3
+            self.fps = fps
+            self.reason = reason
+        DECISIONS.inc(self.name, reason)
+        ACTIVITY.set(self.name, value=self.activity)
+        if changed_rate:
+            self._apply()
+        return fps
+
+    # Function to start driving a capture engine created after the governor
+    def attach(self, engine):
+        self.engine = engine
+        self._apply()
+
+    def _apply(self):
+        FPS.set(self.name, value=self.fps)
+        if self.engine is not None:
+            self.engine.fps = self.fps
+
+    def stats(self) -> dict:
+        return {
+            'fps': self.fps,
+            'activity': self.activity,
+            'reason': self.reason,
+            'min_fps': self.min_fps,
+            'max_fps': self.max_fps,
+        }
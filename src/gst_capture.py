@@ -0,0 +1,142 @@
+import logging
+import os
+import threading
+import time
+
+import gi
+
+gi.require_version('Gst', '1.0')
+from gi.repository import GLib, Gst
+
+from metrics import observe_stage
+
+# Configuration
+GST_WIDTH = int(os.getenv("GST_WIDTH", 1024))  # Output width in pixels, height keeps the aspect ratio; 0 keeps the source size
+GST_JPEG_QUALITY = int(os.getenv("GST_JPEG_QUALITY", 85))
+PULL_TIMEOUT = 1  # seconds try-pull-sample waits before checking for stop/EOS
+
+
+# Function to build the launch string: decode, drop to the target rate, scale and
+# JPEG-encode in native elements, and hand only the newest JPEG to the appsink
+def build_pipeline(source: str, fps: float, width: int = GST_WIDTH, quality: int = GST_JPEG_QUALITY) -> str:
+    if source.startswith(('rtsp://', 'rtsps://')):
+        ingest = f'rtspsrc location="{source}" latency=0 drop-on-latency=true ! decodebin'
+    else:
+        uri = source if Gst.uri_is_valid(source) else Gst.filename_to_uri(os.path.abspath(source))
+        ingest = f'uridecodebin uri="{uri}"'
+    scale = f"video/x-raw,width={width},pixel-aspect-ratio=1/1" if width else "video/x-raw"
+    return (
+        f'{ingest} ! videoconvert ! videorate drop-only=true ! capsfilter name=rate caps="{rate_caps(fps)}" ! '
+        f"videoscale ! {scale} ! jpegenc quality={quality} ! "
+        f"appsink name=sink emit-signals=false sync=false drop=true max-buffers=1"
+    )
+
+
+def rate_caps(fps: float) -> str:
+    numerator, denominator = Gst.util_double_to_fraction(fps)
+    return f"video/x-raw,framerate={numerator}/{denominator}"
+
+
+# Ingest backend with the same interface as CaptureEngine, but the frame rate,
+# scaling and JPEG encoding happen inside a GStreamer pipeline and frames()
+# yields (jpeg_bytes, timestamp). Python only pulls finished JPEG buffers, so
+# per-stream Python CPU is a buffer copy per sampled frame. The appsink keeps a
+# single buffer and drops older ones, so a slow consumer always gets the newest frame.
+class GstCaptureEngine:
+    def __init__(self, source, fps: float, width: int = GST_WIDTH, quality: int = GST_JPEG_QUALITY):
+        Gst.init(None)
+        self.source = str(source)
+        self.interval = 1 / fps
+        self.width = width
+        self.quality = quality
+        self.grabbed = 0
+        self.decoded = 0
+        self.skipped = 0
+        self.lag = 0.0
+        self.pipeline = None
+        self._sink = None
+        self._rate = None
+        self._stopped = threading.Event()
+
+    @property
+    def fps(self) -> float:
+        return 1 / self.interval
+
+    # videorate renegotiates from the new caps, so the rate can change while running
+    @fps.setter
+    def fps(self, value: float):
+        self.interval = 1 / value
+        if self._rate is not None:
+            self._rate.set_property('caps', Gst.Caps.from_string(rate_caps(value)))
+
+    def open(self) -> bool:
+        try:
+            self.pipeline = Gst.parse_launch(build_pipeline(self.source, self.fps, self.width, self.quality))
+        except GLib.Error as e:
+            logging.error(f"Error: Could not build GStreamer pipeline for {self.source}: {e}")
+            return False
+        self._sink = self.pipeline.get_by_name('sink')
+        self._rate = self.pipeline.get_by_name('rate')
+        if self.pipeline.set_state(Gst.State.PLAYING) == Gst.StateChangeReturn.FAILURE:
+            self._close()
+            return False
+        return True
+
+    def stop(self):
+        self._stopped.set()
+
+    def _close(self):
+        if self.pipeline is not None:
+            self.pipeline.set_state(Gst.State.NULL)
+        self.pipeline = self._sink = self._rate = None
+
+    def _check_bus(self) -> bool:
+        message = self.pipeline.get_bus().pop_filtered(Gst.MessageType.ERROR | Gst.MessageType.EOS)
+        if message is None:
+            return True
+        if message.type == Gst.MessageType.ERROR:
+            error, debug = message.parse_error()
+            logging.error(f"Error: GStreamer pipeline failed: {error.message} ({debug})")
+        else:
+            logging.info(f"End of stream from {self.source}")
+        return False
+
+    # Generator yielding (jpeg_bytes, timestamp) at the pipeline's output rate
+    def frames(self):
+        if self.pipeline is None and not self.open():
+            logging.error(f"Error: Could not open video stream from {self.source}")
+            return
+        started = time.monotonic()
+        try:
+            while not self._stopped.is_set() and self._check_bus():
+                pull_started = time.monotonic()
+                sample = self._sink.emit('try-pull-sample', PULL_TIMEOUT * Gst.SECOND)
+                if sample is None:
+                    if self._sink.get_property('eos'):
+                        break
+                    continue
+                observe_stage('capture', time.monotonic() - pull_started)
+                buffer = sample.get_buffer()
+                # One copy of the compressed JPEG, never of a raw frame
+                data = buffer.extract_dup(0, buffer.get_size())
+                self.grabbed += 1
+                self.decoded += 1
+                if buffer.pts != Gst.CLOCK_TIME_NONE:
+                    timestamp = buffer.pts / Gst.SECOND
+                else:
+                    timestamp = time.monotonic() - started
+                yield data, timestamp
+        finally:
+            self._close()
+
+    def run(self, sink):
+        for frame, timestamp in self.frames():
+            sink(frame)
+
+    def stats(self) -> dict:
+        return {
+            'grabbed': self.grabbed,
+            'decoded': self.decoded,
+            'skipped': self.skipped,
+            'lag': self.lag,
+        }
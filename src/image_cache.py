@@ -0,0 +1,111 @@
+import hashlib
+import logging
+import os
+import queue
+import threading
+from collections import OrderedDict
+
+# Configuration
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", 256 * 2**20))  # Total JPEG bytes kept on disk
+WRITE_TIMEOUT = 5  # seconds wait() blocks for a pending write
+
+
+# Content-addressed JPEG store: files are named by the SHA-256 of their bytes,
+# so identical frames are written once. Writes happen on a background thread
+# and the least recently used files are deleted once the directory exceeds
+# max_bytes. put() returns the final path immediately; call wait(path) before
+# handing the path to something that reads the file.
+class ImageCache:
+    def __init__(self, directory: str, max_bytes: int = IMAGE_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.writes = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # path -> size, least recently used first
+        self._pending = {}  # path -> Event set once the file is on disk
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+        self._writer = threading.Thread(target=self._write_loop, name="image-cache-writer", daemon=True)
+        self._writer.start()
+
+    # Function to pick up files left by a previous run, oldest first
+    def _load(self):
+        paths = [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith('.jpeg')]
+        for path in sorted(paths, key=os.path.getmtime):
+            size = os.path.getsize(path)
+            self._entries[path] = size
+            self._bytes += size
+        self._evict()
+
+    def path_for(self, jpeg: bytes) -> str:
+        return os.path.join(self.directory, f"{hashlib.sha256(jpeg).hexdigest()}.jpeg")
+
+    def put(self, jpeg: bytes) -> str:
+        path = self.path_for(jpeg)
+        with self._lock:
+            if path in self._entries:
+                self._entries.move_to_end(path)
+                self.hits += 1
+                return path
+            self._entries[path] = len(jpeg)
+            self._bytes += len(jpeg)
+            # Evicted but still queued: the pending write now keeps the file
+            queued = path in self._pending
+            if not queued:
+                self._pending[path] = threading.Event()
+            self._evict()
+        if not queued:
+            self._queue.put((path, jpeg))
+        return path
+
+    def wait(self, path: str, timeout: float = WRITE_TIMEOUT) -> bool:
+        with self._lock:
+            written = self._pending.get(path)
+        return written is None or written.wait(timeout)
+
+    # Must be called with the lock held
+    def _evict(self):
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            path, size = self._entries.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+            if path not in self._pending:
+                self._queue.put((path, None))
+
+    def _write_loop(self):
+        while True:
+            path, jpeg = self._queue.get()
+            try:
+                if jpeg is None:
+                    os.remove(path)
+                    continue
+                temp_path = f"{path}.tmp"
+                with open(temp_path, 'wb') as f:
+                    f.write(jpeg)
+                os.replace(temp_path, path)
+                self.writes += 1
+            except OSError as e:
+                logging.warning(f"Image cache write failed for {path}: {e}")
+            finally:
+                if jpeg is not None:
+                    with self._lock:
+                        written = self._pending.pop(path)
+                        # Evicted while the write was queued
+                        if path not in self._entries:
+                            self._queue.put((path, None))
+                    written.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'writes': self.writes,
+                'evictions': self.evictions,
+                'pending': len(self._pending),
+            }
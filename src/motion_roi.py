@@ -0,0 +1,106 @@
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from frame_encoder import crop
+from metrics import timed
+
+# Configuration
+MOTION_ROI = os.getenv("MOTION_ROI", "false").lower() == "true"  # Crop uploads to the moving region
+MOTION_ALPHA = float(os.getenv("MOTION_ALPHA", 0.05))  # Background learning rate per frame
+MOTION_THRESHOLD = int(os.getenv("MOTION_THRESHOLD", 25))  # Pixel difference (0-255) that counts as motion
+MOTION_PADDING = float(os.getenv("MOTION_PADDING", 0.25))  # Padding around the motion box, as a fraction of its size
+MOTION_THUMBNAIL_WIDTH = int(os.getenv("MOTION_THUMBNAIL_WIDTH", 0))  # 0 sends the crop alone
+ANALYSIS_WIDTH = 160  # Width of the downsampled frame the background model runs on
+MIN_MOTION_AREA = 0.002  # Fraction of the frame that must change before we crop
+MAX_MOTION_AREA = 0.6  # Above this (lighting change, camera shake) the full frame is sent
+MIN_CROP_SIDE = 64  # pixels
+
+
+# Running-average background model for one stream. update() returns the padded
+# bounding box (x, y, w, h) of the pixels that moved, in full-frame
+# coordinates, or None when there is no usable motion region and the whole
+# frame should be sent (first frame, a still scene, or a global change).
+class MotionROI:
+    def __init__(self, alpha: float = MOTION_ALPHA, threshold: int = MOTION_THRESHOLD,
+                 padding: float = MOTION_PADDING):
+        self.alpha = alpha
+        self.threshold = threshold
+        self.padding = padding
+        self.frames = 0
+        self.cropped = 0
+        self.area_total = 0.0
+        self._background = None
+        self._lock = threading.Lock()
+
+    def update(self, frame: np.ndarray):
+        height, width = frame.shape[:2]
+        if frame.ndim == 3:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        scale = min(1.0, ANALYSIS_WIDTH / width)
+        small = cv2.resize(frame, (max(1, int(width * scale)), max(1, int(height * scale))),
+                           interpolation=cv2.INTER_AREA)
+        return self.update_preview(small, width, height)
+
+    # Same as update(), for a frame already reduced to grayscale (e.g. decode_preview)
+    def update_preview(self, preview: np.ndarray, width: int, height: int):
+        with timed('preprocess'), self._lock:
+            self.frames += 1
+            preview = cv2.GaussianBlur(preview, (5, 5), 0)
+            if self._background is None or self._background.shape != preview.shape:
+                self._background = preview.astype(np.float32)
+                return None
+            mask = cv2.absdiff(preview, cv2.convertScaleAbs(self._background)) > self.threshold
+            cv2.accumulateWeighted(preview, self._background, self.alpha)
+            area = float(np.count_nonzero(mask)) / mask.size
+            if area < MIN_MOTION_AREA or area > MAX_MOTION_AREA:
+                return None
+            mask = cv2.dilate(mask.astype(np.uint8), np.ones((3, 3), np.uint8))
+            x, y, w, h = cv2.boundingRect(mask)
+            self.cropped += 1
+            self.area_total += area
+        return self._to_frame(x, y, w, h, width / preview.shape[1], height / preview.shape[0], width, height)
+
+    def _to_frame(self, x, y, w, h, scale_x, scale_y, width, height):
+        pad_x = max(w * scale_x * self.padding, (MIN_CROP_SIDE - w * scale_x) / 2, 0)
+        pad_y = max(h * scale_y * self.padding, (MIN_CROP_SIDE - h * scale_y) / 2, 0)
+        left = max(0, int(x * scale_x - pad_x))
+        top = max(0, int(y * scale_y - pad_y))
+        right = min(width, int((x + w) * scale_x + pad_x))
+        bottom = min(height, int((y + h) * scale_y + pad_y))
+        return left, top, right - left, bottom - top
+
+    def reset(self):
+        with self._lock:
+            self._background = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'frames': self.frames,
+                'cropped': self.cropped,
+                'avg_motion_area': self.area_total / self.cropped if self.cropped else 0.0,
+            }
+
+
+# Function to cut the motion region out of a frame, optionally with a small
+# full-frame thumbnail (region outlined) below it so the model keeps the context
+def crop_motion(frame: np.ndarray, roi, thumbnail_width: int = MOTION_THUMBNAIL_WIDTH) -> np.ndarray:
+    if roi is None:
+        return frame
+    region = crop(frame, roi)
+    if not thumbnail_width:
+        return region
+    height, width = frame.shape[:2]
+    scale = thumbnail_width / width
+    thumbnail = cv2.resize(frame, (thumbnail_width, max(1, int(height * scale))), interpolation=cv2.INTER_AREA)
+    x, y, w, h = roi
+    cv2.rectangle(thumbnail, (int(x * scale), int(y * scale)), (int((x + w) * scale), int((y + h) * scale)),
+                  (0, 0, 255), 1)
+    canvas = np.zeros((region.shape[0] + thumbnail.shape[0], max(region.shape[1], thumbnail_width))
+                      + frame.shape[2:], dtype=frame.dtype)
+    canvas[:region.shape[0], :region.shape[1]] = region
+    canvas[region.shape[0]:, :thumbnail_width] = thumbnail
+    return canvas
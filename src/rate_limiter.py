@@ -0,0 +1,199 @@
+import asyncio
+import fcntl
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+# Configuration
+RATE_LIMIT_RPM = float(os.getenv("RATE_LIMIT_RPM", 500))  # requests per minute
+RATE_LIMIT_TPM = float(os.getenv("RATE_LIMIT_TPM", 30000))  # tokens per minute
+RATE_LIMIT_DEADLINE = float(os.getenv("RATE_LIMIT_DEADLINE", 30))  # seconds a caller may queue
+# Workers on one box share a budget through this file; set to "" for a per-process limiter
+RATE_LIMIT_STATE_PATH = os.getenv(
+    "RATE_LIMIT_STATE_PATH", os.path.join(tempfile.gettempdir(), "ai-stream-ratelimit.json"))
+
+DURATION_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+
+
+class RateLimitTimeout(Exception):
+    pass
+
+
+# Function to parse reset durations such as "20ms", "1s" or "6m0s" into seconds
+def parse_duration(value: str) -> float:
+    if not value:
+        return None
+    matches = DURATION_PATTERN.findall(value)
+    if not matches:
+        return None
+    return sum(float(amount) * DURATION_UNITS[unit] for amount, unit in matches)
+
+
+# Per-process state, guarded by a thread lock
+class MemoryBackend:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = {}
+
+    @contextmanager
+    def transaction(self):
+        with self._lock:
+            yield self._state
+
+
+# State shared by every process on the box through an flock-guarded JSON file
+class FileBackend:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def transaction(self):
+        with self._lock, open(self.path, 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0)
+                content = f.read()
+                state = json.loads(content) if content else {}
+                yield state
+                f.seek(0)
+                f.truncate()
+                json.dump(state, f)
+                f.flush()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+# Token bucket for requests/min and tokens/min. Buckets refill continuously and
+# are corrected from the API's x-ratelimit-* response headers: the limit-*
+# headers size the buckets to the key's real tier (rpm/tpm are only the
+# starting guess) and remaining-* set their level, up as well as down.
+class RateLimiter:
+    def __init__(self, rpm: float = RATE_LIMIT_RPM, tpm: float = RATE_LIMIT_TPM, backend=None, clock=time.time):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.backend = backend or MemoryBackend()
+        self._clock = clock
+
+    # Function to get the bucket sizes, as learned from the headers once any arrived
+    def _limits(self, state: dict):
+        return state.get('rpm', self.rpm), state.get('tpm', self.tpm)
+
+    def _refill(self, state: dict, now: float):
+        rpm, tpm = self._limits(state)
+        elapsed = now - state.get('updated_at', now)
+        state['requests'] = min(rpm, state.get('requests', rpm) + elapsed * rpm / 60)
+        state['tokens'] = min(tpm, state.get('tokens', tpm) + elapsed * tpm / 60)
+        state['updated_at'] = now
+
+    # Reserve capacity or return how long to wait before it could be available
+    def _try_acquire(self, tokens: int) -> float:
+        now = self._clock()
+        with self.backend.transaction() as state:
+            self._refill(state, now)
+            blocked_for = state.get('blocked_until', 0) - now
+            if blocked_for > 0:
+                return blocked_for
+            rpm, tpm = self._limits(state)
+            tokens = min(tokens, tpm)
+            if state['requests'] >= 1 and state['tokens'] >= tokens:
+                state['requests'] -= 1
+                state['tokens'] -= tokens
+                return 0
+            return max((1 - state['requests']) * 60 / rpm, (tokens - state['tokens']) * 60 / tpm)
+
+    # Non-blocking acquire: reserves and returns 0, or returns the seconds to wait
+    def try_acquire(self, tokens: int = 0) -> float:
+        return self._try_acquire(tokens)
+
+    # Function to report the spare capacity (0-1) of the tighter bucket, 0 while blocked
+    def headroom(self) -> float:
+        now = self._clock()
+        with self.backend.transaction() as state:
+            self._refill(state, now)
+            if state.get('blocked_until', 0) > now:
+                return 0.0
+            rpm, tpm = self._limits(state)
+            return max(0.0, min(state['requests'] / rpm, state['tokens'] / tpm))
+
+    def acquire(self, tokens: int = 0, timeout: float = RATE_LIMIT_DEADLINE):
+        deadline = self._clock() + timeout
+        while True:
+            wait = self._try_acquire(tokens)
+            if wait <= 0:
+                return
+            if self._clock() + wait > deadline:
+                raise RateLimitTimeout(f"Rate limit budget unavailable within {timeout:.0f}s deadline")
+            time.sleep(wait)
+
+    async def acquire_async(self, tokens: int = 0, timeout: float = RATE_LIMIT_DEADLINE):
+        deadline = self._clock() + timeout
+        loop = asyncio.get_running_loop()
+        while True:
+            # The file backend blocks on flock and disk I/O, so keep it off the event loop
+            wait = await loop.run_in_executor(None, self._try_acquire, tokens)
+            if wait <= 0:
+                return
+            if self._clock() + wait > deadline:
+                raise RateLimitTimeout(f"Rate limit budget unavailable within {timeout:.0f}s deadline")
+            await asyncio.sleep(wait)
+
+    # Block every caller until the given number of seconds have passed (e.g. after a 429)
+    def penalize(self, seconds: float):
+        with self.backend.transaction() as state:
+            state['blocked_until'] = max(state.get('blocked_until', 0), self._clock() + seconds)
+
+    def update_from_headers(self, headers):
+        if not any(headers.get(f'x-ratelimit-{kind}-{name}') is not None
+                   for kind in ('limit', 'remaining') for name in ('requests', 'tokens')):
+            return
+        now = self._clock()
+        with self.backend.transaction() as state:
+            self._refill(state, now)
+            for name, limit_key, limit, remaining, reset in (
+                    ('requests', 'rpm', headers.get('x-ratelimit-limit-requests'),
+                     headers.get('x-ratelimit-remaining-requests'), headers.get('x-ratelimit-reset-requests')),
+                    ('tokens', 'tpm', headers.get('x-ratelimit-limit-tokens'),
+                     headers.get('x-ratelimit-remaining-tokens'), headers.get('x-ratelimit-reset-tokens'))):
+                if limit is not None and float(limit) > 0:
+                    state[limit_key] = float(limit)
+                    state[name] = min(state[name], float(limit))
+                if remaining is None:
+                    continue
+                # The server's count is authoritative, so it may raise the level as well as lower it
+                state[name] = float(remaining)
+                if state[name] > state.get(limit_key, getattr(self, limit_key)):
+                    state[limit_key] = state[name]
+                reset_after = parse_duration(reset)
+                if float(remaining) <= 0 and reset_after:
+                    state['blocked_until'] = max(state.get('blocked_until', 0), now + reset_after)
+
+    # Function to find how long a 429 response asks callers to back off
+    @staticmethod
+    def retry_after(headers) -> float:
+        if headers.get('retry-after'):
+            try:
+                return float(headers['retry-after'])
+            except ValueError:
+                pass
+        return max(parse_duration(headers.get('x-ratelimit-reset-requests')) or 0,
+                   parse_duration(headers.get('x-ratelimit-reset-tokens')) or 0) or None
+
+
+_default_limiter = None
+_default_limiter_lock = threading.Lock()
+
+
+# Function to get the process-wide limiter, backed by the shared state file when configured
+def get_limiter() -> RateLimiter:
+    global _default_limiter
+    with _default_limiter_lock:
+        if _default_limiter is None:
+            backend = FileBackend(RATE_LIMIT_STATE_PATH) if RATE_LIMIT_STATE_PATH else MemoryBackend()
+            _default_limiter = RateLimiter(backend=backend)
+        return _default_limiter
@@ -0,0 +1,206 @@
+import argparse
+import json
+import logging
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import cv2
+
+from batch_packer import BATCH_INSTRUCTION, pack_chunk, send_batch
+
+# Configuration
+REPLAY_FPS = float(os.getenv("REPLAY_FPS", 1))  # Frames sampled per second of footage
+REPLAY_CHUNK_SECONDS = float(os.getenv("REPLAY_CHUNK_SECONDS", 10))  # Footage per API request
+REPLAY_DECODE_WORKERS = int(os.getenv("REPLAY_DECODE_WORKERS", 0))  # 0 uses every core
+REPLAY_CONCURRENCY = int(os.getenv("REPLAY_CONCURRENCY", 8))  # Requests in flight; the rate limiter still applies
+VIDEO_EXTENSIONS = ('.mp4', '.mkv', '.avi', '.mov', '.m4v', '.webm', '.ts')
+
+
+# Function to expand files and directories into a sorted list of video files
+def list_videos(paths: list) -> list:
+    videos = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                videos.extend(os.path.join(root, name) for name in names if name.lower().endswith(VIDEO_EXTENSIONS))
+        else:
+            videos.append(path)
+    return sorted(os.path.abspath(video) for video in videos)
+
+
+# Function to split a video into (path, start, end) time ranges in seconds
+def plan_chunks(path: str, chunk_seconds: float = REPLAY_CHUNK_SECONDS) -> list:
+    cap = cv2.VideoCapture(path)
+    if not cap.isOpened():
+        raise ValueError(f"Could not open video: {path}")
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    frame_count = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+    cap.release()
+    if not fps or frame_count <= 0:
+        raise ValueError(f"Video has no usable duration: {path}")
+    duration = frame_count / fps
+    chunks = []
+    start = 0.0
+    while start < duration:
+        end = min(duration, start + chunk_seconds)
+        chunks.append((path, round(start, 3), round(end, 3)))
+        start = end
+    return chunks
+
+
+# Runs in a worker process: seek to the start of the range, grab every frame but
+# decode only those the sampling schedule selects, then encode and pack them
+# into one request. Returns (batch, timestamps of the packed frames), or None.
+def decode_chunk(path: str, start: float, end: float, fps: float, instruction: str):
+    cap = cv2.VideoCapture(path)
+    try:
+        cap.set(cv2.CAP_PROP_POS_MSEC, start * 1000)
+        frames, timestamps = [], []
+        next_due = start
+        while cap.grab():
+            timestamp = cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
+            if timestamp >= end:
+                break
+            if timestamp < next_due:
+                continue
+            ret, frame = cap.retrieve()
+            if not ret:
+                continue
+            frames.append(frame)
+            timestamps.append(round(timestamp, 3))
+            next_due += 1 / fps
+            if next_due <= timestamp:
+                next_due = timestamp + 1 / fps
+    finally:
+        cap.release()
+    if not frames:
+        return None
+    batch = pack_chunk(frames, instruction=instruction)
+    return batch, [timestamps[i] for i in batch.indices]
+
+
+# Function to read the chunks an earlier run already finished, so they are skipped
+def completed_chunks(output: str) -> set:
+    done = set()
+    if not os.path.exists(output):
+        return done
+    with open(output) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # A line cut short by the interruption
+            if not record.get('error'):
+                done.add((record['video'], record['start']))
+    return done
+
+
+# Offline backfill over recorded footage. Chunks are decoded and packed in
+# parallel worker processes and sent on a thread pool as fast as the shared rate
+# limiter allows. Each result is appended to a JSONL file as soon as it arrives
+# (in completion order; every line carries its video and time range), and a
+# rerun skips the chunks that already have a successful line.
+class ReplayJob:
+    def __init__(self, api_key: str, output: str, fps: float = REPLAY_FPS, chunk_seconds: float = REPLAY_CHUNK_SECONDS,
+                 decode_workers: int = REPLAY_DECODE_WORKERS, concurrency: int = REPLAY_CONCURRENCY,
+                 instruction: str = BATCH_INSTRUCTION):
+        self.api_key = api_key
+        self.output = output
+        self.fps = fps
+        self.chunk_seconds = chunk_seconds
+        self.decode_workers = decode_workers or os.cpu_count()
+        self.concurrency = concurrency
+        self.instruction = instruction
+        self.sent = 0
+        self.errors = 0
+        self.skipped = 0
+        self._write_lock = threading.Lock()
+
+    def _write(self, record: dict):
+        with self._write_lock:
+            with open(self.output, 'a') as f:
+                f.write(json.dumps(record) + "\n")
+            if record.get('error'):
+                self.errors += 1
+            else:
+                self.sent += 1
+
+    def _send(self, chunk, batch, timestamps):
+        path, start, end = chunk
+        # A backfill has no viewer waiting, so queue for budget as long as it takes
+        result = send_batch(batch, self.api_key, timeout=math.inf)
+        self._write({
+            'video': path, 'start': start, 'end': end, 'timestamps': timestamps,
+            'response': result.response, 'error': result.error, 'usage': result.usage, 'latency': result.latency,
+        })
+        logging.info(f"{path} [{start:.1f}s-{end:.1f}s]: {'error' if result.error else 'ok'} "
+                     f"in {result.latency:.2f}s ({self.sent} sent, {self.errors} errors)")
+
+    def run(self, paths: list):
+        done = completed_chunks(self.output)
+        chunks = []
+        for path in list_videos(paths):
+            try:
+                planned = plan_chunks(path, self.chunk_seconds)
+            except ValueError as e:
+                logging.error(str(e))
+                continue
+            chunks.extend(chunk for chunk in planned if (chunk[0], chunk[1]) not in done)
+        self.skipped = len(done)
+        logging.info(f"Replaying {len(chunks)} chunks ({len(done)} already done) into {self.output}")
+
+        pending = iter(chunks)
+        decoding, sending = {}, set()
+        context = multiprocessing.get_context("fork")
+        with ProcessPoolExecutor(max_workers=self.decode_workers, mp_context=context) as decoders, \
+                ThreadPoolExecutor(max_workers=self.concurrency) as senders:
+            while True:
+                # Keep the decoders busy without letting packed batches pile up in memory
+                while len(decoding) < 2 * self.decode_workers and len(sending) < 2 * self.concurrency:
+                    chunk = next(pending, None)
+                    if chunk is None:
+                        break
+                    future = decoders.submit(decode_chunk, *chunk, self.fps, self.instruction)
+                    decoding[future] = chunk
+                if not decoding and not sending:
+                    break
+                finished, _ = wait(set(decoding) | sending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    if future in sending:
+                        sending.discard(future)
+                        if future.exception():
+                            logging.error(f"Send failed: {future.exception()}")
+                        continue
+                    chunk = decoding.pop(future)
+                    try:
+                        decoded = future.result()
+                    except Exception as e:
+                        self._write({'video': chunk[0], 'start': chunk[1], 'end': chunk[2], 'error': str(e)})
+                        continue
+                    if decoded is None:
+                        self._write({'video': chunk[0], 'start': chunk[1], 'end': chunk[2], 'error': "No frames decoded"})
+                        continue
+                    sending.add(senders.submit(self._send, chunk, *decoded))
+        return {'sent': self.sent, 'errors': self.errors, 'skipped': self.skipped}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Analyze recorded footage faster than real time")
+    parser.add_argument('paths', nargs='+', help="Video files or directories of videos")
+    parser.add_argument('--output', default="replay.jsonl", help="JSONL results file; rerun to resume")
+    parser.add_argument('--fps', type=float, default=REPLAY_FPS, help="Frames sampled per second of footage")
+    parser.add_argument('--chunk-seconds', type=float, default=REPLAY_CHUNK_SECONDS)
+    parser.add_argument('--decode-workers', type=int, default=REPLAY_DECODE_WORKERS)
+    parser.add_argument('--concurrency', type=int, default=REPLAY_CONCURRENCY)
+    args = parser.parse_args()
+
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise ValueError("Missing OPENAI_API_KEY environment variable")
+    job = ReplayJob(api_key, args.output, fps=args.fps, chunk_seconds=args.chunk_seconds,
+                    decode_workers=args.decode_workers, concurrency=args.concurrency)
+    logging.info(f"Replay finished: {job.run(args.paths)}")
@@ -0,0 +1,60 @@
+import json
+import uuid
+
+DATA_URL_PREFIX = "data:image/jpeg;base64,"
+# Marks where an image goes in the serialized template; unique per process so it cannot occur in a prompt
+_SLOT = "\x00" + uuid.uuid4().hex + ":{}\x00"
+
+
+# Pre-serialized chat completions request body. The message structure (without
+# the images) is serialized once, split where each image goes, and the base64
+# images are spliced in as they are: base64 never needs JSON escaping, so the
+# image data is neither scanned nor copied. Pass the body itself as
+# requests' data= to send the pieces one after another with a Content-Length
+# (zero copies), or join() it for clients that need one bytes object (one copy).
+class RequestBody:
+    def __init__(self, template: dict, images_base64=()):
+        serialized = json.dumps(template).encode('utf-8')
+        parts = []
+        for i, image in enumerate(images_base64):
+            before, serialized = serialized.split(json.dumps(_SLOT.format(i))[1:-1].encode('utf-8'), 1)
+            parts.append(before)
+            # str -> bytes is a single memcpy for ASCII; bytes are used as they are
+            parts.append(image.encode('ascii') if isinstance(image, str) else image)
+        parts.append(serialized)
+        self.template = template
+        self.parts = parts
+
+    def __len__(self) -> int:
+        return sum(len(part) for part in self.parts)
+
+    def __iter__(self):
+        return iter(self.parts)
+
+    def join(self) -> bytes:
+        return b"".join(self.parts)
+
+    @property
+    def max_tokens(self) -> int:
+        return self.template.get("max_tokens", 0)
+
+    # Function to get the same body for another model; only the small template is re-serialized
+    def with_model(self, model: str):
+        if not model or model == self.template.get("model"):
+            return self
+        return RequestBody({**self.template, "model": model}, self.parts[1::2])
+
+
+# Function to build a single-turn request body: the text prompt, then the images in order
+def build_body(model: str, text: str, images_base64=(), max_tokens: int = 300, stream: bool = False) -> RequestBody:
+    content = [{"type": "text", "text": text}]
+    for i in range(len(images_base64)):
+        content.append({"type": "image_url", "image_url": {"url": DATA_URL_PREFIX + _SLOT.format(i)}})
+    template = {
+        "model": model,
+        "messages": [{"role": "user", "content": content}],
+        "max_tokens": max_tokens,
+    }
+    if stream:
+        template["stream"] = True
+    return RequestBody(template, images_base64)
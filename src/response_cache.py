@@ -0,0 +1,123 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from change_detector import perceptual_hash
+
+# Configuration
+CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", 300))  # seconds
+CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", 1024))
+CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH")  # Set to a file path to persist across restarts
+
+
+# Function to build a cache key from the frame's perceptual hash bucket and request parameters
+def cache_key(frame: np.ndarray, prompt: str, model: str, max_tokens: int) -> str:
+    bucket = f"{perceptual_hash(frame):016x}"
+    digest = hashlib.sha256(f"{prompt}\0{model}\0{max_tokens}".encode('utf-8')).hexdigest()
+    return f"{bucket}:{digest}"
+
+
+# sqlite-backed store so cached responses survive a restart
+class DiskBackend:
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)")
+        self._conn.commit()
+
+    def get(self, key: str):
+        row = self._conn.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+        if row:
+            self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+        return row
+
+    def set(self, key: str, value: str, created: float):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO responses (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+            (key, value, created, created))
+        self._conn.commit()
+
+    def delete(self, key: str):
+        self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+        self._conn.commit()
+
+    def trim(self, max_entries: int) -> int:
+        cursor = self._conn.execute(
+            "DELETE FROM responses WHERE key NOT IN "
+            "(SELECT key FROM responses ORDER BY accessed DESC LIMIT ?)", (max_entries,))
+        self._conn.commit()
+        return cursor.rowcount
+
+    def close(self):
+        self._conn.close()
+
+
+# In-memory LRU response cache with TTL expiry and an optional on-disk backend
+class ResponseCache:
+    def __init__(self, ttl: float = CACHE_TTL, max_entries: int = CACHE_MAX_ENTRIES, path: str = CACHE_PATH):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.backend = DiskBackend(path) if path else None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None and self.backend:
+                entry = self.backend.get(key)
+                if entry:
+                    self._entries[key] = entry
+            if entry is not None and now - entry[1] > self.ttl:
+                self._remove(key)
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: str, value: str):
+        created = time.time()
+        with self._lock:
+            self._entries[key] = (value, created)
+            self._entries.move_to_end(key)
+            if self.backend:
+                self.backend.set(key, value, created)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                if not self.backend:
+                    self.evictions += 1
+            if self.backend:
+                self.evictions += self.backend.trim(self.max_entries)
+
+    def _remove(self, key: str):
+        self._entries.pop(key, None)
+        if self.backend:
+            self.backend.delete(key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
@@ -1,15 +1,24 @@
 import gi
 import os
-import cv2
-import base64
 import requests
 import time
 import logging
 from threading import Thread
-from queue import Queue, Empty
+from queue import Empty
 import subprocess
 from gi.repository import Gst, GstRtspServer, GObject, GLib
 from dotenv import load_dotenv
+from change_detector import ChangeDetector
+from encode_pool import ENCODE_POOL_WORKERS, EncodePool
+from batch_packer import BATCH_INSTRUCTION, BATCH_RESPONSE_TOKENS, pack_chunk, send_batch
+from capture import create_engine
+from frame_buffer import FrameBuffer
+from frame_encoder import as_preview, encode_any, decode_jpeg
+from frame_governor import FRAME_GOVERNOR, FrameRateGovernor
+from metrics import start_metrics_server, trace
+from motion_roi import MOTION_ROI, MotionROI, crop_motion
+from temporal_context import CONTEXT_COMPACTION, CONTEXT_SESSIONS, ContextSession, api_summarizer
+from upstream_pool import get_pool
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -63,71 +72,83 @@ except requests.exceptions.RequestException as e:
     logging.critical(f"Failed to fetch ngrok tunnel URL: {e}")
     raise
 
-# Function to encode image to base64
+# Function to encode image to JPEG within the configured budget
 def encode_image(image):
-    _, buffer = cv2.imencode('.jpg', image)
-    return base64.b64encode(buffer).decode('utf-8')
+    encoded = encode_any(image)
+    logging.debug(f"Encoded {encoded.width}x{encoded.height} q{encoded.quality}: "
+                  f"{encoded.nbytes} bytes, ~{encoded.estimated_tokens} tokens")
+    return encoded
 
-# Function to send images to GPT-4 Vision API
-def send_images_to_gpt4(images):
-    if not images:
-        return
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {API_KEY}"
-    }
-    messages = [
-        {"role": "user", "content": {"type": "text", "text": "What’s in these images?"}}
-    ]
-    for image in images[:MAX_IMAGES]:  # Limit the number of images
-        messages.append({"role": "user", "content": {"type": "image_url", "image_url": f"data:image/jpeg;base64,{image}"}})
-    
-    payload = {
-        "model": "gpt-4-vision-preview",
-        "messages": messages,
-        "max_tokens": 300
-    }
-    
-    try:
-        response = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, json=payload)
-        response.raise_for_status()
-        logging.info(f"GPT-4 Vision API response: {response.json()}")
-    except requests.exceptions.RequestException as e:
-        logging.error(f"API request failed: {e}")
-        logging.error(f"Response: {response.text if response else 'No response'}")
+# Function to pack a chunk of frames into one multi-image request and send it to GPT-4 Vision API
+def send_images_to_gpt4(frames, encode_pool=None, session=None):
+    if not frames:
+        return None
+    instruction, response_tokens = session.next_request() if session else (BATCH_INSTRUCTION, BATCH_RESPONSE_TOKENS)
+    # JPEG frames from the GStreamer backend are already encoded, so they skip the pool
+    encode_many = encode_pool.encode_many if encode_pool and not isinstance(frames[0], bytes) else None
+    batch = pack_chunk(frames, instruction=instruction, max_images=MAX_IMAGES, encoder=encode_image,
+                       encode_many=encode_many, response_tokens=response_tokens)
+    logging.info(f"Sending frames {batch.indices} of {len(frames)} "
+                 f"({batch.nbytes} bytes, ~{batch.estimated_tokens} image tokens)")
+    result = send_batch(batch, API_KEY)
+    if result.error:
+        logging.error(f"API request failed after {result.latency:.2f}s: {result.error}")
+    else:
+        logging.info(f"GPT-4 Vision API response in {result.latency:.2f}s: {result.response}")
+        if session:
+            session.record(result.response, result.usage, result.latency)
+            logging.info(f"Context session: {session.stats()}")
+    return result
 
 # Function to capture frames from RTSP stream
-def capture_frames(queue):
+def capture_frames(queue, governor=None):
     logging.debug(f"Attempting to capture frames from {RTSP_STREAM_URL}")
-    cap = cv2.VideoCapture(RTSP_STREAM_URL)
-    if not cap.isOpened():
-        logging.error(f"Error: Could not open video stream from {RTSP_STREAM_URL}")
-        return
-    
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            logging.error("Error: Failed to read frame from stream")
-            break
-        logging.debug("Captured frame from stream")
+    engine = create_engine(RTSP_STREAM_URL, governor.fps if governor else FPS)
+    if governor:
+        governor.attach(engine)
+    for frame, timestamp in engine.frames():
+        logging.debug(f"Captured frame at {timestamp:.2f}s ({engine.stats()})")
         queue.put(frame)
-        time.sleep(1 / FPS)
-    cap.release()
 
 # Function to process frames and send to GPT-4 Vision API
-def process_frames(queue):
+def process_frames(queue, detector=None, encode_pool=None, governor=None):
+    detector = detector or ChangeDetector()
+    motion = MotionROI() if MOTION_ROI else None
+    session = None
+    if CONTEXT_SESSIONS:
+        summarize = api_summarizer(API_KEY) if CONTEXT_COMPACTION == "model" else None
+        session = ContextSession(BATCH_INSTRUCTION, summarize=summarize)
     while True:
-        images = []
+        frames = []
         start_time = time.time()
         while time.time() - start_time < CHUNK_DURATION:
             try:
-                frame = queue.get(timeout=1)
-                images.append(encode_image(frame))
+                frame, age = queue.get(timeout=1)
+                logging.debug(f"Dequeued frame aged {age:.2f}s")
+                if motion and isinstance(frame, bytes):
+                    # Cropping needs pixels, so motion ROI gives up the JPEG pass-through
+                    frame = decode_jpeg(frame)
+                roi = motion.update(frame) if motion else None
+                changed = detector.should_send(as_preview(frame))
+                if governor:
+                    governor.observe(changed)
+                if not changed:
+                    logging.debug("Skipping near-duplicate frame")
+                    continue
+                if roi:
+                    logging.debug(f"Cropping to motion region {roi}")
+                frames.append(crop_motion(frame, roi))
             except Empty:
                 pass
-        if images:
-            logging.info(f"Sending {len(images)} images to GPT-4 Vision API")
-            send_images_to_gpt4(images)
+        if frames:
+            logging.info(f"Packing {len(frames)} frames for GPT-4 Vision API ({detector.stats()}, {queue.stats()})")
+            with trace():
+                result = send_images_to_gpt4(frames, encode_pool, session)
+            if governor and not result.error:
+                governor.record(result.latency, result.usage.get('total_tokens', 0))
+                logging.info(f"Frame rate governor: {governor.stats()}")
+            if encode_pool:
+                logging.info(f"Encode pool: {encode_pool.stats()}")
 
 # RTSP Server class
 class RTSPServer:
@@ -142,18 +163,23 @@ class RTSPServer:
         logging.info("RTSP server is running at rtsp://localhost:8554/test")
 
 if __name__ == "__main__":
+    # Start encoder processes before any other threads exist
+    encode_pool = EncodePool() if ENCODE_POOL_WORKERS else None
+
     logging.info("Starting RTSP server...")
     server = RTSPServer()
+    start_metrics_server()
     
-    # Create a queue to hold frames
-    frame_queue = Queue()
+    # Create a bounded buffer to hold frames
+    frame_queue = FrameBuffer()
+    governor = FrameRateGovernor(FPS, "rtsp", headroom=get_pool().headroom) if FRAME_GOVERNOR else None
     
     # Start frame capture thread
-    capture_thread = Thread(target=capture_frames, args=(frame_queue,))
+    capture_thread = Thread(target=capture_frames, args=(frame_queue, governor))
     capture_thread.start()
     
     # Start frame processing thread
-    process_thread = Thread(target=process_frames, args=(frame_queue,))
+    process_thread = Thread(target=process_frames, args=(frame_queue, None, encode_pool, governor))
     process_thread.start()
     
     # Run the main loop
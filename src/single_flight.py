@@ -0,0 +1,64 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+
+from metrics import REGISTRY
+
+COALESCED = REGISTRY.counter(
+    "requests_coalesced_total", "Requests answered by an identical in-flight request", labelnames=("group",))
+
+
+# In-flight request deduplication: the first caller for a key runs fn, and
+# callers that arrive with the same key while it is running wait on the same
+# future and get the same result (or exception). Nothing is kept once the call
+# finishes; pair it with ResponseCache for answers that outlive the request.
+class SingleFlight:
+    def __init__(self, name: str = "default"):
+        self.name = name
+        self.calls = 0
+        self.coalesced = 0
+        self._futures = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn, *args, **kwargs):
+        with self._lock:
+            future = self._futures.get(key)
+            leader = future is None
+            if leader:
+                future = self._futures[key] = Future()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+        if not leader:
+            COALESCED.inc(self.name)
+            return future.result()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._futures[key]
+        return future.result()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'calls': self.calls, 'coalesced': self.coalesced, 'in_flight': len(self._futures)}
+
+
+# asyncio variant: fn is a coroutine function. The upstream call runs in its own
+# task, so a follower (or the leader) being cancelled does not cancel it for the others.
+class AsyncSingleFlight(SingleFlight):
+    async def do(self, key: str, fn, *args, **kwargs):
+        task = self._futures.get(key)
+        if task is None:
+            task = self._futures[key] = asyncio.ensure_future(fn(*args, **kwargs))
+            task.add_done_callback(lambda _: self._futures.pop(key, None))
+            self.calls += 1
+        else:
+            self.coalesced += 1
+            COALESCED.inc(self.name)
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {'calls': self.calls, 'coalesced': self.coalesced, 'in_flight': len(self._futures)}
@@ -0,0 +1,291 @@
+import json
+import logging
+import os
+import threading
+import time
+from queue import Empty
+
+from batch_packer import BATCH_RESPONSE_TOKENS, pack_chunk, send_batch
+from capture import create_engine
+from change_detector import ChangeDetector
+from encode_pool import ENCODE_POOL_WORKERS, EncodePool
+from frame_buffer import FrameBuffer
+from frame_encoder import as_preview, decode_jpeg
+from frame_governor import FRAME_GOVERNOR, GOVERNOR_MAX_FPS, GOVERNOR_MIN_FPS, FrameRateGovernor
+from metrics import start_metrics_server, trace
+from motion_roi import MOTION_ROI, MotionROI, crop_motion
+from temporal_context import CONTEXT_COMPACTION, CONTEXT_SESSIONS, ContextSession, api_summarizer
+from upstream_pool import get_pool
+
+# Configuration
+STREAMS_CONFIG = os.getenv("STREAMS_CONFIG", "streams.json")
+STREAM_WORKERS = int(os.getenv("STREAM_WORKERS", 4))
+STREAM_PROMPT = os.getenv("STREAM_PROMPT", "What’s in this image?")
+STATS_INTERVAL = 30  # seconds between stats log lines / config reloads
+RECONNECT_DELAY = 5  # seconds
+
+# Example streams.json:
+# {
+#     "workers": 4,
+#     "streams": [
+#         {"name": "lobby", "url": "rtsp://camera-1/stream", "fps": 1},
+#         {"name": "dock", "url": "rtmp://localhost/live/dock", "fps": 0.5, "prompt": "Is a truck docked?"},
+#         {"name": "gate", "url": "rtsp://camera-2/stream", "fps": 1, "min_fps": 0.2, "max_fps": 4}
+#     ]
+# }
+# With FRAME_GOVERNOR=true, "fps" is the starting rate and the governor moves it
+# between "min_fps" and "max_fps" (GOVERNOR_MIN_FPS/GOVERNOR_MAX_FPS by default).
+
+
+# Function to load the stream list from a JSON config file
+def load_config(path: str = STREAMS_CONFIG) -> dict:
+    with open(path) as f:
+        config = json.load(f)
+    for stream in config.get('streams', []):
+        if 'name' not in stream or 'url' not in stream:
+            raise ValueError(f"Stream entry needs a name and url: {stream}")
+    return config
+
+
+# Per-stream capture state: its own capture thread, bounded buffer and change gate
+class StreamWorker:
+    def __init__(self, name: str, url: str, fps: float = 1, prompt: str = STREAM_PROMPT, on_frame=None,
+                 session: ContextSession = None, min_fps: float = GOVERNOR_MIN_FPS,
+                 max_fps: float = GOVERNOR_MAX_FPS):
+        self.name = name
+        self.url = url
+        self.fps = fps
+        self.prompt = prompt
+        self.engine = create_engine(url, fps)
+        self.buffer = FrameBuffer(policy="latest_only")
+        self.detector = ChangeDetector()
+        self.motion = MotionROI() if MOTION_ROI else None
+        self.session = session
+        self.governor = (FrameRateGovernor(fps, name, self.engine, min_fps, max_fps, headroom=get_pool().headroom)
+                         if FRAME_GOVERNOR else None)
+        self.in_flight = 0
+        self.sent = 0
+        self.errors = 0
+        self.total_latency = 0.0
+        self.last_latency = 0.0
+        self.started = time.monotonic()
+        self._on_frame = on_frame
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._capture, name=f"capture-{name}", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self.engine.stop()
+
+    def _capture(self):
+        while not self._stopped.is_set():
+            for frame, timestamp in self.engine.frames():
+                self.buffer.put(frame)
+                if self._on_frame:
+                    self._on_frame()
+            if not self._stopped.wait(RECONNECT_DELAY):
+                logging.warning(f"[{self.name}] Stream ended, reconnecting to {self.url}")
+
+    def record(self, latency: float, error: bool):
+        self.sent += 1
+        self.errors += int(error)
+        self.total_latency += latency
+        self.last_latency = latency
+
+    def stats(self) -> dict:
+        elapsed = time.monotonic() - self.started
+        buffer_stats = self.buffer.stats()
+        return {
+            'fps': self.engine.decoded / elapsed if elapsed else 0.0,
+            'lag': self.engine.lag,
+            'decoded': self.engine.decoded,
+            'dropped': buffer_stats['frames_dropped'] + self.detector.stats()['frames_skipped'],
+            'frame_age': buffer_stats['last_age'],
+            'sent': self.sent,
+            'errors': self.errors,
+            'api_latency': self.last_latency,
+            'api_latency_avg': self.total_latency / self.sent if self.sent else 0.0,
+            **({'motion': self.motion.stats()} if self.motion else {}),
+            **({'context': self.session.stats()} if self.session else {}),
+            **({'governor': self.governor.stats()} if self.governor else {}),
+        }
+
+
+# Runs many streams in one process. Capture is per stream; encoding and API calls
+# run on a shared worker pool that serves streams round-robin, one frame in
+# flight per stream, so a busy camera cannot starve the others.
+class StreamManager:
+    def __init__(self, api_key: str, workers: int = STREAM_WORKERS, on_result=None, encode_pool=None):
+        self.api_key = api_key
+        self.workers = workers
+        self.encode_pool = encode_pool
+        self.streams = {}
+        self._on_result = on_result or self._log_result
+        self._order = []
+        self._next = 0
+        self._work_available = threading.Condition()
+        self._stopped = threading.Event()
+        self._threads = []
+
+    def add_stream(self, name: str, url: str, fps: float = 1, prompt: str = STREAM_PROMPT,
+                   min_fps: float = GOVERNOR_MIN_FPS, max_fps: float = GOVERNOR_MAX_FPS):
+        with self._work_available:
+            if name in self.streams:
+                raise ValueError(f"Stream {name} already exists")
+            session = self._create_session(prompt) if CONTEXT_SESSIONS else None
+            stream = StreamWorker(name, url, fps, prompt, on_frame=self._notify, session=session,
+                                  min_fps=min_fps, max_fps=max_fps)
+            self.streams[name] = stream
+            self._order.append(name)
+        stream.start()
+        logging.info(f"[{name}] Added stream {url} at {fps} fps")
+
+    def _create_session(self, prompt: str) -> ContextSession:
+        summarize = api_summarizer(self.api_key) if CONTEXT_COMPACTION == "model" else None
+        return ContextSession(prompt, summarize=summarize)
+
+    def remove_stream(self, name: str):
+        with self._work_available:
+            stream = self.streams.pop(name)
+            self._order.remove(name)
+        stream.stop()
+        logging.info(f"[{name}] Removed stream")
+
+    # Add, remove or restart streams so the running set matches the config
+    def apply_config(self, config: dict):
+        wanted = {stream['name']: stream for stream in config.get('streams', [])}
+        for name in list(self.streams):
+            current = self.streams[name]
+            entry = wanted.get(name)
+            if entry is None or entry['url'] != current.url or entry.get('fps', 1) != current.fps:
+                self.remove_stream(name)
+        for name, entry in wanted.items():
+            if name not in self.streams:
+                self.add_stream(name, entry['url'], entry.get('fps', 1), entry.get('prompt', STREAM_PROMPT),
+                                entry.get('min_fps', GOVERNOR_MIN_FPS), entry.get('max_fps', GOVERNOR_MAX_FPS))
+
+    def _notify(self):
+        with self._work_available:
+            self._work_available.notify()
+
+    # Round-robin over streams, taking a frame from the first one that has work
+    def _next_job(self):
+        with self._work_available:
+            while not self._stopped.is_set():
+                for _ in range(len(self._order)):
+                    self._next = self._next % len(self._order)
+                    stream = self.streams[self._order[self._next]]
+                    self._next += 1
+                    if stream.in_flight:
+                        continue
+                    try:
+                        frame, age = stream.buffer.get(timeout=0)
+                    except Empty:
+                        continue
+                    stream.in_flight += 1
+                    return stream, frame
+                self._work_available.wait(timeout=1)
+        return None, None
+
+    def _work(self):
+        while True:
+            stream, frame = self._next_job()
+            if stream is None:
+                return
+            try:
+                # The background model sees every dequeued frame, sent or not
+                if stream.motion and isinstance(frame, bytes):
+                    frame = decode_jpeg(frame)
+                roi = stream.motion.update(frame) if stream.motion else None
+                changed = stream.detector.should_send(as_preview(frame))
+                if stream.governor:
+                    stream.governor.observe(changed)
+                if changed:
+                    frame = crop_motion(frame, roi)
+                    instruction, response_tokens = (stream.session.next_request() if stream.session
+                                                    else (stream.prompt, BATCH_RESPONSE_TOKENS))
+                    with trace():
+                        batch = pack_chunk([frame], instruction=instruction, response_tokens=response_tokens,
+                                           encode_many=self.encode_pool.encode_many
+                                           if self.encode_pool and not isinstance(frame, bytes) else None)
+                        result = send_batch(batch, self.api_key)
+                    stream.record(result.latency, bool(result.error))
+                    if stream.governor and not result.error:
+                        stream.governor.record(result.latency,
+                                               result.usage.get('total_tokens', batch.estimated_tokens))
+                    if stream.session and not result.error:
+                        stream.session.record(result.response, result.usage, result.latency)
+                    self._on_result(stream.name, result)
+            except Exception as e:
+                logging.error(f"[{stream.name}] Processing failed: {e}")
+                stream.record(0.0, True)
+            finally:
+                with self._work_available:
+                    stream.in_flight -= 1
+                    self._work_available.notify()
+
+    @staticmethod
+    def _log_result(name: str, result):
+        if result.error:
+            logging.error(f"[{name}] API request failed after {result.latency:.2f}s: {result.error}")
+        else:
+            logging.info(f"[{name}] Response in {result.latency:.2f}s: {result.response}")
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"stream-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stopped.set()
+        for name in list(self.streams):
+            self.remove_stream(name)
+        self._notify_all()
+
+    def _notify_all(self):
+        with self._work_available:
+            self._work_available.notify_all()
+
+    def stats(self) -> dict:
+        with self._work_available:
+            streams = dict(self.streams)
+        return {name: stream.stats() for name, stream in streams.items()}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise ValueError("Missing OPENAI_API_KEY environment variable")
+
+    config = load_config()
+    # Start encoder processes before any capture threads exist
+    encode_pool = EncodePool() if ENCODE_POOL_WORKERS else None
+    manager = StreamManager(api_key, workers=config.get('workers', STREAM_WORKERS), encode_pool=encode_pool)
+    manager.start()
+    manager.apply_config(config)
+    start_metrics_server()
+
+    # Edits to the config file add or remove streams without a restart
+    config_mtime = os.path.getmtime(STREAMS_CONFIG)
+    try:
+        while True:
+            time.sleep(STATS_INTERVAL)
+            logging.info(f"Stream stats: {manager.stats()}")
+            if encode_pool:
+                logging.info(f"Encode pool: {encode_pool.stats()}")
+            if os.path.getmtime(STREAMS_CONFIG) != config_mtime:
+                config_mtime = os.path.getmtime(STREAMS_CONFIG)
+                logging.info(f"Reloading {STREAMS_CONFIG}")
+                try:
+                    manager.apply_config(load_config())
+                except ValueError as e:
+                    logging.error(f"Ignoring invalid config: {e}")
+    except KeyboardInterrupt:
+        manager.stop()
+        if encode_pool:
+            encode_pool.close()
@@ -0,0 +1,159 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from batch_packer import BATCH_RESPONSE_TOKENS, Batch, build_batch_payload, send_batch
+
+# Configuration
+CONTEXT_SESSIONS = os.getenv("CONTEXT_SESSIONS", "false").lower() == "true"  # Send deltas against a rolling summary
+CONTEXT_SUMMARY_CHARS = int(os.getenv("CONTEXT_SUMMARY_CHARS", 1200))  # Compact once the context grows past this
+CONTEXT_COMPACT_EVERY = int(os.getenv("CONTEXT_COMPACT_EVERY", 5))  # ... or after this many change reports
+CONTEXT_COMPACTION = os.getenv("CONTEXT_COMPACTION", "local")  # "local" (trim) or "model" (ask the API to merge)
+CONTEXT_DELTA_TOKENS = int(os.getenv("CONTEXT_DELTA_TOKENS", 150))  # Completion cap for "what changed" replies
+CONTEXT_USAGE_WINDOW = float(os.getenv("CONTEXT_USAGE_WINDOW", 300))  # seconds of usage kept for stats
+
+NO_CHANGE = "No change."
+DELTA_INSTRUCTION = (
+    "Scene so far: {summary}\n\n"
+    "The images are new frames from the same video stream, in chronological order. "
+    "Describe only what changed compared with the scene so far, in a few short sentences. "
+    f"If nothing meaningful changed, reply exactly \"{NO_CHANGE}\""
+)
+COMPACT_INSTRUCTION = (
+    "Merge this description of a video scene and the later changes into one description of the "
+    "scene as it is now, in under {chars} characters.\n\nScene: {summary}\n\nChanges, oldest first:\n{changes}"
+)
+
+
+# Function to make a summarizer that compacts context with a text-only API call
+def api_summarizer(api_key: str, max_tokens: int = BATCH_RESPONSE_TOKENS):
+    def summarize(text: str) -> str:
+        result = send_batch(Batch(build_batch_payload([], text, max_tokens), [], 0, 0), api_key)
+        if result.error:
+            raise ValueError(result.error)
+        return result.response
+    return summarize
+
+
+# Per-stream conversation state. The first request describes the scene in full;
+# later requests carry a compact summary plus only the new frames and ask what
+# changed, so the model stops re-describing the static scene on every call.
+# Change reports accumulate until the context passes summary_chars or
+# compact_every reports, then they are folded into the summary, either locally
+# (keep the scene description and the most recent changes that fit) or by the model.
+class ContextSession:
+    def __init__(self, instruction: str, summary_chars: int = CONTEXT_SUMMARY_CHARS,
+                 compact_every: int = CONTEXT_COMPACT_EVERY, compaction: str = CONTEXT_COMPACTION,
+                 summarize=None, delta_tokens: int = CONTEXT_DELTA_TOKENS, window: float = CONTEXT_USAGE_WINDOW):
+        if compaction not in ("local", "model"):
+            raise ValueError(f"Unknown compaction method: {compaction}")
+        if compaction == "model" and summarize is None:
+            raise ValueError("Model compaction needs a summarize function")
+        self.instruction = instruction
+        self.summary_chars = summary_chars
+        self.compact_every = compact_every
+        self.compaction = compaction
+        self.delta_tokens = delta_tokens
+        self.window = window
+        self.requests = 0
+        self.unchanged = 0
+        self.compactions = 0
+        self._summarize = summarize
+        self._scene = None
+        self._changes = []
+        self._usage = deque()  # (time, prompt_tokens, completion_tokens, latency)
+        self._lock = threading.Lock()
+
+    @property
+    def summary(self) -> str:
+        with self._lock:
+            return self._summary()
+
+    def _summary(self) -> str:
+        if not self._changes:
+            return self._scene
+        return f"{self._scene}\nLater changes: " + " ".join(self._changes)
+
+    # Function to return (instruction, completion max_tokens) for the next request
+    def next_request(self):
+        with self._lock:
+            if self._scene is None:
+                return self.instruction, BATCH_RESPONSE_TOKENS
+            return DELTA_INSTRUCTION.format(summary=self._summary()), self.delta_tokens
+
+    def record(self, response: str, usage: dict = None, latency: float = 0.0):
+        usage = usage or {}
+        now = time.monotonic()
+        with self._lock:
+            self.requests += 1
+            self._usage.append((now, usage.get('prompt_tokens', 0), usage.get('completion_tokens', 0), latency))
+            while self._usage and self._usage[0][0] < now - self.window:
+                self._usage.popleft()
+            if self._scene is None:
+                self._scene = response.strip()
+                return
+            if response.strip().rstrip('.').lower() == NO_CHANGE.rstrip('.').lower():
+                self.unchanged += 1
+                return
+            self._changes.append(response.strip())
+            due = len(self._changes) >= self.compact_every or len(self._summary()) > self.summary_chars
+        if due:
+            self.compact()
+
+    def compact(self):
+        with self._lock:
+            scene, changes = self._scene, list(self._changes)
+        if not changes:
+            return
+        summary = None
+        if self.compaction == "model":
+            try:
+                summary = self._summarize(COMPACT_INSTRUCTION.format(
+                    chars=self.summary_chars, summary=scene, changes="\n".join(f"- {c}" for c in changes)))
+            except Exception as e:
+                logging.warning(f"Context compaction failed, trimming locally: {e}")
+        with self._lock:
+            # Changes recorded while the model was summarizing stay pending
+            pending = self._changes[len(changes):]
+            if summary:
+                self._scene, self._changes = summary.strip()[:self.summary_chars], pending
+            else:
+                self._scene, self._changes = self._trim(scene, changes + pending)
+            self.compactions += 1
+
+    # Keep at most half the budget for the scene and fill the rest with the newest
+    # changes, dropping at least half of them so compaction is not due again at once
+    def _trim(self, scene: str, changes: list):
+        scene = scene[:self.summary_chars // 2]
+        budget = self.summary_chars - len(scene)
+        kept = []
+        for change in reversed(changes[-(self.compact_every // 2):] if self.compact_every > 1 else []):
+            budget -= len(change) + 1
+            if budget < 0:
+                break
+            kept.append(change)
+        return scene, kept[::-1]
+
+    def reset(self):
+        with self._lock:
+            self._scene = None
+            self._changes = []
+
+    def stats(self) -> dict:
+        with self._lock:
+            usage = list(self._usage)
+            summary_chars = len(self._summary() or "")
+        count = len(usage)
+        return {
+            'requests': self.requests,
+            'unchanged': self.unchanged,
+            'compactions': self.compactions,
+            'summary_chars': summary_chars,
+            'window_requests': count,
+            'window_prompt_tokens': sum(u[1] for u in usage),
+            'window_completion_tokens': sum(u[2] for u in usage),
+            'avg_tokens': sum(u[1] + u[2] for u in usage) / count if count else 0.0,
+            'avg_latency': sum(u[3] for u in usage) / count if count else 0.0,
+        }
@@ -0,0 +1,274 @@
+import json
+import os
+import random
+import re
+import threading
+import time
+
+import requests
+
+from metrics import REGISTRY
+from rate_limiter import (RATE_LIMIT_DEADLINE, RATE_LIMIT_RPM, RATE_LIMIT_STATE_PATH, RATE_LIMIT_TPM, FileBackend,
+                          MemoryBackend, RateLimiter, RateLimitTimeout, get_limiter)
+from request_body import RequestBody
+
+# Configuration
+API_URL = os.getenv("OPENAI_API_URL", "https://api.openai.com/v1/chat/completions")
+# JSON list of {"name", "url", "api_key", "model", "rpm", "tpm"}, inline or as a file path.
+# Unset means one upstream at OPENAI_API_URL using the caller's key.
+UPSTREAMS = os.getenv("UPSTREAMS", "")
+DEFAULT_API_KEY = os.getenv("OPENAI_API_KEY")  # Sent to upstreams without a key of their own
+UPSTREAM_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", 60))  # seconds per attempt
+CIRCUIT_FAILURES = int(os.getenv("CIRCUIT_FAILURES", 3))  # Consecutive failures that open the circuit
+CIRCUIT_COOLDOWN = float(os.getenv("CIRCUIT_COOLDOWN", 30))  # seconds before a trial request, doubled per failed trial
+MAX_COOLDOWN = 300
+LATENCY_ALPHA = 0.2  # Weight of the newest response in the latency average
+
+REQUESTS = REGISTRY.counter("upstream_requests_total", "Upstream API attempts by outcome",
+                            labelnames=("upstream", "outcome"))
+CIRCUIT_OPEN = REGISTRY.gauge("upstream_circuit_open", "1 while the upstream's circuit is open",
+                              labelnames=("upstream",))
+
+
+class UpstreamUnavailable(Exception):
+    pass
+
+
+# One (endpoint, key, model) with its own rate-limit budget, latency average and
+# circuit breaker. After CIRCUIT_FAILURES consecutive failures (errors, timeouts,
+# 5xx, rejected key or URL) the circuit opens and the upstream gets no traffic
+# until the cooldown has passed; then a single trial request decides whether it
+# closes again. A lone upstream has nowhere to fail over to, so the pool turns
+# its breaker off.
+class Upstream:
+    def __init__(self, name: str, url: str, api_key: str = None, model: str = None, limiter: RateLimiter = None,
+                 clock=time.time):
+        self.name = name
+        self.url = url
+        self.api_key = api_key
+        self.model = model
+        self.limiter = limiter or RateLimiter()
+        self.breaker = True
+        self.latency = 1.0
+        self.failures = 0
+        self.cooldown = CIRCUIT_COOLDOWN
+        self.open_until = 0.0
+        self.trial_in_flight = False
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    def _tripped(self) -> bool:
+        return self.breaker and self.failures >= CIRCUIT_FAILURES
+
+    # Function to check the circuit and claim a request slot. In the half-open
+    # state only one trial request goes through
+    def allow(self) -> bool:
+        with self._lock:
+            if not self._tripped():
+                return True
+            if self.trial_in_flight or self._clock() < self.open_until:
+                return False
+            self.trial_in_flight = True
+            return True
+
+    # Function to hand back a slot claimed by allow() that was not used
+    def release(self):
+        with self._lock:
+            self.trial_in_flight = False
+
+    # Prefer spare rate-limit budget and low recent latency
+    def score(self) -> float:
+        return (self.limiter.headroom() + 0.05) / max(self.latency, 0.05)
+
+    def record_success(self, latency: float):
+        with self._lock:
+            self.latency += LATENCY_ALPHA * (latency - self.latency)
+            self.failures = 0
+            self.cooldown = CIRCUIT_COOLDOWN
+            self.trial_in_flight = False
+        REQUESTS.inc(self.name, "ok")
+        CIRCUIT_OPEN.set(self.name, value=0)
+
+    def record_failure(self, outcome: str = "error"):
+        with self._lock:
+            if self.trial_in_flight:
+                self.cooldown = min(MAX_COOLDOWN, self.cooldown * 2)
+            self.failures += 1
+            self.trial_in_flight = False
+            opened = self._tripped()
+            if opened:
+                self.open_until = self._clock() + self.cooldown
+        REQUESTS.inc(self.name, outcome)
+        CIRCUIT_OPEN.set(self.name, value=int(opened))
+
+    # A 429 is back-pressure, not ill health: it throttles the upstream but leaves the circuit alone
+    def record_throttled(self, retry_after: float):
+        self.limiter.penalize(retry_after or 1)
+        self.release()
+        REQUESTS.inc(self.name, "throttled")
+
+    def stats(self) -> dict:
+        return {
+            'url': self.url,
+            'model': self.model,
+            'latency': self.latency,
+            'headroom': self.limiter.headroom(),
+            'failures': self.failures,
+            'circuit': 'open' if self._tripped() else 'closed',
+        }
+
+
+# Routes each request to an upstream picked at random, weighted by score(), among
+# those whose circuit allows traffic and whose rate limiter can admit the request
+# now. A failed attempt (network error, 5xx, 401/403/404 or 429) is retried on a
+# different upstream; when every upstream has been tried, the last response is
+# returned so callers keep their usual status-code handling.
+#
+# Keys: upstreams configured with an api_key bill that key. A caller's own key
+# (anything other than the server's OPENAI_API_KEY, e.g. one typed into the
+# browser) is only ever sent to upstreams without a configured key, so it is
+# never silently swapped for the server's; the server's key fills in for
+# keyless upstreams otherwise.
+class UpstreamPool:
+    def __init__(self, upstreams: list, default_key: str = DEFAULT_API_KEY):
+        if not upstreams:
+            raise ValueError("Upstream pool needs at least one upstream")
+        self.upstreams = upstreams
+        self.default_key = default_key
+        for upstream in upstreams:
+            upstream.breaker = len(upstreams) > 1
+
+    def _candidates(self, eligible: list) -> list:
+        ranked = [(random.random() ** (1 / upstream.score()), upstream) for upstream in eligible]
+        return [upstream for _, upstream in sorted(ranked, key=lambda pair: pair[0], reverse=True)]
+
+    # Function to pick an upstream and reserve its budget. Returns (upstream, 0),
+    # (None, seconds to wait for budget), or (None, None) when every circuit is open
+    def _choose(self, tokens: int, eligible: list):
+        soonest = None
+        for upstream in self._candidates(eligible):
+            if not upstream.allow():
+                continue
+            wait = upstream.limiter.try_acquire(tokens)
+            if wait <= 0:
+                return upstream, 0
+            upstream.release()
+            soonest = wait if soonest is None else min(soonest, wait)
+        return None, soonest
+
+    # Function to find the upstreams a request may use, and the key each should send
+    def _eligible(self, api_key: str):
+        if api_key and api_key != self.default_key:
+            eligible = [upstream for upstream in self.upstreams if not upstream.api_key]
+            if not eligible:
+                raise ValueError("This server uses its own API keys; leave the API key empty.")
+            return eligible, api_key
+        return list(self.upstreams), api_key or self.default_key
+
+    def post(self, body: RequestBody, api_key: str = None, tokens: int = 0, stream: bool = False,
+             timeout: float = RATE_LIMIT_DEADLINE, deadline: float = None) -> requests.Response:
+        # Callers that retry across several posts pass their own absolute deadline
+        deadline = deadline or time.time() + timeout
+        remaining, fallback_key = self._eligible(api_key)
+        caller_key = fallback_key != self.default_key
+        last_response = last_error = None
+        tokens += body.max_tokens
+        # Each upstream gets at most one attempt; waiting for budget counts against the deadline
+        while remaining:
+            upstream, wait = self._choose(tokens, remaining)
+            if upstream is None:
+                if wait is None:
+                    if last_response is not None:
+                        return last_response
+                    if last_error is not None:
+                        raise last_error
+                    raise UpstreamUnavailable("No upstream available: every circuit is open")
+                if time.time() + wait > deadline:
+                    raise RateLimitTimeout(f"Rate limit budget unavailable within {timeout:.0f}s deadline")
+                time.sleep(wait)
+                continue
+            remaining.remove(upstream)
+            headers = {"Content-Type": "application/json",
+                       "Authorization": f"Bearer {upstream.api_key or fallback_key}"}
+            try:
+                response = requests.post(upstream.url, headers=headers, data=body.with_model(upstream.model),
+                                         stream=stream, timeout=UPSTREAM_TIMEOUT)
+            except requests.exceptions.RequestException as e:
+                upstream.record_failure("timeout" if isinstance(e, requests.exceptions.Timeout) else "error")
+                last_response, last_error = None, e
+                continue
+            upstream.limiter.update_from_headers(response.headers)
+            last_response, last_error = response, None
+            if response.status_code == 429:
+                upstream.record_throttled(upstream.limiter.retry_after(response.headers) or parse_wait_time(response.text))
+            elif response.status_code >= 500:
+                upstream.record_failure("server_error")
+            elif response.status_code in (401, 403) and caller_key:
+                # The caller's key was refused; that says nothing about the upstream
+                upstream.release()
+                return response
+            elif response.status_code in (401, 403, 404):
+                # A revoked key or wrong URL answers fast, but the upstream is unusable
+                upstream.record_failure("rejected")
+            else:
+                upstream.record_success(response.elapsed.total_seconds())
+                return response
+            if stream and remaining:
+                response.close()
+        if last_response is not None:
+            return last_response
+        raise last_error
+
+    # Function to report the spare capacity (0-1) of the best upstream with a closed circuit
+    def headroom(self) -> float:
+        return max([upstream.limiter.headroom() for upstream in self.upstreams
+                    if not upstream._tripped()] or [0.0])
+
+    def stats(self) -> dict:
+        return {upstream.name: upstream.stats() for upstream in self.upstreams}
+
+
+# Function to read the back-off from a 429 message ("Please try again in 1m2.5s")
+def parse_wait_time(error_message: str) -> float:
+    match = re.search(r"try again in (\d+m)?(\d+\.\ds)?", error_message)
+    if match:
+        minutes = match.group(1)
+        seconds = match.group(2)
+
+        total_wait_time = 0
+        if minutes:
+            total_wait_time += int(minutes[:-1]) * 60  # Convert minutes to seconds
+        if seconds:
+            total_wait_time += float(seconds[:-1])  # Add seconds
+
+        return total_wait_time
+    return None
+
+
+# Function to read upstream entries from UPSTREAMS (inline JSON or a file path)
+def load_upstreams(spec: str = UPSTREAMS) -> list:
+    if not spec:
+        return [Upstream("default", API_URL, limiter=get_limiter())]
+    if os.path.exists(spec):
+        with open(spec) as f:
+            spec = f.read()
+    upstreams = []
+    for i, entry in enumerate(json.loads(spec)):
+        name = entry.get('name', f"upstream-{i}")
+        # Each upstream keeps its own budget, shared across processes like the default limiter
+        backend = FileBackend(f"{RATE_LIMIT_STATE_PATH}.{name}") if RATE_LIMIT_STATE_PATH else MemoryBackend()
+        limiter = RateLimiter(entry.get('rpm', RATE_LIMIT_RPM), entry.get('tpm', RATE_LIMIT_TPM), backend)
+        upstreams.append(Upstream(name, entry.get('url', API_URL), entry.get('api_key'), entry.get('model'), limiter))
+    return upstreams
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_pool() -> UpstreamPool:
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = UpstreamPool(load_upstreams())
+        return _default_pool
@@ -1,35 +1,58 @@
-import cv2
-import base64
-import requests
-import numpy as np
+import asyncio
 import os
 
+import frame_encoder
+from rate_limiter import RateLimitTimeout, get_limiter
+from response_cache import cache_key
+from single_flight import AsyncSingleFlight
+from vision_client import VISION_MODEL, AsyncVisionClient, VisionAPIError
+
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
 RTSP_STREAM_URL = os.getenv('RTSP_STREAM_URL')
 FRAME_RATE = int(os.getenv('FRAME_RATE', 1))
+PROMPT = os.getenv('VISION_PROMPT', "What’s in this image?")
+
+in_flight = AsyncSingleFlight("fastapi")
+
+
+def create_client() -> AsyncVisionClient:
+    return AsyncVisionClient(api_key=OPENAI_API_KEY, limiter=get_limiter())
+
+
+def encode_frame(frame_data):
+    try:
+        return frame_encoder.encode_image_bytes(frame_data).base64_bytes
+    except ValueError:
+        return None
+
+
+# Function to key a frame for in-flight deduplication; None if it does not decode
+def frame_key(frame_data, prompt: str):
+    try:
+        return cache_key(frame_encoder.decode_preview(frame_data), prompt, VISION_MODEL, 0)
+    except ValueError:
+        return None
+
+
+async def prompt_frame(frame_data, client: AsyncVisionClient, prompt: str, timeout: float = None):
+    # Keep the CPU-bound transcode off the event loop
+    loop = asyncio.get_running_loop()
+    base64_image = await loop.run_in_executor(None, encode_frame, frame_data)
+    if base64_image is None:
+        return "Error encoding frame."
+    return await client.prompt_image(base64_image, prompt, timeout=timeout)
+
 
-async def process_frame(frame_data):
-    nparr = np.frombuffer(frame_data, np.uint8)
-    frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-    ret, buffer = cv2.imencode('.jpg', frame)
-    if not ret:
+async def process_frame(frame_data, client: AsyncVisionClient, prompt: str = PROMPT, timeout: float = None):
+    loop = asyncio.get_running_loop()
+    key = await loop.run_in_executor(None, frame_key, frame_data, prompt)
+    if key is None:
         return "Error encoding frame."
 
-    base64_image = base64.b64encode(buffer).decode('utf-8')
-
-    headers = {
-        'Authorization': f'Bearer {OPENAI_API_KEY}',
-        'Content-Type': 'application/json'
-    }
-    data = {
-        'model': 'gpt-4-vision-preview',
-        'image': base64_image,
-        'detail': 'high'
-    }
-
-    response = requests.post('https://api.openai.com/v1/images', headers=headers, json=data)
-    
-    if response.status_code == 200:
-        return response.json().get('choices', [{}])[0].get('text', 'No response')
-    else:
-        return f"Error: {response.status_code}"
+    try:
+        # Concurrent uploads of the same scene and prompt share one upstream call
+        return await in_flight.do(key, prompt_frame, frame_data, client, prompt, timeout)
+    except VisionAPIError as e:
+        return f"Error: {e.status_code}"
+    except RateLimitTimeout as e:
+        return f"Error: {e}"
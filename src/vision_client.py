@@ -0,0 +1,96 @@
+import asyncio
+import json
+import os
+import time
+
+import httpx
+
+from metrics import observe_stage, timed
+from rate_limiter import RateLimiter
+from request_body import RequestBody, build_body
+
+# Configuration
+API_URL = os.getenv("OPENAI_API_URL", "https://api.openai.com/v1/chat/completions")
+VISION_MODEL = os.getenv("VISION_MODEL", "gpt-4-vision-preview")
+MAX_IN_FLIGHT = int(os.getenv("VISION_MAX_IN_FLIGHT", 32))
+REQUEST_TIMEOUT = float(os.getenv("VISION_REQUEST_TIMEOUT", 60))
+
+
+class VisionAPIError(Exception):
+    def __init__(self, status_code: int, message: str):
+        super().__init__(f"API request failed with status code {status_code}: {message}")
+        self.status_code = status_code
+        self.message = message
+
+
+# asyncio-native client for the chat completions endpoint. One instance holds a
+# pooled keep-alive HTTP/2 connection and caps the number of requests in flight.
+class AsyncVisionClient:
+    def __init__(self, api_key: str, api_url: str = API_URL, max_in_flight: int = MAX_IN_FLIGHT,
+                 timeout: float = REQUEST_TIMEOUT, http2: bool = True, limiter: RateLimiter = None):
+        self.api_key = api_key
+        self.limiter = limiter
+        self.api_url = api_url
+        self.timeout = timeout
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._client = httpx.AsyncClient(
+            http2=http2,
+            timeout=httpx.Timeout(timeout),
+            limits=httpx.Limits(max_connections=max_in_flight, max_keepalive_connections=max_in_flight),
+            headers={"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"},
+        )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def aclose(self):
+        await self._client.aclose()
+
+    # payload is a RequestBody or a plain dict
+    async def post(self, payload, timeout: float = None, tokens: int = 0) -> httpx.Response:
+        timeout = timeout or self.timeout
+        pre_serialized = isinstance(payload, RequestBody)
+        if self.limiter:
+            max_tokens = payload.max_tokens if pre_serialized else payload.get("max_tokens", 0)
+            await self.limiter.acquire_async(tokens=max_tokens + tokens)
+        with timed('serialize'):
+            # httpx's async client needs a single buffer, so the pieces are joined (one copy)
+            body = payload.join() if pre_serialized else json.dumps(payload).encode('utf-8')
+        async with self._semaphore:
+            self.in_flight += 1
+            started = time.perf_counter()
+            try:
+                # wait_for cancels the underlying request if the deadline passes,
+                # and a cancelled caller task cancels the request the same way
+                response = await asyncio.wait_for(self._client.post(self.api_url, content=body), timeout)
+            finally:
+                self.in_flight -= 1
+                observe_stage('api', time.perf_counter() - started)
+        if self.limiter:
+            self.limiter.update_from_headers(response.headers)
+            if response.status_code == 429:
+                self.limiter.penalize(self.limiter.retry_after(response.headers) or 1)
+        return response
+
+    async def complete(self, payload, timeout: float = None, tokens: int = 0) -> str:
+        response = await self.post(payload, timeout=timeout, tokens=tokens)
+        if response.status_code != 200:
+            raise VisionAPIError(response.status_code, response.text)
+        response_json = response.json()
+        if 'error' in response_json:
+            raise VisionAPIError(response.status_code, response_json['error']['message'])
+        return response_json['choices'][0]['message']['content']
+
+    async def prompt_image(self, image_base64, prompt: str, max_tokens: int = 300,
+                           timeout: float = None, image_tokens: int = 0) -> str:
+        return await self.complete(compose_payload(image_base64, prompt, max_tokens), timeout=timeout,
+                                   tokens=image_tokens)
+
+
+def compose_payload(image_base64, prompt: str, max_tokens: int = 300) -> RequestBody:
+    return build_body(VISION_MODEL, prompt, [image_base64], max_tokens)
@@ -1,12 +1,19 @@
-import base64
+import logging
 import os
-import uuid
+import time
 
 import cv2
 import gradio as gr
 import numpy as np
 import requests
 
+from frame_encoder import ENCODER_MAX_TOKENS, EncodedFrame, encode_frame
+from image_cache import ImageCache
+from metrics import observe_stage
+from rate_limiter import get_limiter
+from request_body import RequestBody, build_body
+from response_cache import ResponseCache, cache_key
+
 MARKDOWN = """
 # WebcamGPT 💬 + 📸
 
@@ -20,7 +27,12 @@ AVATARS = (
     "https://media.roboflow.com/spaces/openai-white-logomark.png"
 )
 IMAGE_CACHE_DIRECTORY = "data"
-API_URL = "https://api.openai.com/v1/chat/completions"
+API_URL = os.getenv("OPENAI_API_URL", "https://api.openai.com/v1/chat/completions")
+MODEL = "gpt-4-vision-preview"
+MAX_TOKENS = 300
+
+response_cache = ResponseCache()
+image_cache = ImageCache(IMAGE_CACHE_DIRECTORY)
 
 
 def preprocess_image(image: np.ndarray) -> np.ndarray:
@@ -30,37 +42,15 @@ def preprocess_image(image: np.ndarray) -> np.ndarray:
     return cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
 
 
-def encode_image_to_base64(image: np.ndarray) -> str:
-    success, buffer = cv2.imencode('.jpg', image)
-    if not success:
-        raise ValueError("Could not encode image to JPEG format.")
-
-    encoded_image = base64.b64encode(buffer).decode('utf-8')
-    return encoded_image
+def encode_image_to_base64(image: np.ndarray) -> EncodedFrame:
+    encoded = encode_frame(image)
+    logging.debug(f"Encoded {encoded.width}x{encoded.height} q{encoded.quality}: "
+                  f"{encoded.nbytes} bytes, ~{encoded.estimated_tokens} tokens")
+    return encoded
 
 
-def compose_payload(image_base64: str, prompt: str) -> dict:
-    return {
-        "model": "gpt-4-vision-preview",
-        "messages": [
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": prompt
-                    },
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/jpeg;base64,{image_base64}"
-                        }
-                    }
-                ]
-            }
-        ],
-        "max_tokens": 300
-    }
+def compose_payload(image_base64, prompt: str) -> RequestBody:
+    return build_body(MODEL, prompt, [image_base64], MAX_TOKENS)
 
 
 def compose_headers(api_key: str) -> dict:
@@ -70,11 +60,17 @@ def compose_headers(api_key: str) -> dict:
     }
 
 
-def prompt_image(api_key: str, image_base64: str, prompt: str) -> str:
+def prompt_image(api_key: str, image_base64, prompt: str, image_tokens: int = ENCODER_MAX_TOKENS) -> str:
     headers = compose_headers(api_key=api_key)
     payload = compose_payload(image_base64=image_base64, prompt=prompt)
-    print("Payload:", payload)  # Debug: Print the payload
-    response = requests.post(url=API_URL, headers=headers, json=payload)
+    limiter = get_limiter()
+    limiter.acquire(tokens=MAX_TOKENS + image_tokens)
+    started = time.perf_counter()
+    response = requests.post(url=API_URL, headers=headers, data=payload)
+    observe_stage('api', time.perf_counter() - started)
+    limiter.update_from_headers(response.headers)
+    if response.status_code == 429:
+        limiter.penalize(limiter.retry_after(response.headers) or 1)
     print("Response:", response.text)  # Debug: Print the response text
 
     response_json = response.json()
@@ -83,12 +79,9 @@ def prompt_image(api_key: str, image_base64: str, prompt: str) -> str:
     return response_json['choices'][0]['message']['content']
 
 
-def cache_image(image: np.ndarray) -> str:
-    image_filename = f"{uuid.uuid4()}.jpeg"
-    os.makedirs(IMAGE_CACHE_DIRECTORY, exist_ok=True)
-    image_path = os.path.join(IMAGE_CACHE_DIRECTORY, image_filename)
-    cv2.imwrite(image_path, image)
-    return image_path
+# Function to store the already-encoded JPEG; the write happens in the background
+def cache_image(encoded: EncodedFrame) -> str:
+    return image_cache.put(encoded.jpeg)
 
 
 def respond(image: np.ndarray, prompt: str, chat_history):
@@ -104,9 +97,18 @@ def respond(image: np.ndarray, prompt: str, chat_history):
 
     try:
         image = preprocess_image(image=image)
-        cached_image_path = cache_image(image)
-        image_base64 = encode_image_to_base64(image)
-        response = prompt_image(api_key=api_key, image_base64=image_base64, prompt=prompt)
+        encoded = encode_image_to_base64(image)
+        cached_image_path = cache_image(encoded)
+        key = cache_key(image, prompt, MODEL, MAX_TOKENS)
+        response = response_cache.get(key)
+        if response is None:
+            response = prompt_image(api_key=api_key, image_base64=encoded.base64_bytes, prompt=prompt,
+                                    image_tokens=encoded.estimated_tokens)
+            response_cache.set(key, response)
+        logging.debug(f"Response cache: {response_cache.stats()}")
+        logging.debug(f"Image cache: {image_cache.stats()}")
+        # The chatbot reads the file as soon as we return
+        image_cache.wait(cached_image_path)
         chat_history.append(((cached_image_path,), None))
         chat_history.append((prompt, response))
         return "", chat_history
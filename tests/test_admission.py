@@ -0,0 +1,83 @@
+import asyncio
+
+from admission import AdmissionController, AdmissionRejected
+
+
+async def handle(controller: AdmissionController, client: str, hold: float = 0.01):
+    try:
+        async with controller.admit(client):
+            await asyncio.sleep(hold)
+        return 200
+    except AdmissionRejected as e:
+        return (e.status_code, e.reason)
+
+
+def test_burst_beyond_slots_and_queue_is_shed():
+    async def burst():
+        controller = AdmissionController(max_concurrent=2, max_queue=2, per_client=100, deadline=10)
+        results = await asyncio.gather(*(handle(controller, f"client-{i}") for i in range(20)))
+        return controller, results
+
+    controller, results = asyncio.run(burst())
+    assert results.count(200) == 4
+    assert results.count((503, "queue_full")) == 16
+    assert (controller.active, controller.waiting) == (0, 0)
+
+
+def test_client_over_its_share_gets_429():
+    async def burst():
+        controller = AdmissionController(max_concurrent=8, max_queue=8, per_client=2, deadline=10)
+        return await asyncio.gather(*(handle(controller, "greedy") for _ in range(4)))
+
+    results = asyncio.run(burst())
+    assert results.count(200) == 2
+    assert results.count((429, "client_limit")) == 2
+
+
+def test_queued_request_times_out_at_the_deadline():
+    async def burst():
+        controller = AdmissionController(max_concurrent=1, max_queue=4, per_client=100, deadline=0.05)
+        results = await asyncio.gather(handle(controller, "a", hold=0.2), handle(controller, "b"))
+        return controller, results
+
+    controller, results = asyncio.run(burst())
+    assert results == [200, (503, "deadline")]
+    assert (controller.active, controller.waiting) == (0, 0)
+
+
+def test_cancelled_waiters_do_not_leak_slots():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=2, max_queue=10, per_client=100, deadline=10)
+        tasks = [asyncio.ensure_future(handle(controller, f"client-{i}", hold=0.05)) for i in range(6)]
+        await asyncio.sleep(0.01)
+        for task in tasks[2:]:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        # Full capacity is available again
+        results = await asyncio.gather(*(handle(controller, f"again-{i}") for i in range(4)))
+        return controller, results
+
+    controller, results = asyncio.run(scenario())
+    assert results == [200] * 4
+    assert (controller.active, controller.waiting) == (0, 0)
+
+
+def test_slots_go_to_waiters_in_arrival_order():
+    order = []
+
+    async def record(controller: AdmissionController, name: str):
+        async with controller.admit(name):
+            order.append(name)
+            await asyncio.sleep(0.01)
+
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queue=10, per_client=100, deadline=10)
+        await asyncio.gather(*(record(controller, str(i)) for i in range(5)))
+
+    asyncio.run(scenario())
+    assert order == ["0", "1", "2", "3", "4"]
+
+
+def test_retry_after_is_at_least_one_second():
+    assert AdmissionRejected(503, "deadline", 0.2).retry_after == 1
+    assert AdmissionRejected(503, "deadline", 2.5).retry_after == 3
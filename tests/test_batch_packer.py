@@ -0,0 +1,108 @@
+import base64
+import datetime
+import json
+
+import numpy as np
+
+from batch_packer import pack_chunk, rank_by_diversity, send_batch
+from frame_encoder import EncodedFrame
+from rate_limiter import RateLimitTimeout
+
+
+# Frames with distinct left/right brightness patterns so their perceptual hashes differ
+def pattern(seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return (rng.integers(0, 2, (8, 8, 1)) * 255).repeat(8, 0).repeat(8, 1).repeat(3, 2).astype(np.uint8)
+
+
+def fake_encoder(nbytes: int = 100, tokens: int = 85):
+    def encode(frame) -> EncodedFrame:
+        jpeg = frame.tobytes()[:nbytes].ljust(nbytes, b"\0")
+        return EncodedFrame(jpeg, base64.b64encode(jpeg), frame.shape[1], frame.shape[0], 80, 1.0, tokens)
+    return encode
+
+
+def test_rank_by_diversity_picks_the_farthest_frame_next():
+    hashes = [0b0000, 0b0001, 0b1111, 0b0011]
+    assert rank_by_diversity(hashes) == [0, 2, 3, 1]
+
+
+def test_rank_by_diversity_leaves_out_duplicates():
+    assert rank_by_diversity([5, 5, 7, 7]) == [0, 2]
+    assert rank_by_diversity([]) == []
+
+
+def test_pack_chunk_keeps_chronological_order_of_distinct_frames():
+    frames = [pattern(0), pattern(0), pattern(1), pattern(2), pattern(1)]
+    batch = pack_chunk(frames, encoder=fake_encoder())
+    assert batch.indices == [0, 2, 3]
+    images = [part for part in json.loads(batch.payload.join())["messages"][0]["content"]
+              if part["type"] == "image_url"]
+    assert len(images) == 3
+
+
+def test_pack_chunk_respects_the_image_and_token_budgets():
+    frames = [pattern(seed) for seed in range(8)]
+    assert len(pack_chunk(frames, max_images=3, encoder=fake_encoder()).indices) == 3
+    batch = pack_chunk(frames, max_tokens=200, encoder=fake_encoder(tokens=85))
+    assert len(batch.indices) == 2
+    assert batch.estimated_tokens == 170
+    # The first frame always goes in, even over budget
+    assert len(pack_chunk(frames, max_bytes=10, encoder=fake_encoder(nbytes=100)).indices) == 1
+
+
+def test_pack_chunk_uses_prefetched_encodes():
+    frames = [pattern(seed) for seed in range(4)]
+    encoded = []
+
+    def encode_many(batch):
+        encoded.append(len(batch))
+        return [fake_encoder()(frame) for frame in batch]
+
+    def never(frame):
+        raise AssertionError("candidate should have been prefetched")
+
+    batch = pack_chunk(frames, max_images=4, encoder=never, encode_many=encode_many)
+    assert encoded == [4]
+    assert len(batch.indices) == 4
+
+
+class FakePool:
+    def __init__(self, response=None, error: Exception = None):
+        self.response = response
+        self.error = error
+        self.calls = []
+
+    def post(self, body, api_key, tokens: int = 0, timeout: float = None):
+        self.calls.append((api_key, tokens, timeout))
+        if self.error:
+            raise self.error
+        return self.response
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, body: dict):
+        self.status_code = status_code
+        self.text = json.dumps(body)
+        self.elapsed = datetime.timedelta(seconds=0.5)
+        self._body = body
+
+    def json(self) -> dict:
+        return self._body
+
+
+def test_send_batch_returns_the_response_and_usage():
+    batch = pack_chunk([pattern(0), pattern(1)], encoder=fake_encoder())
+    pool = FakePool(FakeResponse(200, {"choices": [{"message": {"content": "two frames"}}],
+                                       "usage": {"total_tokens": 500}}))
+    result = send_batch(batch, "key", pool=pool, timeout=5)
+    assert (result.response, result.usage, result.latency) == ("two frames", {"total_tokens": 500}, 0.5)
+    assert pool.calls == [("key", batch.estimated_tokens, 5)]
+
+
+def test_send_batch_reports_failures_as_errors():
+    batch = pack_chunk([pattern(0)], encoder=fake_encoder())
+    result = send_batch(batch, "key", pool=FakePool(FakeResponse(500, {"error": "boom"})))
+    assert result.response is None and "500" in result.error
+    result = send_batch(batch, "key", pool=FakePool(error=RateLimitTimeout("no budget")))
+    assert result.error == "no budget"
@@ -0,0 +1,66 @@
+import logging
+
+import cv2
+import numpy as np
+import pytest
+
+from capture import CaptureEngine
+
+
+@pytest.fixture
+def clip(tmp_path):
+    # 2 seconds at 25 fps, each frame a different shade so frames can be told apart
+    path = str(tmp_path / "clip.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 25, (64, 48))
+    for i in range(50):
+        writer.write(np.full((48, 64, 3), i * 5, dtype=np.uint8))
+    writer.release()
+    return path
+
+
+def test_file_is_sampled_by_stream_timestamps(clip):
+    engine = CaptureEngine(clip, fps=5)
+    timestamps = [timestamp for _, timestamp in engine.frames()]
+    # Every frame is grabbed, but only one in five is decoded
+    assert engine.grabbed == 50
+    assert engine.decoded == len(timestamps) == pytest.approx(10, abs=1)
+    assert engine.decoded + engine.skipped == engine.grabbed
+    gaps = np.diff(timestamps)
+    assert gaps == pytest.approx(0.2, abs=0.05)
+
+
+def test_sampling_rate_can_change_mid_stream(clip):
+    engine = CaptureEngine(clip, fps=1)
+    for count, _ in enumerate(engine.frames(), start=1):
+        if count == 1:
+            engine.fps = 25
+    # The slot already scheduled at 1s stands; every frame after it is decoded
+    assert engine.decoded == pytest.approx(26, abs=1)
+
+
+def test_end_of_file_is_not_an_error(clip, caplog):
+    engine = CaptureEngine(clip, fps=5)
+    with caplog.at_level(logging.INFO):
+        list(engine.frames())
+    assert not [record for record in caplog.records if record.levelno >= logging.ERROR]
+    assert any("end of" in record.getMessage() for record in caplog.records)
+    assert engine.cap is None
+
+
+def test_stop_ends_the_loop(clip):
+    engine = CaptureEngine(clip, fps=25)
+    for _ in engine.frames():
+        engine.stop()
+    assert engine.decoded == 1
+
+
+def test_monotonic_clock_is_rejected_for_files(clip):
+    assert not CaptureEngine(clip, fps=1).live
+    with pytest.raises(ValueError):
+        CaptureEngine(clip, fps=1, clock="monotonic")
+    assert CaptureEngine("rtsp://camera.local/stream", fps=1, clock="monotonic").live
+
+
+def test_unknown_clock_is_rejected():
+    with pytest.raises(ValueError):
+        CaptureEngine("rtsp://camera.local/stream", fps=1, clock="sundial")
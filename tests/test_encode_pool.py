@@ -0,0 +1,58 @@
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from encode_pool import EncodePool
+
+
+@pytest.fixture
+def pool():
+    pool = EncodePool(workers=2, slots=2)
+    yield pool
+    pool.close()
+
+
+# Function to read stats once every finished encode's callback has run; callbacks
+# fire just after result() returns, so the counts can trail for a moment
+def settled_stats(pool: EncodePool, frames: int) -> dict:
+    deadline = time.monotonic() + 5
+    while pool.stats()['frames'] < frames and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return pool.stats()
+
+
+def frame(width: int, height: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return cv2.GaussianBlur(rng.integers(0, 255, (height, width, 3), dtype=np.uint8), (9, 9), 0)
+
+
+def test_encodes_in_worker_processes(pool):
+    encoded = pool.encode(frame(320, 240))
+    decoded = cv2.imdecode(np.frombuffer(encoded.jpeg, np.uint8), cv2.IMREAD_COLOR)
+    assert decoded.shape == (240, 320, 3)
+    assert pool.slot_bytes == 320 * 240 * 3
+    assert settled_stats(pool, 1)['frames'] == 1
+
+
+def test_more_frames_than_slots_reuse_the_ring(pool):
+    frames = [frame(160, 120, seed) for seed in range(7)]
+    results = pool.encode_many(frames)
+    assert [(r.width, r.height) for r in results] == [(160, 120)] * 7
+    # Each frame's own pixels were encoded, not a neighbour's slot contents
+    for original, result in zip(frames, results):
+        decoded = cv2.imdecode(np.frombuffer(result.jpeg, np.uint8), cv2.IMREAD_COLOR)
+        assert np.abs(decoded.astype(int) - original).mean() < 10
+    stats = settled_stats(pool, 7)
+    assert stats['frames'] == 7
+    assert stats['free_slots'] == 2
+
+
+def test_larger_frames_than_a_slot_encode_in_process(pool):
+    pool.encode(frame(160, 120))
+    settled_stats(pool, 1)
+    encoded = pool.encode(frame(320, 240))
+    assert (encoded.width, encoded.height) == (320, 240)
+    # Handled outside the ring, so not counted in the worker timings
+    assert pool.stats()['frames'] == 1
@@ -0,0 +1,64 @@
+import threading
+from queue import Empty
+
+import pytest
+
+from frame_buffer import FrameBuffer
+
+
+def drain(buffer: FrameBuffer) -> list:
+    frames = []
+    while buffer.qsize():
+        frames.append(buffer.get(timeout=0)[0])
+    return frames
+
+
+def test_drop_oldest_keeps_the_newest_frames():
+    buffer = FrameBuffer(maxsize=3, policy="drop_oldest")
+    for i in range(10):
+        buffer.put(i)
+    assert drain(buffer) == [7, 8, 9]
+    assert buffer.stats()['frames_dropped'] == 7
+
+
+def test_latest_only_keeps_a_single_frame():
+    buffer = FrameBuffer(maxsize=30, policy="latest_only")
+    for i in range(5):
+        buffer.put(i)
+    assert drain(buffer) == [4]
+
+
+def test_every_nth_admits_one_in_n_while_full():
+    buffer = FrameBuffer(maxsize=2, policy="every_nth", nth=3)
+    for i in range(8):
+        buffer.put(i)
+    # 0 and 1 fill the buffer; of the overflow 2-7 only every third (4 and 7) gets in
+    assert drain(buffer) == [4, 7]
+    assert buffer.stats()['frames_dropped'] == 6
+
+
+def test_get_times_out_when_empty():
+    with pytest.raises(Empty):
+        FrameBuffer(maxsize=2).get(timeout=0.01)
+
+
+def test_get_reports_frame_age():
+    buffer = FrameBuffer(maxsize=2)
+    buffer.put("frame", timestamp=0.0)
+    frame, age = buffer.get(timeout=0)
+    assert frame == "frame"
+    assert age > 0
+    assert buffer.stats()['max_age'] == age
+
+
+def test_get_wakes_when_a_frame_arrives():
+    buffer = FrameBuffer(maxsize=2)
+    timer = threading.Timer(0.05, buffer.put, args=("late",))
+    timer.start()
+    assert buffer.get(timeout=5)[0] == "late"
+    timer.join()
+
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        FrameBuffer(policy="drop_newest")
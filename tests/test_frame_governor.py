@@ -0,0 +1,90 @@
+import types
+
+import pytest
+
+from frame_governor import MAX_STEP_UP, FrameRateGovernor
+
+
+def make_governor(clock, fps: float = 1.0, **kwargs) -> FrameRateGovernor:
+    options = dict(min_fps=0.1, max_fps=2.0, tokens_per_hour=0, target_latency=5, min_headroom=0.2, interval=5)
+    options.update(kwargs)
+    return FrameRateGovernor(fps, "test", clock=clock, **options)
+
+
+def step(governor: FrameRateGovernor, clock, frames: int = 5, changed: bool = True) -> float:
+    for _ in range(frames):
+        governor.observe(changed)
+    clock.advance(governor.interval)
+    return governor.update()
+
+
+def test_rate_holds_between_intervals(clock):
+    governor = make_governor(clock, fps=0.5)
+    governor.observe(True)
+    clock.advance(governor.interval / 2)
+    assert governor.update() == 0.5
+    assert governor.reason == "initial"
+
+
+def test_rate_rises_at_most_one_step_per_interval(clock):
+    governor = make_governor(clock, fps=0.2)
+    expected = 0.2
+    for _ in range(5):
+        expected *= MAX_STEP_UP
+        assert step(governor, clock) == pytest.approx(expected)
+        assert governor.reason == "activity"
+    # A full step would now overshoot, so the rate settles on what full activity asks for
+    assert step(governor, clock) == governor.max_fps
+    assert step(governor, clock) == governor.max_fps
+
+
+def test_rate_drops_at_once_when_the_scene_goes_quiet(clock):
+    governor = make_governor(clock, fps=2.0)
+    # Activity halves towards 0: the wanted rate is min_fps + (max_fps - min_fps) * 0.5
+    assert step(governor, clock, changed=False) == pytest.approx(1.05)
+    assert governor.activity == pytest.approx(0.5)
+
+
+def test_token_budget_caps_the_rate(clock):
+    # 50 tokens/s at 100 tokens per frame allows 0.5 frames/s
+    governor = make_governor(clock, tokens_per_hour=50 * 3600)
+    for _ in range(5):
+        governor.record(1.0, 100)
+    assert step(governor, clock) == pytest.approx(0.5)
+    assert governor.reason == "budget"
+
+
+def test_budget_never_pushes_below_min_fps(clock):
+    governor = make_governor(clock, tokens_per_hour=3600)
+    for _ in range(5):
+        governor.record(1.0, 1000)
+    assert step(governor, clock) == governor.min_fps
+    assert governor.reason == "bounds"
+
+
+def test_slow_responses_cap_the_rate(clock):
+    governor = make_governor(clock)
+    governor.record(10.0)
+    assert step(governor, clock) == pytest.approx(0.5)
+    assert governor.reason == "latency"
+
+
+def test_low_headroom_backs_off(clock):
+    governor = make_governor(clock, headroom=lambda: 0.05)
+    assert step(governor, clock) == pytest.approx(0.5)
+    assert governor.reason == "headroom"
+
+
+def test_rate_is_applied_to_the_engine(clock):
+    engine = types.SimpleNamespace(fps=None)
+    governor = make_governor(clock, fps=0.2, engine=engine)
+    assert engine.fps == 0.2
+    step(governor, clock)
+    assert engine.fps == pytest.approx(0.2 * MAX_STEP_UP)
+
+
+def test_invalid_bounds_are_rejected(clock):
+    with pytest.raises(ValueError):
+        make_governor(clock, min_fps=0)
+    with pytest.raises(ValueError):
+        make_governor(clock, min_fps=2, max_fps=1)
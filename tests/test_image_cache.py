@@ -0,0 +1,66 @@
+import os
+import time
+
+from image_cache import ImageCache
+
+
+# Function to wait for the background writer to delete a file
+def wait_removed(path: str, timeout: float = 5) -> bool:
+    deadline = time.monotonic() + timeout
+    while os.path.exists(path):
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_put_writes_the_file_named_by_content(tmp_path):
+    cache = ImageCache(str(tmp_path))
+    path = cache.put(b"jpeg-bytes")
+    assert path == cache.path_for(b"jpeg-bytes")
+    assert cache.wait(path)
+    with open(path, 'rb') as f:
+        assert f.read() == b"jpeg-bytes"
+
+
+def test_identical_frames_are_written_once(tmp_path):
+    cache = ImageCache(str(tmp_path))
+    first = cache.put(b"same")
+    second = cache.put(b"same")
+    assert first == second
+    assert cache.wait(first)
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['writes'] == 1
+
+
+def test_least_recently_used_files_are_evicted(tmp_path):
+    cache = ImageCache(str(tmp_path), max_bytes=20)
+    a = cache.put(b"a" * 10)
+    b = cache.put(b"b" * 10)
+    assert cache.wait(a) and cache.wait(b)
+    cache.put(b"a" * 10)  # a is now the most recent
+    c = cache.put(b"c" * 10)
+    assert cache.wait(c)
+    assert wait_removed(b)
+    assert os.path.exists(a) and os.path.exists(c)
+    assert cache.stats()['evictions'] == 1
+    assert cache.stats()['bytes'] == 20
+
+
+def test_file_evicted_before_its_write_is_removed(tmp_path):
+    cache = ImageCache(str(tmp_path), max_bytes=10)
+    paths = [cache.put(bytes([i]) * 10) for i in range(5)]
+    for path in paths:
+        assert cache.wait(path)
+    for path in paths[:-1]:
+        assert wait_removed(path)
+    assert os.listdir(str(tmp_path)) == [os.path.basename(paths[-1])]
+
+
+def test_files_from_a_previous_run_are_reused(tmp_path):
+    first = ImageCache(str(tmp_path))
+    path = first.put(b"kept")
+    assert first.wait(path)
+    reopened = ImageCache(str(tmp_path))
+    assert reopened.put(b"kept") == path
+    assert reopened.stats()['hits'] == 1
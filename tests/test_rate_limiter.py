@@ -0,0 +1,90 @@
+import pytest
+
+from rate_limiter import MemoryBackend, RateLimiter, parse_duration
+
+
+def make_limiter(clock, rpm: float = 60, tpm: float = 6000) -> RateLimiter:
+    return RateLimiter(rpm, tpm, MemoryBackend(), clock=clock)
+
+
+def test_parse_duration():
+    assert parse_duration("20ms") == pytest.approx(0.02)
+    assert parse_duration("6m0s") == 360
+    assert parse_duration("1h2m3.5s") == pytest.approx(3723.5)
+    assert parse_duration("") is None
+    assert parse_duration("soon") is None
+
+
+def test_buckets_refill_over_time(clock):
+    limiter = make_limiter(clock)
+    for _ in range(60):
+        assert limiter.try_acquire(10) == 0
+    assert limiter.try_acquire(10) == pytest.approx(1.0)
+    assert limiter.headroom() == 0
+
+    clock.advance(1)
+    assert limiter.try_acquire(10) == 0
+    assert limiter.try_acquire(10) > 0
+
+
+def test_token_bucket_reports_wait_for_missing_tokens(clock):
+    limiter = make_limiter(clock)
+    assert limiter.try_acquire(6000) == 0
+    # 3000 tokens refill at 100/s
+    assert limiter.try_acquire(3000) == pytest.approx(30.0)
+    clock.advance(30)
+    assert limiter.try_acquire(3000) == 0
+
+
+def test_limit_headers_size_the_buckets(clock):
+    limiter = make_limiter(clock)
+    limiter.update_from_headers({
+        'x-ratelimit-limit-requests': '600',
+        'x-ratelimit-limit-tokens': '60000',
+        'x-ratelimit-remaining-requests': '600',
+        'x-ratelimit-remaining-tokens': '60000',
+    })
+    # Larger than the configured tpm, but within the key's real tier
+    assert limiter.try_acquire(50000) == 0
+    assert limiter.try_acquire(20000) == pytest.approx(10.0)
+    # Refill follows the learned limit: 1000 tokens/s
+    clock.advance(10)
+    assert limiter.try_acquire(20000) == 0
+
+
+def test_remaining_headers_raise_the_level(clock):
+    limiter = make_limiter(clock)
+    assert limiter.try_acquire(6000) == 0
+    assert limiter.try_acquire(100) > 0
+    limiter.update_from_headers({'x-ratelimit-remaining-requests': '59', 'x-ratelimit-remaining-tokens': '5000'})
+    assert limiter.try_acquire(100) == 0
+
+
+def test_remaining_headers_lower_the_level(clock):
+    limiter = make_limiter(clock)
+    limiter.update_from_headers({'x-ratelimit-remaining-requests': '0', 'x-ratelimit-reset-requests': '2s'})
+    assert limiter.try_acquire() == pytest.approx(2.0)
+    assert limiter.headroom() == 0
+    clock.advance(2)
+    assert limiter.try_acquire() == 0
+
+
+def test_headers_without_rate_limit_fields_are_ignored(clock):
+    limiter = make_limiter(clock)
+    limiter.update_from_headers({'content-type': 'application/json'})
+    assert limiter.headroom() == 1.0
+
+
+def test_penalize_blocks_until_it_expires(clock):
+    limiter = make_limiter(clock)
+    limiter.penalize(5)
+    assert limiter.try_acquire() == pytest.approx(5.0)
+    clock.advance(5)
+    assert limiter.try_acquire() == 0
+
+
+def test_retry_after():
+    assert RateLimiter.retry_after({'retry-after': '3'}) == 3
+    assert RateLimiter.retry_after({'x-ratelimit-reset-requests': '1s',
+                                    'x-ratelimit-reset-tokens': '6m0s'}) == 360
+    assert RateLimiter.retry_after({}) is None
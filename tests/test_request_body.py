@@ -0,0 +1,45 @@
+import base64
+import json
+
+from request_body import DATA_URL_PREFIX, build_body
+
+
+def image_urls(body) -> list:
+    content = json.loads(body.join())["messages"][0]["content"]
+    return [part["image_url"]["url"] for part in content if part["type"] == "image_url"]
+
+
+def test_body_is_the_json_the_api_expects():
+    images = [base64.b64encode(b"first").decode(), base64.b64encode(b"second")]
+    body = build_body("gpt-4o", 'Describe "this" frame\n', images, max_tokens=100, stream=True)
+    decoded = json.loads(body.join())
+    assert decoded["model"] == "gpt-4o"
+    assert decoded["max_tokens"] == 100
+    assert decoded["stream"] is True
+    assert decoded["messages"][0]["content"][0] == {"type": "text", "text": 'Describe "this" frame\n'}
+    assert image_urls(body) == [DATA_URL_PREFIX + base64.b64encode(b"first").decode(),
+                                DATA_URL_PREFIX + base64.b64encode(b"second").decode()]
+
+
+def test_image_bytes_are_used_without_copying():
+    image = base64.b64encode(b"x" * 1000)
+    body = build_body("gpt-4o", "hello", [image])
+    assert any(part is image for part in body)
+    assert len(body) == len(body.join())
+
+
+def test_with_model_swaps_only_the_model():
+    image = base64.b64encode(b"frame").decode()
+    body = build_body("gpt-4o", "hello", [image])
+    assert body.with_model(None) is body
+    assert body.with_model("gpt-4o") is body
+    other = body.with_model("gpt-4o-mini")
+    assert json.loads(other.join())["model"] == "gpt-4o-mini"
+    assert image_urls(other) == image_urls(body)
+    assert other.max_tokens == body.max_tokens == 300
+
+
+def test_body_without_images():
+    body = build_body("gpt-4o", "just text")
+    assert image_urls(body) == []
+    assert "stream" not in json.loads(body.join())
@@ -0,0 +1,85 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from single_flight import AsyncSingleFlight, SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight("test")
+    release = threading.Event()
+    calls = []
+
+    def slow(value):
+        calls.append(value)
+        release.wait(5)
+        return value * 2
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        futures = [executor.submit(flight.do, "key", slow, 21) for _ in range(8)]
+        # Let every caller reach do() before the leader finishes
+        while flight.calls + flight.coalesced < 8:
+            time.sleep(0.001)
+        release.set()
+        results = [future.result() for future in futures]
+    assert results == [42] * 8
+    assert calls == [21]
+    assert flight.stats() == {'calls': 1, 'coalesced': 7, 'in_flight': 0}
+
+
+def test_exception_reaches_every_caller_and_is_not_kept():
+    flight = SingleFlight("test")
+
+    def fail():
+        raise ValueError("upstream failed")
+
+    with pytest.raises(ValueError):
+        flight.do("key", fail)
+    # Nothing is cached: the next call runs again
+    assert flight.do("key", lambda: "ok") == "ok"
+    assert flight.calls == 2
+
+
+def test_different_keys_do_not_coalesce():
+    flight = SingleFlight("test")
+    assert flight.do("a", lambda: 1) == 1
+    assert flight.do("b", lambda: 2) == 2
+    assert flight.coalesced == 0
+
+
+def test_async_callers_share_one_call():
+    calls = []
+
+    async def slow(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return value * 2
+
+    async def scenario():
+        flight = AsyncSingleFlight("test")
+        results = await asyncio.gather(*(flight.do("key", slow, 21) for _ in range(5)))
+        return flight, results
+
+    flight, results = asyncio.run(scenario())
+    assert results == [42] * 5
+    assert calls == [21]
+    assert flight.stats() == {'calls': 1, 'coalesced': 4, 'in_flight': 0}
+
+
+def test_async_cancelled_leader_does_not_cancel_followers():
+    async def slow():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    async def scenario():
+        flight = AsyncSingleFlight("test")
+        leader = asyncio.ensure_future(flight.do("key", slow))
+        follower = asyncio.ensure_future(flight.do("key", slow))
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await follower, leader.cancelled()
+
+    assert asyncio.run(scenario()) == ("done", True)
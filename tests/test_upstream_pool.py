@@ -0,0 +1,161 @@
+import datetime
+import time
+
+import pytest
+
+import upstream_pool
+from rate_limiter import RATE_LIMIT_DEADLINE, MemoryBackend, RateLimiter, RateLimitTimeout
+from request_body import build_body
+from upstream_pool import CIRCUIT_COOLDOWN, CIRCUIT_FAILURES, Upstream, UpstreamPool, UpstreamUnavailable
+
+
+def make_upstream(name: str, clock, api_key: str = None) -> Upstream:
+    return Upstream(name, f"http://{name}/v1/chat/completions", api_key,
+                    limiter=RateLimiter(backend=MemoryBackend(), clock=clock), clock=clock)
+
+
+def trip(upstream: Upstream):
+    for _ in range(CIRCUIT_FAILURES):
+        upstream.record_failure()
+
+
+class FakeResponse:
+    def __init__(self, status_code: int):
+        self.status_code = status_code
+        self.headers = {}
+        self.text = ""
+        self.elapsed = datetime.timedelta(seconds=0.1)
+
+    def close(self):
+        pass
+
+
+def test_circuit_opens_after_consecutive_failures(clock):
+    upstream = make_upstream("a", clock)
+    for _ in range(CIRCUIT_FAILURES - 1):
+        upstream.record_failure()
+    assert upstream.allow()
+    upstream.record_failure()
+    assert not upstream.allow()
+    assert upstream.stats()['circuit'] == 'open'
+
+
+def test_half_open_allows_a_single_trial(clock):
+    upstream = make_upstream("a", clock)
+    trip(upstream)
+    clock.advance(CIRCUIT_COOLDOWN)
+    assert upstream.allow()
+    assert not upstream.allow()
+
+    upstream.record_success(0.5)
+    assert upstream.allow()
+    assert upstream.stats()['circuit'] == 'closed'
+
+
+def test_failed_trial_doubles_the_cooldown(clock):
+    upstream = make_upstream("a", clock)
+    trip(upstream)
+    clock.advance(CIRCUIT_COOLDOWN)
+    assert upstream.allow()
+    upstream.record_failure()
+    assert upstream.cooldown == 2 * CIRCUIT_COOLDOWN
+
+    clock.advance(CIRCUIT_COOLDOWN)
+    assert not upstream.allow()
+    clock.advance(CIRCUIT_COOLDOWN)
+    assert upstream.allow()
+
+    # A successful trial closes the circuit and resets the cooldown
+    upstream.record_success(0.5)
+    assert upstream.cooldown == CIRCUIT_COOLDOWN
+
+
+def test_released_trial_can_be_claimed_again(clock):
+    upstream = make_upstream("a", clock)
+    trip(upstream)
+    clock.advance(CIRCUIT_COOLDOWN)
+    assert upstream.allow()
+    upstream.release()
+    assert upstream.allow()
+
+
+def test_single_upstream_never_opens_its_circuit(clock):
+    upstream = make_upstream("a", clock)
+    UpstreamPool([upstream], default_key="server-key")
+    trip(upstream)
+    assert upstream.allow()
+
+
+def test_pool_raises_when_every_circuit_is_open(clock):
+    upstreams = [make_upstream("a", clock), make_upstream("b", clock)]
+    pool = UpstreamPool(upstreams, default_key="server-key")
+    for upstream in upstreams:
+        trip(upstream)
+    with pytest.raises(UpstreamUnavailable):
+        pool.post(build_body("gpt-4o", "hello"))
+
+
+def test_pool_fails_over_to_a_healthy_upstream(clock, monkeypatch):
+    upstreams = [make_upstream("bad", clock), make_upstream("good", clock)]
+    pool = UpstreamPool(upstreams, default_key="server-key")
+    calls = []
+
+    def post(url, **kwargs):
+        calls.append(url)
+        return FakeResponse(500 if "bad" in url else 200)
+    monkeypatch.setattr(upstream_pool.requests, "post", post)
+    # Fix the weighted pick so the faster-looking failing upstream is always tried first
+    monkeypatch.setattr(upstream_pool.random, "random", lambda: 0.5)
+    upstreams[0].latency = 0.1
+
+    for _ in range(CIRCUIT_FAILURES + 2):
+        assert pool.post(build_body("gpt-4o", "hello")).status_code == 200
+    # Once its circuit opens the failing upstream stops getting attempts
+    assert calls.count(upstreams[0].url) == CIRCUIT_FAILURES
+    assert upstreams[0].stats()['circuit'] == 'open'
+
+
+def test_caller_key_only_goes_to_keyless_upstreams(clock, monkeypatch):
+    keyed, keyless = make_upstream("keyed", clock, "server-key"), make_upstream("keyless", clock)
+    pool = UpstreamPool([keyed, keyless], default_key="server-key")
+    sent = []
+
+    def post(url, headers, **kwargs):
+        sent.append((url, headers["Authorization"]))
+        return FakeResponse(200)
+    monkeypatch.setattr(upstream_pool.requests, "post", post)
+
+    for _ in range(5):
+        pool.post(build_body("gpt-4o", "hello"), api_key="caller-key")
+    assert set(sent) == {(keyless.url, "Bearer caller-key")}
+
+
+def test_caller_key_is_refused_when_every_upstream_has_a_key(clock):
+    pool = UpstreamPool([make_upstream("a", clock, "key-a"), make_upstream("b", clock, "key-b")],
+                        default_key="server-key")
+    with pytest.raises(ValueError):
+        pool.post(build_body("gpt-4o", "hello"), api_key="caller-key")
+
+
+def test_rejected_caller_key_does_not_count_against_the_upstream(clock, monkeypatch):
+    upstreams = [make_upstream("a", clock), make_upstream("b", clock)]
+    pool = UpstreamPool(upstreams, default_key="server-key")
+    monkeypatch.setattr(upstream_pool.requests, "post", lambda url, **kwargs: FakeResponse(401))
+
+    assert pool.post(build_body("gpt-4o", "hello"), api_key="caller-key").status_code == 401
+    assert all(upstream.failures == 0 for upstream in upstreams)
+
+
+def test_budget_timeout_reports_the_configured_deadline(clock):
+    upstream = make_upstream("a", clock)
+    pool = UpstreamPool([upstream], default_key="server-key")
+    upstream.limiter.penalize(RATE_LIMIT_DEADLINE + 60)
+    # A retry late in the caller's window still names the full deadline
+    with pytest.raises(RateLimitTimeout, match=f"within {RATE_LIMIT_DEADLINE:.0f}s"):
+        pool.post(build_body("gpt-4o", "hello"), deadline=time.time() + 1)
+
+
+def test_parse_wait_time():
+    assert upstream_pool.parse_wait_time("Please try again in 1m2.5s.") == pytest.approx(62.5)
+    assert upstream_pool.parse_wait_time("Please try again in 7.2s.") == pytest.approx(7.2)
+    assert upstream_pool.parse_wait_time("Slow down") is None
@@ -0,0 +1,91 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from rate_limiter import MemoryBackend, RateLimiter
+from vision_client import AsyncVisionClient, VisionAPIError, compose_payload
+
+
+def completion(text: str) -> dict:
+    return {"choices": [{"message": {"content": text}}]}
+
+
+# Function to create a client whose requests are answered by handler(request) after delay seconds
+def make_client(handler, delay: float = 0.0, **kwargs) -> AsyncVisionClient:
+    client = AsyncVisionClient("test-key", "http://vision.test/v1/chat/completions", http2=False, **kwargs)
+
+    async def respond(request):
+        await asyncio.sleep(delay)
+        return handler(request)
+    client._client = httpx.AsyncClient(transport=httpx.MockTransport(respond), headers=client._client.headers)
+    return client
+
+
+def test_prompt_image_sends_the_body_and_returns_the_text():
+    seen = []
+
+    def handler(request):
+        seen.append((request.headers["Authorization"], json.loads(request.content)))
+        return httpx.Response(200, json=completion("a desk"))
+
+    async def scenario():
+        async with make_client(handler) as client:
+            return await client.prompt_image("aGVsbG8=", "What is this?")
+
+    assert asyncio.run(scenario()) == "a desk"
+    authorization, body = seen[0]
+    assert authorization == "Bearer test-key"
+    assert body["messages"][0]["content"][1]["image_url"]["url"].endswith("aGVsbG8=")
+
+
+def test_requests_in_flight_are_capped():
+    peak = []
+
+    async def scenario():
+        async with make_client(lambda request: httpx.Response(200, json=completion("ok")), delay=0.02,
+                               max_in_flight=3) as client:
+            async def call():
+                task = asyncio.ensure_future(client.complete(compose_payload("aGVsbG8=", "hi")))
+                while not task.done():
+                    peak.append(client.in_flight)
+                    await asyncio.sleep(0.005)
+                return task.result()
+            return await asyncio.gather(*(call() for _ in range(10)))
+
+    assert asyncio.run(scenario()) == ["ok"] * 10
+    assert max(peak) == 3
+
+
+def test_api_errors_raise_vision_api_error():
+    async def scenario():
+        async with make_client(lambda request: httpx.Response(400, json={"error": {"message": "bad image"}})) as client:
+            await client.complete(compose_payload("aGVsbG8=", "hi"))
+
+    with pytest.raises(VisionAPIError) as raised:
+        asyncio.run(scenario())
+    assert raised.value.status_code == 400
+
+
+def test_slow_requests_time_out():
+    async def scenario():
+        async with make_client(lambda request: httpx.Response(200, json=completion("late")), delay=1) as client:
+            await client.complete(compose_payload("aGVsbG8=", "hi"), timeout=0.05)
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(scenario())
+
+
+def test_throttled_responses_penalize_the_limiter():
+    limiter = RateLimiter(backend=MemoryBackend())
+
+    def handler(request):
+        return httpx.Response(429, headers={"retry-after": "20"}, json={"error": {"message": "slow down"}})
+
+    async def scenario():
+        async with make_client(handler, limiter=limiter) as client:
+            await client.post(compose_payload("aGVsbG8=", "hi"))
+
+    asyncio.run(scenario())
+    assert limiter.try_acquire() == pytest.approx(20, abs=1)